@@ -17,38 +17,31 @@ def make_cases():
     to run a single case.  See that code for more documentation.
     """
 
-    caselist = []
+    # parameters common to all cases:
+    base_case = {}
 
-    for mx in [50,100,200]:
-        for order in [1,2]:
-            case = {}
-            case_name = 'order%s_mx%s' % (order, str(mx).zfill(4))
-            case['case_name'] = case_name
+    #base_case['xclawcmd'] = None  # if None, will not run code
+    base_case['xclawcmd'] = 'xclaw'  # executable created by 'make .exe'
 
-            case['outdir'] = '_output_%s' % case_name
+    # setrun parameters:
+    base_case['setrun_file'] = 'setrun_case.py'
 
-            #case['xclawcmd'] = None  # if None, will not run code
-            case['xclawcmd'] = 'xclaw'  # executable created by 'make .exe'
+    # setrun_case.py should contain a setrun function with case
+    # as a keyword argument so we can pass in the values of order and mx
 
-            # setrun parameters:
-            case['setrun_file'] = 'setrun_case.py'
+    base_case['setplot_file'] = 'setplot_case.py'
 
-            # setrun_case.py should contain a setrun function with case
-            # as a keyword argument so we can pass in the following values:
+    # setplot_case.py should contain a setplot function with case
+    # as a keyword argument so we can pass in the parameters,
+    # so that outdir and case_name can be used in the title of figures
 
-            case['order'] = order
-            case['mx'] = mx
-
-            #case['plotdir'] = None  # if None, will not make plots
-            case['plotdir'] = '_plots_%s' % case_name
-
-            case['setplot_file'] = 'setplot_case.py'
-
-            # setplot_case.py should contain a setplot function with case
-            # as a keyword argument so we can pass in the parameters,
-            # so that outdir and case_name can be used in the title of figures
-
-            caselist.append(case)
+    # one case for each combination of order and mx, with
+    # case['outdir'] = '_output_' + case_name and
+    # case['plotdir'] = '_plots_' + case_name (use plotdir=None for no plots):
+    caselist = multip_tools.factorial_cases({'mx': [50,100,200],
+                                             'order': [1,2]},
+                                            base=base_case,
+                                            name='order{order}_mx{mx:04d}')
 
     return caselist
 
@@ -60,6 +53,10 @@ if __name__ == '__main__':
 
     caselist = make_cases()
 
-    # run all cases using nprocs processors:
+    # run all cases using nprocs processors, starting the most expensive
+    # cases (largest mx) first:
     run_one_case = clawmultip_tools.run_one_case_clawpack
-    multip_tools.run_many_cases_pool(caselist, nprocs, run_one_case)
+    multip_tools.run_many_cases_pool(caselist, nprocs, run_one_case,
+                                 cost=clawmultip_tools.case_cost_clawpack,
+                                 summary_file='sweep_summary.txt',
+                                 records_file='sweep_records.jsonl')
@@ -0,0 +1,306 @@
+r"""
+Building Clawpack example executables with ``make``.
+
+:func:`run_make` runs an example ``Makefile`` with given compiler flags and
+:class:`ExecutableRegistry` keeps one executable per set of build options,
+so that many regression tests or the cases of a parameter sweep can share
+an executable instead of each compiling their own.  Both are used by
+:mod:`clawpack.clawutil.test` and :mod:`clawpack.clawutil.clawmultip_tools`.
+
+Builds share the library object files that ``Makefile.common`` compiles next
+to the library sources in ``$CLAW``, so all builds are serialized across
+threads and processes.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from clawpack.clawutil.util import wait_max_rss
+
+
+__all__ = ["run_make", "ExecutableRegistry", "executable_registry"]
+
+
+# Builds share the library object files that Makefile.common places next to
+# the library sources, so only one ``make`` may run at a time, see _build_lock
+_build_thread_lock = threading.RLock()
+_build_lock_state = {"depth": 0, "file": None}
+
+
+@contextmanager
+def _build_lock():
+    r"""
+    Serialize ``make`` invocations across threads and processes.
+
+    ``Makefile.common`` compiles library sources into object files next to
+    the sources in ``$CLAW``, so two concurrent builds, e.g. by
+    ``pytest-xdist`` workers, can overwrite each other's object files.  The
+    lock file is therefore placed in ``$CLAW`` and falls back to the
+    temporary directory if ``$CLAW`` is not set or not writable.  The lock
+    is reentrant within a thread.  Where ``fcntl`` is not available only
+    threads of this process are serialized.
+    """
+    with _build_thread_lock:
+        if _build_lock_state["depth"] == 0:
+            _build_lock_state["file"] = _open_build_lock_file()
+        _build_lock_state["depth"] += 1
+        try:
+            yield
+        finally:
+            _build_lock_state["depth"] -= 1
+            if _build_lock_state["depth"] == 0 \
+                    and _build_lock_state["file"] is not None:
+                import fcntl
+                fcntl.flock(_build_lock_state["file"], fcntl.LOCK_UN)
+                _build_lock_state["file"].close()
+                _build_lock_state["file"] = None
+
+
+def _open_build_lock_file():
+    r"""
+    Open and lock the build lock file, see :func:`_build_lock`.
+
+    Returns None if ``fcntl`` is not available.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+
+    lock_name = ".clawpack_build.lock"
+    candidates = [Path(tempfile.gettempdir()) / lock_name]
+    if os.environ.get("CLAW"):
+        candidates.insert(0, Path(os.environ["CLAW"]) / lock_name)
+    for lock_path in candidates:
+        try:
+            lock_file = open(lock_path, "a")
+            break
+        except OSError:
+            # e.g. a read-only installation of Clawpack
+            if lock_path == candidates[-1]:
+                raise
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def _build_env(FFLAGS: Optional[str]=None,
+               LFLAGS: Optional[str]=None) -> dict[str, str]:
+    r"""
+    Return the environment of a ``make`` call, see :func:`run_make`.
+
+    Empty ``FFLAGS`` and ``LFLAGS`` in the environment are dropped, the
+    arguments override the environment and ``LFLAGS`` defaults to
+    ``FFLAGS`` as in ``Makefile.common``.
+    """
+
+    def _normalize_make_flag(value: str, name: str) -> str:
+        prefix = f"{name}="
+        return value[len(prefix):] if value.startswith(prefix) else value
+
+    build_env = os.environ.copy()
+
+    for name in ("FFLAGS", "LFLAGS"):
+        if name in build_env and build_env[name].strip() == "":
+            del build_env[name]
+
+    if FFLAGS is not None:
+        build_env["FFLAGS"] = _normalize_make_flag(FFLAGS, "FFLAGS")
+    if LFLAGS is not None:
+        build_env["LFLAGS"] = _normalize_make_flag(LFLAGS, "LFLAGS")
+
+    # Preserve Makefile.common behavior:
+    if "FFLAGS" in build_env and "LFLAGS" not in build_env:
+        build_env["LFLAGS"] = build_env["FFLAGS"]
+
+    return build_env
+
+
+def run_make(example_path: Path, make_level: str='new',
+              FFLAGS: Optional[str]=None,
+              LFLAGS: Optional[str]=None,
+              verbose: bool=False,
+              make_vars: Optional[dict[str, str]]=None,
+              stdout=None, stderr=None,
+              rusage: Optional[dict]=None):
+    r"""
+    Run ``make`` in *example_path*.
+
+    Parameters
+    ----------
+    example_path : pathlib.Path
+        Directory containing the example ``Makefile``.
+    make_level : {"new", "default", "exe"}, default "new"
+        ``"new"`` runs ``make new``, rebuilding the library object files
+        with the given flags.  ``"default"`` removes the object files in
+        *example_path* and runs ``make .exe``, ``"exe"`` runs ``make .exe``.
+    FFLAGS, LFLAGS : str, optional
+        Compiler and linker flags.  If omitted, the environment values are
+        used, and ``LFLAGS`` defaults to ``FFLAGS``.
+    verbose : bool, default False
+        Print the command and flags.
+    make_vars : dict, optional
+        Additional ``make`` variables passed as ``NAME=value`` arguments.
+
+    The build holds :func:`_build_lock` and leaves the executable in
+    *example_path*.  *stdout* and *stderr* are passed to
+    ``subprocess.Popen``.  If *rusage* is a dict, its entry ``max_rss_kb``
+    is set to the peak memory use of ``make`` and the compiler, see
+    :func:`clawpack.clawutil.util.wait_max_rss`.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If the ``make`` command fails.
+    """
+
+    example_path = Path(example_path)
+    if make_level.lower() == "new":
+        make_target = "new"
+    elif make_level.lower() in ("default", "exe"):
+        make_target = ".exe"
+    else:
+        raise ValueError(f"Invalid make_level={make_level} given.")
+
+    cmd = ["make", make_target]
+    if make_vars:
+        for key, value in make_vars.items():
+            cmd.append(f"{key}={value}")
+
+    build_env = _build_env(FFLAGS, LFLAGS)
+
+    if verbose:
+        print("Build command:", " ".join(str(part) for part in cmd))
+        print("Build cwd:", example_path)
+        if "FFLAGS" in build_env:
+            print("Build env FFLAGS:", build_env["FFLAGS"])
+        if "LFLAGS" in build_env:
+            print("Build env LFLAGS:", build_env["LFLAGS"])
+
+    with _build_lock():
+        if make_level.lower() == "default":
+            # clean up *.o and *.mod files in test path only
+            for path in example_path.glob("*.o"):
+                path.unlink()
+            for path in example_path.glob("*.mod"):
+                path.unlink()
+        proc = subprocess.Popen(cmd, cwd=example_path, env=build_env,
+                                stdout=stdout, stderr=stderr)
+        max_rss_kb = wait_max_rss(proc)
+    if rusage is not None:
+        rusage["max_rss_kb"] = max_rss_kb
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+class ExecutableRegistry:
+    r"""
+    Cache of example executables built once and shared by many tests.
+
+    Parameters
+    ----------
+    cache_dir : pathlib.Path, optional
+        Directory holding the cached executables.  If omitted,
+        ``$CLAW_TEST_EXE_CACHE`` is used, and if that is not set a new
+        temporary directory that is removed by :meth:`close`.
+
+    Notes
+    -----
+    Executables are keyed by the example directory, ``make_level``, the
+    effective ``FFLAGS`` and ``LFLAGS`` (from the arguments or the
+    environment), ``make_vars`` and the executable name, and
+    stored as ``cache_dir/<key>/<executable_name>`` together with a
+    ``build.json`` file describing the build.  A directory given through
+    ``$CLAW_TEST_EXE_CACHE`` may be shared by several processes, e.g.
+    ``pytest-xdist`` workers, and is kept after the session, so it must be
+    cleared when the Fortran sources change.
+    """
+
+    def __init__(self, cache_dir: Optional[Path]=None):
+        self._owned = False
+        if cache_dir is None:
+            cache_dir = os.environ.get("CLAW_TEST_EXE_CACHE")
+        if cache_dir is None:
+            cache_dir = tempfile.mkdtemp(prefix="clawpack_executables_")
+            self._owned = True
+        self.cache_dir = Path(cache_dir)
+        self.executables = {}
+
+
+    def executable_for(self, example_path: Path, make_level: str='new',
+                             FFLAGS: Optional[str]=None,
+                             LFLAGS: Optional[str]=None,
+                             make_vars: Optional[dict[str, str]]=None,
+                             executable_name: str='xclaw',
+                             verbose: bool=False,
+                             stdout=None, stderr=None,
+                             rusage: Optional[dict]=None) -> Path:
+        r"""
+        Return the cached executable of an example, building it if needed.
+
+        Parameters are those of :func:`run_make`, and *executable_name* is
+        the name of the executable built by the ``Makefile``.
+        *stdout*, *stderr* and *rusage* are passed to ``make`` if a build is
+        needed, see :func:`run_make`.  The returned executable must not be
+        modified; runners link to it from their temporary directories.
+        """
+
+        example_path = Path(example_path).resolve()
+        build_env = _build_env(FFLAGS, LFLAGS)
+        config = {"example_path": str(example_path),
+                  "make_level": make_level.lower(),
+                  "FFLAGS": build_env.get("FFLAGS"),
+                  "LFLAGS": build_env.get("LFLAGS"),
+                  "make_vars": dict(sorted((make_vars or {}).items())),
+                  "executable_name": executable_name}
+        key = hashlib.sha1(json.dumps(config, sort_keys=True).encode()
+                           ).hexdigest()[:16]
+        if key in self.executables:
+            return self.executables[key]
+
+        entry = self.cache_dir / key
+        executable = entry / executable_name
+        with _build_lock():
+            if not executable.exists():
+                run_make(example_path, make_level, FFLAGS=FFLAGS,
+                          LFLAGS=LFLAGS, verbose=verbose, make_vars=make_vars,
+                          stdout=stdout, stderr=stderr, rusage=rusage)
+                entry.mkdir(parents=True, exist_ok=True)
+                shutil.move(example_path / executable_name, executable)
+                (entry / "build.json").write_text(json.dumps(config,
+                                                             indent=1))
+        self.executables[key] = executable
+        return executable
+
+
+    def close(self):
+        r"""Forget cached executables, removing them if the cache is owned."""
+        self.executables.clear()
+        if self._owned:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+_executable_registry = None
+
+
+def executable_registry() -> ExecutableRegistry:
+    r"""
+    Return the executable registry of this session, creating it if needed.
+
+    The registry is closed when the interpreter exits.
+    """
+    global _executable_registry
+    if _executable_registry is None:
+        _executable_registry = ExecutableRegistry()
+        atexit.register(_executable_registry.close)
+    return _executable_registry
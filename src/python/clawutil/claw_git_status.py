@@ -18,7 +18,38 @@ else:
 repos_list = ['', 'classic', 'amrclaw', 'clawutil', 'pyclaw', 'visclaw', 'riemann',
               'geoclaw']
 
-def make_git_status_file(outdir=None):
+# Snapshots of the git status of all repositories, keyed by $CLAW
+_snapshots = {}
+
+
+def git_status_snapshot(refresh=False):
+    """
+    Return the git status and diffs of all clawpack repositories.
+
+    The result is computed once per Python session (per $CLAW) and reused on
+    later calls, since each computation runs several git commands in every
+    repository.  Set *refresh* to True to recompute it.
+
+    Returns a dictionary with keys:
+        'time'   - time the snapshot was taken
+        'status' - output of repository_status for all repositories
+        'diffs'  - output of repository_diff for all repositories
+    """
+
+    if 'CLAW' not in os.environ:
+        raise ValueError("*** CLAW environment variable not set ***")
+
+    claw = os.environ['CLAW']
+    if refresh or claw not in _snapshots:
+        _snapshots[claw] = {
+            'time': time.strftime("%a, %d %b %Y %H:%M:%S %Z\n"),
+            'status': "".join(repository_status(repos)
+                              for repos in repos_list),
+            'diffs': "".join(repository_diff(repos) for repos in repos_list)}
+    return _snapshots[claw]
+
+
+def make_git_status_file(outdir=None, cached=False):
     """
     Print status of all clawpack git repositories.
     Creates 2 files:
@@ -27,11 +58,14 @@ def make_git_status_file(outdir=None):
             a short version of git status.
          outdir + '/claw_git_diffs.txt'
             contains all diffs between current working state and last commits.
+
+    If *cached* is True, reuse the snapshot returned by git_status_snapshot
+    rather than running git again.  This is useful when many files are
+    written in one session, e.g. when regenerating regression data.
         
     """
 
-    if 'CLAW' not in os.environ:
-        raise ValueError("*** CLAW environment variable not set ***")
+    snapshot = git_status_snapshot(refresh=not cached)
 
     if outdir is None:
         outdir = os.getcwd()
@@ -45,18 +79,15 @@ def make_git_status_file(outdir=None):
 
         status_file.write("Clawpack Git Status \n")
         status_file.write("Diffs can be found in %s\n\n" % diff_file_path)
-        status_file.write(time.strftime("%a, %d %b %Y %H:%M:%S %Z\n"))
+        status_file.write(snapshot['time'])
         # status_file.write(time.strftime("%c\n"))
         status_file.write("$CLAW = %s\n" % os.environ["CLAW"])
         status_file.write("$FC = %s\n" % os.environ.get("FC", "not set"))
-
-        for repos in repos_list:
-            status_file.write(repository_status(repos))
+        status_file.write(snapshot['status'])
 
     with open(diff_file_path, 'w') as diff_file:
         diff_file.write("Clawpack git diffs...")
-        for repos in repos_list:
-            diff_file.write(repository_diff(repos))
+        diff_file.write(snapshot['diffs'])
 
 
 def repository_status(repository):
@@ -5,14 +5,26 @@ in order to perform a parameter sweep using Clawpack.
 
 The function make_cases_template is a template for how to make a caselist
 of case dictionaries with some values required by run_one_case_clawpack.
+Caselists over a grid or a random design of parameters can also be made with
+multip_tools.factorial_cases, latin_hypercube_cases and sobol_cases.
+
+The function build_executables builds the executable once for each distinct
+set of compile options (FFLAGS, LFLAGS, make_vars) found in a caselist and
+points case['xclawcmd'] of every case to the matching executable.
+
+The function case_cost_clawpack estimates the relative cost of a case and
+can be passed as the *cost* argument of multip_tools.run_many_cases_pool so
+that the most expensive cases are started first.
 
 For sample code that uses this, see
     $CLAW/clawutil/examples/clawmultip_advection_1d_example
 and the README.txt file in that directory.
 """
 
+import os
 
-def run_one_case_clawpack(case):
+
+def run_one_case_clawpack(case, run=True, plot=True):
     """
     Code to run a specific case and/or plot the results using Clawpack.
     This function can be pased in to multip_tools.run_many_cases_pool
@@ -56,6 +68,12 @@ def run_one_case_clawpack(case):
 
     The following are optional to set:
 
+        case['xclawcmd_sha256'] = SHA-256 hash of the executable, as set by
+                                  build_executables.  If present, the run
+                                  is aborted if xclawcmd does not match.
+        case['FFLAGS'], case['LFLAGS'], case['make_vars'] = compile options
+                                  used by build_executables.
+
         case['overwrite'] = True/False.  (Default is True)
                             Aborts if this is False and case['outdir'] exists.
         case['runexe'] = Any string that must preceed xclawcmd to run the code
@@ -73,8 +91,16 @@ def run_one_case_clawpack(case):
         $CLAW/clawutil/examples/clawmultip_advection_1d_example
     and the README.txt file in that directory.
 
+    Setting `run` or `plot` to False skips running or plotting, see
+    run_case_clawpack and plot_case_clawpack, which can be used as the two
+    stages of multip_tools.run_many_cases_pool so that plotting one case
+    overlaps with running the next.
+
     This code also produces (or appends to) a file case_summary.txt
-    listing the case dictionary entries for all the cases run.
+    listing the case dictionary entries for all the cases run.  When run
+    with multip_tools.run_many_cases_pool and a records_file, the entries
+    of all the cases, with their status and run times, are also appended
+    to that file, see multip_tools.load_records.
 
     In addition, each _output directory will contain files
         case_info.txt
@@ -87,10 +113,8 @@ def run_one_case_clawpack(case):
             case = pickle.load(f)
     """
 
-    import os,sys,shutil,pickle
-    import inspect
+    import os,sys,shutil
     import datetime
-    import importlib
     from multiprocessing import current_process
     from clawpack.clawutil.runclaw import runclaw
     from clawpack.clawutil import multip_tools
@@ -101,14 +125,13 @@ def run_one_case_clawpack(case):
     # unpack the dictionary case to get parameters for this case:
 
     xclawcmd = case.get('xclawcmd', None)
-    run_clawpack = xclawcmd is not None
+    run_clawpack = run and xclawcmd is not None
 
     plotdir = case.get('plotdir', None)
-    make_plots = plotdir is not None
+    make_plots = plot and plotdir is not None
 
     case_name = case['case_name']
     outdir = case['outdir']
-    setrun_file = case.get('setrun_file', 'setrun.py')
     setplot_file = case.get('setplot_file', 'setplot.py')
 
     # clawpack.clawutil.runclaw parameters that might be specified:
@@ -140,7 +163,11 @@ def run_one_case_clawpack(case):
 
 
     if redirect_python:
-        stdout_fname = outdir + '/python_output.txt'
+        if run:
+            stdout_fname = outdir + '/python_output.txt'
+        else:
+            # plotting stage only, keep output of the run:
+            stdout_fname = outdir + '/python_plot_output.txt'
         try:
             stdout_file = open(stdout_fname, 'w')
             message = "Python output from this run will go to\n   %s\n" \
@@ -158,6 +185,107 @@ def run_one_case_clawpack(case):
         sys.stderr = stdout_file
         print(message)
 
+    try:
+        if run:
+            write_case_info(case, timenow)
+
+        if run_clawpack:
+
+            # initialize rundata using specified setrun file:
+            rundata = rundata_for_case(case)
+
+            # write .data files in outdir:
+            rundata.write(outdir)
+
+            # Run the clawpack executable
+            if not os.path.isfile(xclawcmd):
+                raise Exception('Executable %s not found' % xclawcmd)
+
+            expected_sha256 = case.get('xclawcmd_sha256', None)
+            if expected_sha256 is not None \
+                    and executable_sha256(xclawcmd) != expected_sha256:
+                raise Exception('Executable %s does not match the hash recorded '
+                                'by build_executables' % xclawcmd)
+
+            # redirect output and error messages:
+            outfile = os.path.join(outdir, 'fortran_output.txt')
+            print('Fortran output will be redirected to\n    ', outfile)
+
+            # Use data from rundir=outdir, which was just written above...
+            runclaw(xclawcmd=xclawcmd, outdir=outdir, overwrite=overwrite,
+                    rundir=outdir, nohup=nohup, runexe=runexe,
+                    xclawout=outfile, xclawerr=outfile)
+
+        if make_plots:
+
+            # initialize plotdata using specified setplot file:
+            setplot, accepts_case = load_case_module('setplot', setplot_file)
+
+            # The setplot function may have been modified to accept an argument
+            # `case` so that the dictionary of parameters can be passed in:
+
+            if accepts_case:
+                plotdata = setplot.setplot(plotdata=None,case=case)
+            else:
+                print('*** Warning: setplot does not support case parameter: ', \
+                        '    setplot_file = %s' % setplot_file)
+                plotdata = setplot.setplot(plotdata=None)
+
+
+            # note that setplot can also be modified to return None if the
+            # user does not want to make frame plots (setplot can explicitly
+            # make other plots or do other post-processing)
+
+            if plotdata is not None:
+                # user wants to make time frame plots using plotclaw:
+                plotdata.outdir = outdir
+                plotdata.plotdir = plotdir
+
+                # modified plotclaw is needed in order to pass plotdata here:
+                plotclaw(outdir, plotdir, setplot, plotdata=plotdata)
+            else:
+                # assume setplot already made any plots desired by user,
+                # e.g. fgmax, fgout, or specialized gauge plots.
+                print('plotdata is None, so not making frame plots')
+
+    except:
+        if redirect_python:
+            stdout_file.close()
+            # Fix stdout again before the exception reaches the caller
+            sys.stdout = sys_stdout
+            sys.stderr = sys_stderr
+        raise
+
+    #timenow = datetime.datetime.today().strftime('%Y-%m-%d at %H:%M:%S')
+    timenow = datetime.datetime.utcnow().strftime('%Y-%m-%d at %H:%M:%S') \
+                + ' UTC'
+    message = "Process %i completed case %s at %s\n" \
+                % (p.pid, case_name, timenow)
+    print(message)
+
+    if redirect_python:
+        stdout_file.close()
+        # Fix stdout again
+        sys.stdout = sys_stdout
+        sys.stderr = sys_stderr
+        print(message) # to screen
+
+
+def write_case_info(case, timenow):
+    """
+    Write the files case_info.txt and case_info.pkl with the entries of
+    `case` in case['outdir'] and append them to case_summary.txt.
+
+    The entries of each case are appended with a single write while
+    holding a lock on case_summary.txt, so that the lines of cases run by
+    different processes are not interleaved.
+    """
+
+    import pickle
+    from clawpack.clawutil.multip_tools import _locked
+
+    outdir = case['outdir']
+
     # write out all case parameters:
     fname = os.path.join(outdir, 'case_info.txt')
     with open(fname,'w') as f:
@@ -175,93 +303,217 @@ def run_one_case_clawpack(case):
 
     # global summary file:
     fname = 'case_summary.txt'
+    text = '=========\n%s\n\ncase_name: %s\n' % (timenow,case['case_name'])
+    for k in case.keys():
+        if k != 'case_name':
+            text += '%s:  %s\n' % (k.ljust(20), case[k])
     with open(fname,'a') as f:
-        f.write('=========\n%s\n\ncase_name: %s\n' % (timenow,case['case_name']))
-        for k in case.keys():
-            if k != 'case_name':
-                f.write('%s:  %s\n' % (k.ljust(20), case[k]))
+        with _locked(f, exclusive=True):
+            f.write(text)
+            f.flush()
 
 
-    if run_clawpack:
+def run_case_clawpack(case):
+    """
+    Run Clawpack for `case` without plotting, the first stage of a sweep
+    in which plots are made separately by plot_case_clawpack, e.g.
 
-        # initialize rundata using specified setrun file:
-        spec = importlib.util.spec_from_file_location('setrun',setrun_file)
-        setrun = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(setrun)
+        multip_tools.run_many_cases_pool(caselist, nprocs,
+                          clawmultip_tools.run_case_clawpack,
+                          post_process=clawmultip_tools.plot_case_clawpack,
+                          post_nprocs=2)
 
-        # The setrun function may have been modified to accept an argument
-        # `case` so that the dictionary of parameters can be passed in:
+    See run_one_case_clawpack.
+    """
+    run_one_case_clawpack(case, plot=False)
 
-        if 'case' in inspect.signature(setrun.setrun).parameters.keys():
-            rundata = setrun.setrun(case=case)
-        else:
-            print('*** Warning: setrun does not support case parameter: ', \
-                    '    setrun_file = %s' % setrun_file)
-            rundata = setrun.setrun()
 
-        # write .data files in outdir:
-        rundata.write(outdir)
+def plot_case_clawpack(case):
+    """
+    Make the plots for `case` from existing output, the second stage of a
+    sweep started with run_case_clawpack.  See run_one_case_clawpack.
+    """
+    run_one_case_clawpack(case, run=False)
 
-        # Run the clawpack executable
-        if not os.path.isfile(xclawcmd):
-            raise Exception('Executable %s not found' % xclawcmd)
 
-        # redirect output and error messages:
-        outfile = os.path.join(outdir, 'fortran_output.txt')
-        print('Fortran output will be redirected to\n    ', outfile)
+def executable_sha256(fname):
+    """Return the SHA-256 hash of the file `fname` as a hex string."""
 
-        # Use data from rundir=outdir, which was just written above...
-        runclaw(xclawcmd=xclawcmd, outdir=outdir, overwrite=overwrite,
-                rundir=outdir, nohup=nohup, runexe=runexe,
-                xclawout=outfile, xclawerr=outfile)
+    import hashlib
 
-    if make_plots:
+    sha256 = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
 
-        # initialize plotdata using specified setplot file:
-        spec = importlib.util.spec_from_file_location('setplot',setplot_file)
-        setplot = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(setplot)
 
-        # The setplot function may have been modified to accept an argument
-        # `case` so that the dictionary of parameters can be passed in:
+def build_executables(caselist, example_dir='.',
+                      cache_dir='_sweep_executables',
+                      executable_name='xclaw', make_level='new',
+                      rebuild=True):
+    """
+    Sweep-level build stage, to be called before
+    multip_tools.run_many_cases_pool.
+
+    Collects the distinct build configurations of the cases in `caselist`,
+    given by case['FFLAGS'], case['LFLAGS'] and case['make_vars'] (a dict
+    of variables passed to make), with None or missing entries meaning the
+    defaults of the Makefile and environment.  Each configuration is built
+    once with the Makefile in `example_dir` and the executable is stored in
+    `cache_dir`.
+
+    For every case that runs Clawpack (case['xclawcmd'] not None) the
+    entries
+        case['xclawcmd'] = path to the cached executable
+        case['xclawcmd_sha256'] = hash of that executable
+    are set, and run_one_case_clawpack checks the hash before running.
+    These entries are not part of multip_tools.case_hash, so a ledger
+    still recognizes the cases of a restarted sweep.
+
+    The builds run one after another: the Clawpack library object files are
+    compiled next to the library sources in $CLAW and are shared by all
+    configurations, so builds with different flags cannot run at once.
+    `make_level` is 'new' by default so that every configuration is
+    compiled with its own flags.  If `rebuild` is True, executables cached
+    by an earlier sweep are removed first.
+
+    Returns a dictionary mapping each executable built to its hash.
+    """
 
-        if 'case' in inspect.signature(setplot.setplot).parameters.keys():
-            plotdata = setplot.setplot(plotdata=None,case=case)
-        else:
-            print('*** Warning: setplot does not support case parameter: ', \
-                    '    setplot_file = %s' % setplot_file)
-            plotdata = setplot.setplot(plotdata=None)
+    import shutil
+    from clawpack.clawutil.builds import ExecutableRegistry
 
+    cache_dir = os.path.abspath(cache_dir)
+    if rebuild and os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    registry = ExecutableRegistry(cache_dir)
 
-        # note that setplot can also be modified to return None if the
-        # user does not want to make frame plots (setplot can explicitly
-        # make other plots or do other post-processing)
+    hashes = {}
+    for case in caselist:
+        if case.get('xclawcmd', None) is None:
+            continue
+        xclawcmd = str(registry.executable_for(example_dir,
+                                    make_level=make_level,
+                                    FFLAGS=case.get('FFLAGS', None),
+                                    LFLAGS=case.get('LFLAGS', None),
+                                    make_vars=case.get('make_vars', None),
+                                    executable_name=executable_name))
+        if xclawcmd not in hashes:
+            hashes[xclawcmd] = executable_sha256(xclawcmd)
+            print('Built %s' % xclawcmd)
+        case['xclawcmd'] = xclawcmd
+        case['xclawcmd_sha256'] = hashes[xclawcmd]
 
-        if plotdata is not None:
-            # user wants to make time frame plots using plotclaw:
-            plotdata.outdir = outdir
-            plotdata.plotdir = plotdir
+    print('%i executables built for %i cases' % (len(hashes), len(caselist)))
+    return hashes
 
-            # modified plotclaw is needed in order to pass plotdata here:
-            plotclaw(outdir, plotdir, setplot, plotdata=plotdata)
-        else:
-            # assume setplot already made any plots desired by user,
-            # e.g. fgmax, fgout, or specialized gauge plots.
-            print('plotdata is None, so not making frame plots')
 
-    #timenow = datetime.datetime.today().strftime('%Y-%m-%d at %H:%M:%S')
-    timenow = datetime.datetime.utcnow().strftime('%Y-%m-%d at %H:%M:%S') \
-                + ' UTC'
-    message = "Process %i completed case %s at %s\n" \
-                % (p.pid, case_name, timenow)
-    print(message)
+# Modules loaded by load_case_module, keyed by (path, modification time):
+_module_cache = {}
 
-    if redirect_python:
-        stdout_file.close()
-        # Fix stdout again
-        sys.stdout = sys_stdout
-        sys.stderr = sys_stderr
-        print(message) # to screen
+
+def load_case_module(name, fname):
+    """
+    Load the module `name` ('setrun' or 'setplot') from the file `fname`
+    and check whether its function `name` accepts an argument `case`.
+
+    Returns (module, accepts_case).
+
+    The module is executed only the first time it is requested in a
+    process, and again if the file has been modified since, so a worker
+    process running many cases does not repeat module-level work such as
+    reading topography files.  Functions in a cached module are called
+    again for every case, so they must not rely on module-level state
+    being reset between calls.
+    """
+
+    import inspect
+    import importlib.util
+
+    path = os.path.abspath(fname)
+    key = (path, os.path.getmtime(path))
+    if key not in _module_cache:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        function = getattr(module, name)
+        accepts_case = 'case' in inspect.signature(function).parameters
+        # forget older versions of the same file:
+        for old_key in [k for k in _module_cache if k[0] == path]:
+            del _module_cache[old_key]
+        _module_cache[key] = (module, accepts_case)
+
+    return _module_cache[key]
+
+
+def rundata_for_case(case):
+    """
+    Return the rundata object for `case`, created by the setrun function in
+    case['setrun_file'] (default 'setrun.py').
+
+    If the setrun function accepts an argument `case`, the case dictionary
+    is passed in so that the desired parameters can be modified.
+    """
+
+    setrun_file = case.get('setrun_file', 'setrun.py')
+    setrun, accepts_case = load_case_module('setrun', setrun_file)
+
+    # The setrun function may have been modified to accept an argument
+    # `case` so that the dictionary of parameters can be passed in:
+
+    if accepts_case:
+        rundata = setrun.setrun(case=case)
+    else:
+        print('*** Warning: setrun does not support case parameter: ', \
+                '    setrun_file = %s' % setrun_file)
+        rundata = setrun.setrun()
+
+    return rundata
+
+
+def case_cost_clawpack(case):
+    """
+    Estimate the relative cost of running `case` with Clawpack, for use as
+    the *cost* argument of multip_tools.run_many_cases_pool, e.g.
+
+        multip_tools.run_many_cases_pool(caselist, nprocs,
+                                 clawmultip_tools.run_one_case_clawpack,
+                                 cost=clawmultip_tools.case_cost_clawpack)
+
+    If case['cost'] is set it is returned.  Otherwise the estimate is
+    the total number of cells on the coarsest level times the number of
+    output times, using the rundata created by rundata_for_case(case).
+    This ignores AMR refinement and the time step size, but is usually
+    good enough to start the longest runs first.
+
+    Returns None, so the case is started early, if the case does not run
+    Clawpack or the rundata cannot be created.
+    """
+
+    import numpy
+
+    if 'cost' in case:
+        return case['cost']
+    if case.get('xclawcmd', None) is None:
+        return None
+
+    try:
+        rundata = rundata_for_case(case)
+    except Exception as e:
+        print('*** Warning: could not estimate cost of case %s: %s' \
+                % (case.get('case_name', ''), e))
+        return None
+
+    clawdata = rundata.clawdata
+    if clawdata.output_style == 1:
+        num_output_times = clawdata.num_output_times
+    elif clawdata.output_style == 2:
+        num_output_times = len(clawdata.output_times)
+    else:
+        num_output_times = clawdata.total_steps
+
+    return int(numpy.prod(clawdata.num_cells)) * max(num_output_times, 1)
 
 
 def make_cases_template():
@@ -300,6 +552,8 @@ def make_cases_template():
         # are case-dependent, using this format:
         # case[key] = value   # for each parameter
         # and then modify setrun_case.py and/or setplot_case.py to use them
+        # (or see multip_tools.factorial_cases to make all combinations
+        # of lists of parameter values)
 
         caselist.append(case)
 
@@ -0,0 +1,238 @@
+r"""
+Stream Clawpack output frames one patch at a time.
+
+The readers in ``clawpack.pyclaw.solution`` build a complete ``Solution``
+object holding every patch of a frame in memory.  For regression checks that
+only need a few reductions of a frame (sums, norms, digests) this is wasteful,
+particularly for large 3D AMR frames.  The functions in this module read the
+same ``fort.tNNNN``, ``fort.qNNNN`` and ``fort.bNNNN`` files but hand back
+one patch at a time:
+
+- binary output (``output_format`` 2 or 3) is accessed through
+  ``numpy.memmap`` so each patch is a view into the ``fort.bNNNN`` file and
+  only the pages actually touched are read,
+- ASCII output (``output_format`` 1) is parsed patch by patch from
+  ``fort.qNNNN``.
+
+Memory use is therefore bounded by the largest single patch rather than the
+size of the frame.
+
+Functions
+---------
+read_frame_time
+    Read the ``fort.tNNNN`` file describing a frame.
+iter_frame_patches
+    Yield ``(patch_index, level, q)`` for each patch of a frame.
+frame_sums
+    Sum selected components of ``q`` without loading the full frame.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+__all__ = ["read_frame_time", "iter_frame_patches", "frame_sums"]
+
+
+# numpy dtypes of the binary output formats written by the Fortran codes
+_BINARY_DTYPES = {"binary32": np.float32,
+                  "binary64": np.float64}
+
+
+def _frame_file(path, file_prefix: str, kind: str, frame: int) -> Path:
+    return Path(path) / f"{file_prefix}.{kind}{str(frame).zfill(4)}"
+
+
+def _next_value(f, data_type=int):
+    """Return the first token of the next non-blank line of *f*."""
+    for line in f:
+        tokens = line.split()
+        if tokens:
+            return data_type(tokens[0])
+    raise EOFError(f"Unexpected end of file in {f.name}")
+
+
+def read_frame_time(frame: int, path=".", file_prefix: str = "fort") -> dict:
+    r"""
+    Read the ``fort.tNNNN`` file for *frame*.
+
+    Parameters
+    ----------
+    frame : int
+        Frame number.
+    path : str or pathlib.Path, default "."
+        Output directory containing the frame files.
+    file_prefix : str, default "fort"
+        Prefix of the frame files.
+
+    Returns
+    -------
+    dict
+        Dictionary with keys ``t``, ``num_eqn``, ``num_patches``,
+        ``num_aux``, ``num_dim``, ``num_ghost`` and ``file_format``, where
+        ``file_format`` is one of ``"ascii"``, ``"binary32"`` or
+        ``"binary64"``.
+
+    Notes
+    -----
+    Older output may not record ``num_ghost`` or the file format.  In that
+    case ``num_ghost`` defaults to 2 and the format is inferred from the
+    presence of a ``fort.bNNNN`` file.
+    """
+
+    time_file = _frame_file(path, file_prefix, "t", frame)
+    with open(time_file) as f:
+        info = {"t": _next_value(f, float),
+                "num_eqn": _next_value(f),
+                "num_patches": _next_value(f),
+                "num_aux": _next_value(f),
+                "num_dim": _next_value(f)}
+        try:
+            info["num_ghost"] = _next_value(f)
+        except (EOFError, ValueError):
+            info["num_ghost"] = 2
+        try:
+            file_format = _next_value(f, str).lower()
+        except EOFError:
+            file_format = None
+
+    if file_format in ("1", "ascii"):
+        file_format = "ascii"
+    elif file_format in ("2", "binary32"):
+        file_format = "binary32"
+    elif file_format in ("3", "binary64", "binary"):
+        file_format = "binary64"
+    elif _frame_file(path, file_prefix, "b", frame).exists():
+        file_format = "binary64"
+    else:
+        file_format = "ascii"
+    info["file_format"] = file_format
+
+    return info
+
+
+def _read_patch_header(f, num_dim: int):
+    """Read a patch header and return ``(patch_index, level, num_cells)``."""
+    patch_index = _next_value(f)
+    level = _next_value(f)
+    num_cells = tuple(_next_value(f) for _ in range(num_dim))
+    # lower corner and cell widths are not needed for reductions
+    for _ in range(2 * num_dim):
+        _next_value(f, float)
+    return patch_index, level, num_cells
+
+
+def _read_ascii_values(f, count: int) -> np.ndarray:
+    """Read *count* floating point values from the following lines of *f*."""
+    tokens = []
+    while len(tokens) < count:
+        line = f.readline()
+        if not line:
+            raise EOFError(f"Unexpected end of file in {f.name}")
+        tokens.extend(line.split())
+    return np.array(tokens[:count], dtype=np.float64)
+
+
+def iter_frame_patches(frame: int, path=".",
+                       file_prefix: str = "fort") -> Iterator[tuple]:
+    r"""
+    Yield the patches of a frame one at a time.
+
+    Parameters
+    ----------
+    frame : int
+        Frame number.
+    path : str or pathlib.Path, default "."
+        Output directory containing the frame files.
+    file_prefix : str, default "fort"
+        Prefix of the frame files.
+
+    Yields
+    ------
+    tuple
+        ``(patch_index, level, q)`` where ``q`` has shape
+        ``(num_eqn, mx[, my[, mz]])`` with ghost cells removed, matching
+        ``State.q`` in ``clawpack.pyclaw``.
+
+    Notes
+    -----
+    For binary output ``q`` is a read-only view into a ``numpy.memmap`` of
+    the ``fort.bNNNN`` file.  It should not be kept beyond the iteration step
+    if memory use is a concern; reductions of it can be kept freely.
+    """
+
+    info = read_frame_time(frame, path=path, file_prefix=file_prefix)
+    num_eqn = info["num_eqn"]
+    num_dim = info["num_dim"]
+    num_ghost = info["num_ghost"]
+
+    q_file = _frame_file(path, file_prefix, "q", frame)
+
+    if info["file_format"] == "ascii":
+        with open(q_file) as f:
+            for _ in range(info["num_patches"]):
+                patch_index, level, num_cells = _read_patch_header(f, num_dim)
+                values = _read_ascii_values(f, num_eqn * int(np.prod(num_cells)))
+                yield patch_index, level, values.reshape((num_eqn,) + num_cells,
+                                                         order="F")
+        return
+
+    b_file = _frame_file(path, file_prefix, "b", frame)
+    if os.path.getsize(b_file) == 0:
+        return
+    data = np.memmap(b_file, dtype=_BINARY_DTYPES[info["file_format"]],
+                     mode="r")
+    interior = (slice(None),) + (slice(num_ghost, -num_ghost if num_ghost
+                                                   else None),) * num_dim
+    start = 0
+    with open(q_file) as f:
+        for _ in range(info["num_patches"]):
+            patch_index, level, num_cells = _read_patch_header(f, num_dim)
+            shape = (num_eqn,) + tuple(n + 2 * num_ghost for n in num_cells)
+            end = start + int(np.prod(shape))
+            q = data[start:end].reshape(shape, order="F")[interior]
+            start = end
+            yield patch_index, level, q
+
+
+def frame_sums(frame: int, indices: Iterable = (0,), path=".",
+               file_prefix: str = "fort",
+               all_patches: bool = False) -> list:
+    r"""
+    Sum selected components of ``q`` for a frame without loading it.
+
+    Parameters
+    ----------
+    frame : int
+        Frame number.
+    indices : iterable of int, default (0,)
+        Components of ``q`` to sum.
+    path : str or pathlib.Path, default "."
+        Output directory containing the frame files.
+    file_prefix : str, default "fort"
+        Prefix of the frame files.
+    all_patches : bool, default False
+        If False, only the first patch is summed, which matches
+        ``Solution.q[i, ...].sum()`` as used for existing regression data.
+        In that case reading stops after the first patch.  If True, the sums
+        are accumulated over every patch of the frame.
+
+    Returns
+    -------
+    list of float
+        One sum per entry of *indices*.
+    """
+
+    indices = list(indices)
+    sums = np.zeros(len(indices))
+    for _, _, q in iter_frame_patches(frame, path=path,
+                                      file_prefix=file_prefix):
+        sums += [q[i, ...].sum() for i in indices]
+        if not all_patches:
+            break
+    return sums.tolist()
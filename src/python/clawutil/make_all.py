@@ -4,6 +4,28 @@ gallery or to perform regression tests against results in the gallery,
 or elsewhere.
 
 Sends output and errors to separate files to simplify looking for errors.
+
+Can also be run from the command line, e.g. in a batch job:
+
+    python -m clawpack.clawutil.make_all [examples_dir] --yes [--clean]
+                                         [--notebooks] [-j NPROCS]
+                                         [--log-dir DIR] [--report NAME]
+                                         [--manifest FILE] [--incremental]
+                                         [--nb-cache DIR]
+
+which exits with status 1 if any example failed.  See main.
+
+With -j NPROCS (nprocs in make_all) several examples are run at once,
+examples in subdirectories of another example still being run before it,
+and with --notebooks the notebooks of several directories are executed at
+once, each in its own kernel, see make_notebook_htmls.  With --nb-cache DIR,
+notebooks unchanged since they last ran successfully are not executed again.
+With --manifest FILE --incremental, examples whose sources, setrun.py,
+setplot.py, Makefile and library sources are unchanged since they last ran
+successfully, as recorded in FILE, are skipped, see example_hash.
+--log-dir and --report keep the output of each example and a report of
+run times and resources used; without them only make_all_output.txt and
+make_all_errors.txt are written to the current directory.
 """
 
 import os
@@ -15,39 +37,446 @@ except:
     raise Exception("Need to set CLAW environment variable")
 
 
+# Directories never searched for examples, in addition to hidden directories
+# such as .git and names starting with _output or _plots:
+_skip_dirs = set(['__pycache__', 'CVS'])
+
+# Results of list_examples, see _cached_examples:
+_examples_cache = {}
+
+
+def _skip_dir(name):
+    return name.startswith('.') or name.startswith('_output') \
+           or name.startswith('_plots') or name in _skip_dirs
+
+
+def _scan_examples(directory, dirlist, mtimes):
+    """
+    Append the example directories in and below directory to dirlist,
+    subdirectories first, and record the mtime of every directory searched
+    in the dictionary mtimes.
+    """
+    import os
+
+    is_example = False
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not _skip_dir(entry.name):
+                    subdirs.append(entry.path)
+            elif entry.name == 'setrun.py':
+                is_example = True
+        mtimes[directory] = os.stat(directory).st_mtime_ns
+
+    for subdir in sorted(subdirs):
+        _scan_examples(subdir, dirlist, mtimes)
+
+    # By convention we assume that a setrun.py file indicates this is an
+    # example directory.
+    if is_example:
+        dirlist.append(directory)
+
+
+def _cached_examples(examples_dir):
+    """
+    Return the cached result of list_examples for examples_dir, or None if
+    any directory searched has been modified since, i.e. had files or
+    subdirectories added or removed.
+    """
+    import os
+
+    if examples_dir not in _examples_cache:
+        return None
+    mtimes, dirlist = _examples_cache[examples_dir]
+    for directory, mtime in mtimes.items():
+        try:
+            if os.stat(directory).st_mtime_ns != mtime:
+                return None
+        except OSError:
+            return None
+    return list(dirlist)
+
+
 def list_examples(examples_dir):
     """
     Searches all subdirectories of examples_dir for examples and prints out a list.
+
+    Directories starting with _output or _plots, hidden directories such as
+    .git and __pycache__ are not searched.  The result is cached and reused
+    as long as none of the directories searched changed.
     """
     import os
 
-    current_dir = os.getcwd()
-    os.chdir(examples_dir)
-    
-    dirlist = []
-    applist = []
+    examples_dir = os.path.abspath(examples_dir)
+    dirlist = _cached_examples(examples_dir)
+    if dirlist is not None:
+        return dirlist
 
-    # Traverse directories depth-first (topdown=False) to insure e.g. that code in
+    # Traverse directories depth-first, subdirectories first, to insure e.g.
+    # that code in
     #    amrclaw/examples/acoustics_2d_radial/1drad 
     # is run before code in
     #    amrclaw/examples/acoustics_2d_radial
 
-    for (dirpath, subdirs, files) in os.walk('.',topdown=False):
-
-        if '_output' not in dirpath:
-            # By convention we assume that a setrun.py file indicates this is an
-            # example directory.
-            files = os.listdir(os.path.abspath(dirpath))
-            if 'setrun.py' in files:
-                dirlist.append(os.path.abspath(dirpath))
-
-    os.chdir(current_dir)
+    dirlist = []
+    mtimes = {}
+    _scan_examples(examples_dir, dirlist, mtimes)
+    _examples_cache[examples_dir] = (mtimes, list(dirlist))
 
     return dirlist
         
 
-def make_all(examples_dir = '.',make_clean_first=False, env=None):
-    import os,sys
+def example_dependencies(dir_list):
+    """
+    Return a dictionary mapping each example directory in dir_list to the
+    set of example directories in dir_list below it, which must be run
+    first, e.g. the example
+        amrclaw/examples/acoustics_2d_radial
+    depends on
+        amrclaw/examples/acoustics_2d_radial/1drad
+    """
+    import os
+
+    deps = {}
+    for directory in dir_list:
+        prefix = os.path.join(directory, '')
+        deps[directory] = set(d for d in dir_list if d.startswith(prefix))
+    return deps
+
+
+def _log_name(examples_dir, directory):
+    """Name for the log files of directory, unique within examples_dir."""
+    import os
+    relpath = os.path.relpath(directory, examples_dir)
+    if relpath == '.':
+        relpath = os.path.basename(examples_dir)
+    return relpath.replace(os.sep, '__')
+
+
+# Targets made in each example, in this order, and timed separately by
+# make_all.  Only '.exe' and 'all' check the executable, and they are made
+# while holding a lock, see _make_example.  'output' and 'plots' run the code
+# and make the plots without checking the executable and the library object
+# files it depends on, which may be shared with other examples compiled at
+# the same time.  'all' is always made last and decides whether the example
+# succeeded, as when make_all only ran 'make all'; after the other targets
+# it normally has nothing left to do.  Examples whose Makefile redefines
+# 'all' only make '.exe' and 'all', see _redefines_all.
+make_targets = ['.exe', '.data', 'output', 'plots', '.htmls', 'all']
+
+
+def _redefines_all(directory):
+    """
+    True if the Makefile in directory has its own rule for 'all', e.g.
+    GeoClaw examples making the topography first, instead of the default
+    of Makefile.common.
+    """
+    import os, re
+
+    try:
+        with open(os.path.join(directory, 'Makefile')) as f:
+            text = f.read()
+    except OSError:
+        return False
+    return re.search(r'^all\s*::?(?!=)', text, re.MULTILINE) is not None
+
+
+def _run_make(target, directory, fout, ferr, env):
+    """
+    Run 'make target' in directory and return a dictionary with its
+    'return_code', wall clock 'time' in seconds and the peak resident set
+    size 'max_rss_kb' of make and the processes it ran.
+    """
+    import subprocess, time
+    from clawpack.clawutil.util import wait_max_rss
+
+    t0 = time.time()
+    job = subprocess.Popen(['make',target], cwd=directory, \
+              stdout=fout,stderr=ferr,env=env)
+    max_rss_kb = wait_max_rss(job)
+    return {'return_code': job.returncode,
+            'time': time.time() - t0,
+            'max_rss_kb': max_rss_kb}
+
+
+def _output_dirs(directory):
+    """Sorted names of the _output* and _plots* directories in directory."""
+    import os
+
+    return sorted(name for name in os.listdir(directory)
+                  if (name.startswith('_output') or name.startswith('_plots'))
+                  and os.path.isdir(os.path.join(directory, name)))
+
+
+def _output_size(directory):
+    """Disk space in bytes used by the _output* and _plots* directories."""
+    import os
+
+    size = 0
+    for name in _output_dirs(directory):
+        for dirpath, subdirs, files in os.walk(os.path.join(directory, name)):
+            for fname in files:
+                st = os.lstat(os.path.join(dirpath, fname))
+                size += getattr(st, 'st_blocks', 0) * 512 or st.st_size
+    return size
+
+
+# Files in an example directory that are inputs of the example, in addition
+# to the files listed by 'make list_sources':
+_input_suffixes = ('.py', '.f', '.f90', '.f95', '.F', '.F90', '.c', '.h',
+                   '.txt', '.rst')
+
+# Files written by make_all and make_notebook_htmls into the directory they
+# are run in, which may be an example directory, and so not inputs:
+_own_files = set(['make_all_output.txt', 'make_all_errors.txt',
+                  'make_nb_output.txt', 'make_nb_errors.txt'])
+
+# Environment variables that change how examples are compiled or run:
+_input_env_vars = ['FC', 'CLAW_FC', 'FFLAGS', 'LFLAGS', 'OMP_NUM_THREADS',
+                   'CLAW_PYTHON']
+
+
+def example_hash(directory, env=None):
+    """
+    Return a hash of the inputs of the example in directory: its
+    setrun.py, setplot.py, Makefile and other source files, the library
+    sources and Makefiles listed by 'make list_sources' (see
+    Makefile.common) and the compiler settings in the environment env.
+    The output files of make_all itself are not included.
+
+    Returns None if the sources cannot be listed, e.g. if the Makefile does
+    not include a Makefile.common with the list_sources target.
+    """
+    import os, hashlib, subprocess
+
+    if env is None:
+        env = os.environ
+
+    try:
+        listing = subprocess.run(['make', '-s', '--no-print-directory',
+                                  'list_sources'], cwd=directory, env=env,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 universal_newlines=True)
+    except OSError:
+        return None
+    if listing.returncode != 0:
+        return None
+
+    fnames = set()
+    for line in listing.stdout.splitlines():
+        if line.strip():
+            fnames.add(os.path.normpath(os.path.join(directory,
+                                                     line.strip())))
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name not in _own_files \
+                    and (entry.name == 'Makefile'
+                         or entry.name.endswith(_input_suffixes)):
+                fnames.add(entry.path)
+
+    h = hashlib.sha256()
+    for name in _input_env_vars:
+        h.update(('%s=%s\n' % (name, env.get(name, ''))).encode())
+    for fname in sorted(fnames):
+        h.update(fname.encode() + b'\n')
+        try:
+            with open(fname, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            h.update(b'missing\n')
+    return h.hexdigest()
+
+
+def _read_manifest(fname):
+    """Return the manifest written by make_all, or {} if there is none."""
+    import json
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest, fname):
+    import json, os
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(fname + '.tmp', fname)
+
+
+def _make_example(directory, log_base, make_clean_first, env, exe_lock,
+                  incremental=False, previous=None):
+    """
+    Make the targets in make_targets in directory, with output and errors
+    captured in log_base + '_output.txt' and log_base + '_errors.txt'.
+    After a target fails the remaining targets are skipped, but 'all' is
+    still made and its return code is that of the example.  If the Makefile
+    redefines 'all', see _redefines_all, only '.exe' and 'all' are made.
+
+    The hash of the inputs of the example is recorded as 'hash', see
+    example_hash, and the _output* and _plots* directories present after
+    the run as 'outputs'.  previous is the manifest entry of the last
+    successful run, a dictionary with these 'hash' and 'outputs'.  If
+    incremental is True, the hash equals that of previous and its outputs
+    still exist, the example is not run and 'skipped' is True.
+
+    The executable is made first with 'make .exe' while holding exe_lock,
+    since the library object files may be shared between examples.  The
+    code is then run and plotted with 'make output' and 'make plots', which
+    do not check the executable, so they cannot recompile shared object
+    files while another example is compiled.  The final 'make all' also
+    holds exe_lock, unless the Makefile redefines it, in which case it is
+    run after the executable is up to date.
+
+    Returns a dictionary describing the outcome, with the 'return_code'
+    of 'make all', the total 'time', the peak 'max_rss_kb' of all
+    targets, the 'output_bytes' of the output and plots, and the results
+    of each target in 'targets', see _run_make, including 'clean' if
+    make_clean_first is True.
+    """
+
+    inputs_hash = example_hash(directory, env)
+    # manifests of older versions of make_all only recorded the hash:
+    if incremental and inputs_hash is not None \
+            and isinstance(previous, dict) \
+            and inputs_hash == previous['hash'] \
+            and set(previous['outputs']) <= set(_output_dirs(directory)):
+        with open(log_base + '_output.txt', 'w') as fout, \
+             open(log_base + '_errors.txt', 'w') as ferr:
+            fout.write('Skipped, inputs unchanged since the last run\n')
+        return {'directory': directory, 'return_code': 0, 'time': 0.,
+                'max_rss_kb': None, 'output_bytes': _output_size(directory),
+                'targets': {}, 'hash': inputs_hash,
+                'outputs': previous['outputs'], 'skipped': True}
+
+    with open(log_base + '_output.txt', 'w') as fout, \
+         open(log_base + '_errors.txt', 'w') as ferr:
+
+        from contextlib import nullcontext
+
+        targets = {}
+        if make_clean_first:
+            # Run 'make clean', recorded but not affecting the outcome:
+            targets['clean'] = _run_make('clean', directory, fout, ferr, env)
+
+        split = not _redefines_all(directory)
+        failed = False
+        for target in make_targets:
+            if target != 'all' and (failed or not (split or target == '.exe')):
+                continue
+            if target == '.exe' or (target == 'all' and split):
+                lock = exe_lock
+            else:
+                lock = nullcontext()
+            with lock:
+                result = _run_make(target, directory, fout, ferr, env)
+            targets[target] = result
+            failed = failed or result['return_code'] != 0
+
+    rss = [r['max_rss_kb'] for r in targets.values()
+           if r['max_rss_kb'] is not None]
+    return {'directory': directory,
+            'return_code': result['return_code'],
+            'time': sum(r['time'] for r in targets.values()),
+            'max_rss_kb': max(rss) if rss else None,
+            'output_bytes': _output_size(directory),
+            'targets': targets, 'hash': inputs_hash,
+            'outputs': _output_dirs(directory), 'skipped': False}
+
+
+def write_report(records, fname='make_all_report'):
+    """
+    Write the records returned for each example by make_all, sorted by
+    total time with the most expensive example first, to fname + '.json'
+    and as a table to fname + '.html'.
+    """
+    import json, html, time
+
+    records = sorted(records, key=lambda r: r['time'], reverse=True)
+    with open(fname + '.json', 'w') as f:
+        json.dump(records, f, indent=1)
+
+    def seconds(r, target):
+        if target not in r['targets']:
+            return '-'
+        return '%.1f' % r['targets'][target]['time']
+
+    def megabytes(num_bytes):
+        if num_bytes is None:
+            return '-'
+        return '%.1f' % (num_bytes / 1e6)
+
+    columns = ['example', 'status', 'total (s)'] \
+              + ['%s (s)' % target for target in make_targets] \
+              + ['peak RSS (MB)', 'output (MB)']
+    lines = ['<html><head><title>make_all report</title></head><body>',
+             '<h1>make_all report</h1>',
+             '<p>%s, %i examples, total time %.1f s</p>' \
+                 % (time.strftime('%Y-%m-%d %H:%M:%S'), len(records),
+                    sum(r['time'] for r in records)),
+             '<table border="1">',
+             '<tr>' + ''.join('<th>%s</th>' % c for c in columns) + '</tr>']
+    for r in records:
+        status = 'ok' if r['return_code'] == 0 \
+                 else 'failed (%s)' % r['return_code']
+        max_rss = r['max_rss_kb'] * 1024 if r['max_rss_kb'] is not None \
+                  else None
+        row = [html.escape(r['directory']), status, '%.1f' % r['time']] \
+              + [seconds(r, target) for target in make_targets] \
+              + [megabytes(max_rss), megabytes(r['output_bytes'])]
+        lines.append('<tr>' + ''.join('<td>%s</td>' % v for v in row)
+                     + '</tr>')
+    lines += ['</table>', '</body></html>']
+    with open(fname + '.html', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def make_all(examples_dir = '.',make_clean_first=False, env=None, yes=False,
+             nprocs=1, log_dir=None, report=None, incremental=False,
+             manifest=None):
+    """
+    Run 'make all' in every example directory found below examples_dir.
+
+    Asks for confirmation before running unless yes is True.
+
+    Up to nprocs examples are run at the same time.  An example is only
+    started after all the examples in subdirectories of it have finished,
+    see example_dependencies, and executables are compiled one at a time.
+    The output and errors of each example are captured separately and
+    collected in make_all_output.txt and make_all_errors.txt as each example
+    finishes, so the output of different examples is never interleaved.
+    The separate files are kept in log_dir, e.g. 'make_all_logs', or in a
+    temporary directory removed at the end if log_dir is None.
+
+    'make all' is run in each example after 'make .exe', and unless the
+    Makefile redefines 'all' also after the targets .data, output, plots
+    and .htmls, see _make_example.  The run times of these targets, the
+    peak memory use, the size of the output and plots and the return code
+    of each example are written to report + '.json' and report + '.html',
+    e.g. with report='make_all_report', see write_report, unless report is
+    None.
+
+    If manifest is not None, e.g. 'make_all_manifest.json', the hashes and
+    output directories of the examples that ran successfully are kept in
+    this JSON file, which is updated by every run.  If incremental is True,
+    which requires a manifest, examples whose inputs have not changed since
+    they last ran successfully and whose _output* and _plots* directories
+    still exist are skipped, see example_hash, unless an example below them
+    was run again.  Running without incremental forces a full rebuild and
+    prepares for the next incremental run.
+
+    log_dir, report and manifest are relative to the current directory, as
+    are make_all_output.txt and make_all_errors.txt.
+
+    Returns the lists of directories where 'make all' succeeded and failed.
+    """
+    import os,sys,tempfile,threading
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if incremental and manifest is None:
+        raise ValueError("incremental=True requires a manifest")
 
     if env is None:
         my_env = os.environ
@@ -58,8 +487,6 @@ def make_all(examples_dir = '.',make_clean_first=False, env=None):
     if not os.path.isdir(examples_dir):
         raise Exception("Directory not found: %s" % examples_dir)
 
-    current_dir = os.getcwd()
-
     dir_list = list_examples(examples_dir)
     print("Found the following example subdirectories:")
     for d in dir_list:
@@ -67,10 +494,11 @@ def make_all(examples_dir = '.',make_clean_first=False, env=None):
  
     print("Will run code and make plots in the above subdirectories of ")
     print("    ", examples_dir)
-    ans = input("Ok? ")
-    if ans.lower() not in ['y','yes']:
-        print("Aborting.")
-        sys.exit()
+    if not yes:
+        ans = input("Ok? ")
+        if ans.lower() not in ['y','yes']:
+            print("Aborting.")
+            sys.exit(1)
     
     fname_output = 'make_all_output.txt'
     fout = open(fname_output, 'w')
@@ -80,45 +508,99 @@ def make_all(examples_dir = '.',make_clean_first=False, env=None):
     ferr = open(fname_errors, 'w')
     ferr.write("ALL ERRORS FROM RUNNING EXAMPLES\n\n")
 
-    os.chdir(examples_dir)
+    if log_dir is None:
+        tmp_log_dir = tempfile.TemporaryDirectory(prefix='make_all_logs_')
+        log_dir = tmp_log_dir.name
+    else:
+        tmp_log_dir = None
+        log_dir = os.path.abspath(log_dir)
+        os.makedirs(log_dir, exist_ok=True)
 
     goodlist_run = []
     badlist_run = []
-    
-    import subprocess
-    for directory in dir_list:
+    records = []
 
-        fout.write("\n=============================================\n")
-        fout.write(directory)
-        fout.write("\n=============================================\n")
-        ferr.write("\n=============================================\n")
-        ferr.write(directory)
-        ferr.write("\n=============================================\n")
+    # examples still waiting for the examples they depend on:
+    waiting = example_dependencies(dir_list)
+    exe_lock = threading.Lock()
 
-        os.chdir(directory)
-        print(directory)
+    if manifest is not None:
+        manifest = os.path.abspath(manifest)
+        hashes = _read_manifest(manifest)
+    else:
+        hashes = {}
+    # examples run again, so the examples containing them are run as well:
+    rerun = set()
 
-        # flush I/O buffers:
-        fout.flush()
-        ferr.flush()
+    with ThreadPoolExecutor(max_workers=nprocs) as executor:
+        futures = {}
 
-        if make_clean_first:
-            # Run 'make clean':
-            job = subprocess.Popen(['make','clean'], \
-                      stdout=fout,stderr=ferr)
-            return_code = job.wait()
-                
-        # Run 'make all':
-        job = subprocess.Popen(['make','all'], \
-                  stdout=fout,stderr=ferr,env=my_env)
-        return_code = job.wait()
-                
-        if return_code == 0:
-            print("Successful run\n")
-            goodlist_run.append(directory)
-        else:
-            print("*** Run errors encountered: see %s\n" % fname_errors)
-            badlist_run.append(directory)
+        def submit_ready():
+            for directory in dir_list:
+                if directory in waiting and not waiting[directory]:
+                    del waiting[directory]
+                    log_base = os.path.join(log_dir,
+                                    _log_name(examples_dir, directory))
+                    previous = hashes.get(directory, None)
+                    deps = example_dependencies([directory] + list(rerun))
+                    if deps[directory]:
+                        previous = None
+                    future = executor.submit(_make_example, directory,
+                                             log_base, make_clean_first,
+                                             my_env, exe_lock, incremental,
+                                             previous)
+                    futures[future] = (directory, log_base)
+
+        submit_ready()
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, log_base = futures.pop(future)
+                try:
+                    record = future.result()
+                except OSError as e:
+                    # e.g. make not found
+                    with open(log_base + '_errors.txt', 'a') as f:
+                        f.write('%s\n' % e)
+                    record = {'directory': directory, 'return_code': None,
+                              'time': 0., 'max_rss_kb': None,
+                              'output_bytes': None, 'targets': {},
+                              'hash': None, 'outputs': [],
+                              'skipped': False}
+                records.append(record)
+                return_code = record['return_code']
+                if not record['skipped']:
+                    rerun.add(directory)
+                    hashes.pop(directory, None)
+                    if return_code == 0 and record['hash'] is not None:
+                        hashes[directory] = {'hash': record['hash'],
+                                             'outputs': record['outputs']}
+
+                for f, suffix in [(fout, '_output.txt'),
+                                  (ferr, '_errors.txt')]:
+                    f.write("\n=============================================\n")
+                    f.write(directory)
+                    f.write("\n=============================================\n")
+                    with open(log_base + suffix) as flog:
+                        f.write(flog.read())
+                    f.flush()
+
+                print(directory)
+                if record['skipped']:
+                    print("Skipped, inputs unchanged\n")
+                    goodlist_run.append(directory)
+                elif return_code == 0:
+                    print("Successful run\n")
+                    goodlist_run.append(directory)
+                else:
+                    print("*** Run errors encountered: see %s\n" \
+                          % (fname_errors if tmp_log_dir is not None
+                             else log_base + '_errors.txt'))
+                    badlist_run.append(directory)
+
+                for deps in waiting.values():
+                    deps.discard(directory)
+            submit_ready()
 
 
     print('------------------------------------------------------------- ')
@@ -143,12 +625,187 @@ def make_all(examples_dir = '.',make_clean_first=False, env=None):
     ferr.close()
     print('For all output see ', fname_output)
     print('For all errors see ', fname_errors)
+    if tmp_log_dir is not None:
+        tmp_log_dir.cleanup()
+    else:
+        print('For the output of each example see ', log_dir)
+    if manifest is not None:
+        _write_manifest(hashes, manifest)
+    if report is not None:
+        write_report(records, report)
+        print('For run times and resources used see ', report + '.html')
+
+    return goodlist_run, badlist_run
+
 
-    os.chdir(current_dir)
+# Command used to execute a notebook and convert it to html, as NBCONVERT in
+# Makefile.common, if the Makefile of an example does not define it:
+nbconvert_command = ['jupyter', 'nbconvert', '--to', 'html', '--execute',
+                     '--ExecutePreprocessor.kernel_name=python3',
+                     '--ExecutePreprocessor.timeout=1200']
 
 
-def make_notebook_htmls(examples_dir = '.',make_clean_first=False, env=None):
-    import os,sys,glob
+def notebook_command(directory, env=None):
+    """
+    Return the command used by 'make notebook_htmls' in directory to
+    execute a notebook and convert it to html, i.e. the value of NBCONVERT
+    in Makefile.common or as redefined in the Makefile, split into a list.
+
+    Returns nbconvert_command if the value cannot be obtained from make.
+    """
+    import os, shlex, subprocess
+
+    if env is None:
+        env = os.environ
+
+    try:
+        listing = subprocess.run(['make', '-s', '--no-print-directory',
+                                  '--eval',
+                                  'print_nbconvert: ; @echo $(NBCONVERT)',
+                                  'print_nbconvert'], cwd=directory, env=env,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 universal_newlines=True)
+    except OSError:
+        return list(nbconvert_command)
+    command = shlex.split(listing.stdout)
+    if listing.returncode != 0 or not command:
+        return list(nbconvert_command)
+    return command
+
+
+def notebook_hash(nbfile, command=None, inputs_hash=None):
+    """
+    Return a hash of the contents of the notebook nbfile, of the command
+    used to execute it, nbconvert_command by default, and of inputs_hash,
+    the hash of the other inputs of its directory, see example_hash.  It
+    identifies the html file created from the notebook.
+    """
+    import hashlib
+
+    if command is None:
+        command = nbconvert_command
+    h = hashlib.sha256(' '.join(command).encode() + b'\n')
+    h.update(('%s\n' % inputs_hash).encode())
+    with open(nbfile, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _run_notebook(nbfile, log_base, env, cache_dir, command=None,
+                  inputs_hash=None):
+    """
+    Execute the notebook nbfile and convert it to html with command,
+    nbconvert_command by default, with output and errors captured in
+    log_base + '_output.txt' and log_base + '_errors.txt'.
+
+    If cache_dir holds the html file of a notebook with the same contents,
+    command and inputs_hash, see notebook_hash, it is copied instead of
+    executing the notebook.  The html file of a notebook executed
+    successfully is added to the cache.  Nothing is cached if inputs_hash is
+    None.
+
+    Returns a dictionary with the 'notebook', the 'return_code' of
+    nbconvert, the 'time' taken and whether the html was 'cached'.
+    """
+    import os, shutil, subprocess, time
+
+    if command is None:
+        command = nbconvert_command
+
+    t0 = time.time()
+    directory, fname = os.path.split(nbfile)
+    html_file = os.path.join(directory, os.path.splitext(fname)[0] + '.html')
+    cached_html = None
+    if cache_dir is not None and inputs_hash is not None:
+        cached_html = os.path.join(cache_dir,
+                        notebook_hash(nbfile, command, inputs_hash) + '.html')
+
+    with open(log_base + '_output.txt', 'w') as fout, \
+         open(log_base + '_errors.txt', 'w') as ferr:
+
+        if cached_html is not None and os.path.isfile(cached_html):
+            shutil.copyfile(cached_html, html_file)
+            fout.write('Notebook and inputs unchanged, copied %s from %s\n' \
+                       % (html_file, cached_html))
+            return {'notebook': nbfile, 'return_code': 0,
+                    'time': time.time() - t0, 'cached': True}
+
+        job = subprocess.Popen(command + [fname], cwd=directory, \
+                  stdout=fout,stderr=ferr,env=env)
+        return_code = job.wait()
+
+    if return_code == 0 and cached_html is not None \
+            and os.path.isfile(html_file):
+        # copy to a temporary file first so other processes never see a
+        # partial file in the cache:
+        shutil.copyfile(html_file, cached_html + '.%s.tmp' % os.getpid())
+        os.replace(cached_html + '.%s.tmp' % os.getpid(), cached_html)
+
+    return {'notebook': nbfile, 'return_code': return_code,
+            'time': time.time() - t0, 'cached': False}
+
+
+def _run_notebooks(directory, notebooks, log_bases, env, cache_dir):
+    """
+    Run the notebooks in directory one after the other, see _run_notebook,
+    since they may read or write the same files, e.g. _output.  The command
+    and the hash of the inputs of the directory are determined once, see
+    notebook_command and example_hash, before any notebook runs.
+
+    Returns the list of the results of the notebooks.
+    """
+
+    command = notebook_command(directory, env)
+    inputs_hash = None
+    if cache_dir is not None:
+        inputs_hash = example_hash(directory, env)
+
+    records = []
+    for nbfile in notebooks:
+        log_base = log_bases[nbfile]
+        try:
+            record = _run_notebook(nbfile, log_base, env, cache_dir, command,
+                                   inputs_hash)
+        except OSError as e:
+            # e.g. jupyter not found
+            with open(log_base + '_errors.txt', 'a') as f:
+                f.write('%s\n' % e)
+            record = {'notebook': nbfile, 'return_code': None,
+                      'time': 0., 'cached': False}
+        records.append(record)
+    return records
+
+
+def make_notebook_htmls(examples_dir = '.',make_clean_first=False, env=None,
+                        yes=False, nprocs=1, cache_dir=None, log_dir=None,
+                        report=None):
+    """
+    Execute the Jupyter notebooks in every example directory below
+    examples_dir and convert them to html, as 'make notebook_htmls' does,
+    and remake README.html in these directories.
+
+    The notebooks of one directory are executed one after the other, with
+    NBCONVERT of its Makefile, see notebook_command, and the notebooks of up
+    to nprocs directories at the same time, each with its own kernel.  The
+    output and errors of each notebook are captured separately and
+    collected in make_nb_output.txt and make_nb_errors.txt as the notebooks
+    of each directory finish, and kept in log_dir unless it is None, as in
+    make_all.  Notebooks whose contents and command, and
+    the inputs of whose directory, see example_hash, have not changed since
+    they were last executed successfully are not executed again if
+    cache_dir is given, e.g. 'make_nb_cache', their html file is copied from
+    cache_dir instead.  The
+    execution time of each notebook is printed at the end and written to
+    the JSON file report, e.g. 'make_nb_report.json', unless it is None.
+
+    Asks for confirmation before running unless yes is True.
+
+    Returns the lists of directories where all notebooks ran successfully
+    and where some failed.
+    """
+    import os,sys,glob,json,subprocess,tempfile
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
     if env is None:
         my_env = os.environ
@@ -159,30 +816,31 @@ def make_notebook_htmls(examples_dir = '.',make_clean_first=False, env=None):
     if not os.path.isdir(examples_dir):
         raise Exception("Directory not found: %s" % examples_dir)
 
-    current_dir = os.getcwd()
-
     dir_list = list_examples(examples_dir)
     print("Found the following Jupyter notebooks:")
     nb_dir_list = []
+    nb_lists = {}
     for d in dir_list:
-        notebooks = glob.glob(d + '/*.ipynb')
+        notebooks = sorted(glob.glob(d + '/*.ipynb'))
         if len(notebooks) != 0:
             nb_dir_list.append(d)
+            nb_lists[d] = notebooks
         for nbfile in notebooks:
             print(nbfile)
             
     if len(nb_dir_list) == 0:
         print("  none")
-        sys.exit()
+        return [], []
  
     print("Will run notebooks and make htmls in these subdirectories:")
     for nbdir in nb_dir_list:
         print("   ",nbdir)
 
-    ans = input("Ok? ")
-    if ans.lower() not in ['y','yes']:
-        print("Aborting.")
-        sys.exit()
+    if not yes:
+        ans = input("Ok? ")
+        if ans.lower() not in ['y','yes']:
+            print("Aborting.")
+            sys.exit(1)
     
     fname_output = 'make_nb_output.txt'
     fout = open(fname_output, 'w')
@@ -192,54 +850,99 @@ def make_notebook_htmls(examples_dir = '.',make_clean_first=False, env=None):
     ferr = open(fname_errors, 'w')
     ferr.write("ALL ERRORS FROM RUNNING NOTEBOOKS\n\n")
 
-    os.chdir(examples_dir)
+    if log_dir is None:
+        tmp_log_dir = tempfile.TemporaryDirectory(prefix='make_nb_logs_')
+        log_dir = tmp_log_dir.name
+    else:
+        tmp_log_dir = None
+        log_dir = os.path.abspath(log_dir)
+        os.makedirs(log_dir, exist_ok=True)
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
 
-    goodlist_run = []
+    if make_clean_first:
+        for directory in nb_dir_list:
+            # Run 'make clean':
+            job = subprocess.Popen(['make','clean'], cwd=directory, \
+                      stdout=fout,stderr=ferr)
+            job.wait()
+
+    records = []
     badlist_run = []
-    
-    import subprocess
-    for directory in nb_dir_list:
 
+    with ThreadPoolExecutor(max_workers=nprocs) as executor:
+        futures = {}
+        for directory in nb_dir_list:
+            log_bases = dict((nbfile, os.path.join(log_dir,
+                                        _log_name(examples_dir, nbfile)))
+                             for nbfile in nb_lists[directory])
+            future = executor.submit(_run_notebooks, directory,
+                                     nb_lists[directory], log_bases,
+                                     my_env, cache_dir)
+            futures[future] = (directory, log_bases)
+
+        for future in as_completed(futures):
+            directory, log_bases = futures[future]
+            for record in future.result():
+                nbfile = record['notebook']
+                log_base = log_bases[nbfile]
+                records.append(record)
+
+                for f, suffix in [(fout, '_output.txt'),
+                                  (ferr, '_errors.txt')]:
+                    f.write("\n=============================================\n")
+                    f.write(nbfile)
+                    f.write("\n=============================================\n")
+                    with open(log_base + suffix) as flog:
+                        f.write(flog.read())
+                    f.flush()
+
+                if record['return_code'] == 0:
+                    print("Successful run of %s (%.1f s%s)" \
+                          % (nbfile, record['time'],
+                             ', cached' if record['cached'] else ''))
+                else:
+                    print("*** Run errors encountered in %s: see %s" \
+                          % (nbfile, fname_errors if tmp_log_dir is not None
+                                     else log_base + '_errors.txt'))
+                    if directory not in badlist_run:
+                        badlist_run.append(directory)
+
+    goodlist_run = [d for d in nb_dir_list if d not in badlist_run]
+
+    for directory in nb_dir_list:
         fout.write("\n=============================================\n")
         fout.write(directory)
         fout.write("\n=============================================\n")
         ferr.write("\n=============================================\n")
         ferr.write(directory)
         ferr.write("\n=============================================\n")
-
-        os.chdir(directory)
-
-        # flush I/O buffers:
         fout.flush()
         ferr.flush()
 
-        if make_clean_first:
-            # Run 'make clean':
-            job = subprocess.Popen(['make','clean'], \
-                      stdout=fout,stderr=ferr)
-            return_code = job.wait()
-                
-        # Run 'make notebook_htmls':
-        job = subprocess.Popen(['make','notebook_htmls'], \
+        # remake README.html in case it links to the notebooks:
+        job = subprocess.Popen(['make','README.html'], cwd=directory, \
                   stdout=fout,stderr=ferr,env=my_env)
         return_code = job.wait()
-                
-        if return_code == 0:
-            print("Successful run\n")
-            goodlist_run.append(directory)
-        else:
-            print("*** Run errors encountered: see %s\n" % fname_errors)
-            badlist_run.append(directory)
-
-        job = subprocess.Popen(['make','README.html'], \
-                  stdout=fout,stderr=ferr,env=my_env)
-        return_code = job.wait()
-        
+
         if return_code != 0:
             print("*** problems making README.html in %s" % directory)
 
+    records.sort(key=lambda r: r['time'], reverse=True)
+    if report is not None:
+        with open(report, 'w') as f:
+            json.dump(records, f, indent=1)
+
     print('------------------------------------------------------------- ')
     print(' ')
+    print('Execution time of each notebook:')
+    for r in records:
+        status = 'ok' if r['return_code'] == 0 else 'failed'
+        if r['cached']:
+            status = 'cached'
+        print('   %8.1f s  %-6s  %s' % (r['time'], status, r['notebook']))
+    print(' ')
     print('Ran "make notebook_htmls" in directories:')
     if len(goodlist_run) == 0:
         print('   None')
@@ -260,9 +963,80 @@ def make_notebook_htmls(examples_dir = '.',make_clean_first=False, env=None):
     ferr.close()
     print('For all output see ', fname_output)
     print('For all errors see ', fname_errors)
+    if tmp_log_dir is not None:
+        tmp_log_dir.cleanup()
+    else:
+        print('For the output of each notebook see ', log_dir)
+    if report is not None:
+        print('For the execution time of each notebook see ', report)
+
+    return goodlist_run, badlist_run
+
+def main(argv=None):
+    """
+    Command line interface to make_all and make_notebook_htmls.
+
+    Returns the exit status: 0 if every example (and notebook) ran
+    successfully, 1 if any failed.  Without --yes the user is asked for
+    confirmation as before, and declining also exits with status 1.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+                description="Run 'make all' in every example directory.")
+    parser.add_argument('examples_dir', nargs='?', default='.',
+                        help="directory to search for examples (default: .)")
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help="do not ask for confirmation")
+    parser.add_argument('--clean', action='store_true',
+                        help="run 'make clean' in each example first")
+    parser.add_argument('--notebooks', action='store_true',
+                        help="also run 'make notebook_htmls'")
+    parser.add_argument('-j', '--nprocs', type=int, default=1,
+                        help="number of examples or notebook directories "
+                             "to run at once (default: 1)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip examples whose inputs are unchanged "
+                             "since they last ran successfully, "
+                             "requires --manifest")
+    parser.add_argument('--manifest', metavar='FILE',
+                        help="JSON file recording the examples that ran "
+                             "successfully, e.g. make_all_manifest.json")
+    parser.add_argument('--log-dir', metavar='DIR',
+                        help="keep the output and errors of each example "
+                             "and notebook in DIR, e.g. make_all_logs")
+    parser.add_argument('--report', metavar='NAME',
+                        help="write run times and resources used to "
+                             "NAME.json and NAME.html, and the execution "
+                             "times of notebooks to NAME_notebooks.json")
+    parser.add_argument('--nb-cache', metavar='DIR',
+                        help="reuse the html files of notebooks unchanged "
+                             "since they last ran successfully, kept in DIR")
+    args = parser.parse_args(argv)
+    if args.incremental and args.manifest is None:
+        parser.error("--incremental requires --manifest")
+
+    goodlist, badlist = make_all(args.examples_dir,
+                                 make_clean_first=args.clean, yes=args.yes,
+                                 nprocs=args.nprocs, log_dir=args.log_dir,
+                                 report=args.report,
+                                 incremental=args.incremental,
+                                 manifest=args.manifest)
+    if args.notebooks:
+        nb_report = None if args.report is None \
+                    else args.report + '_notebooks.json'
+        nb_goodlist, nb_badlist = make_notebook_htmls(args.examples_dir,
+                                              make_clean_first=args.clean,
+                                              yes=args.yes,
+                                              nprocs=args.nprocs,
+                                              cache_dir=args.nb_cache,
+                                              log_dir=args.log_dir,
+                                              report=nb_report)
+        badlist = badlist + nb_badlist
+
+    return 1 if badlist else 0
 
-    os.chdir(current_dir)
 
 if __name__=='__main__':
     import sys
-    make_all(*sys.argv[1:])
+    sys.exit(main())
@@ -9,8 +9,15 @@ The main function provided is
 which takes a list of cases to run, the number of processors to use, and
 a function that runs a single case as input.
 
+Cases are handed to the processes one at a time as processes become free,
+so a mix of short and long cases keeps all processes busy.  If an estimate
+of the cost of each case is provided via the *cost* argument, the most
+expensive cases are started first, which minimizes the total run time.
+
 *caselist* is a list of dictionaries.
 Each dictionary should define whatever parameters are needed for one case.
+The functions factorial_cases, latin_hypercube_cases and sobol_cases make
+such lists from the values or ranges of named parameters.
 
 Example:
 
@@ -25,9 +32,21 @@ with nprocs=3, where:
 
     make_all_cases_sample makes 7 such cases.
 
+Command line use:
+
+    python -m clawpack.clawutil.multip_tools NPROCS --cases run_cases.py
+           [--retries N] [--ledger sweep_ledger.db] [--only-failed]
+           [--cost KEY] [--cores N] [--abort-time SECONDS]
+
+runs the cases returned by make_cases() in the file run_cases.py with the
+function run_one_case(case) defined in that file, or with
+clawmultip_tools.run_one_case_clawpack if there is none.  It starts
+immediately unless --abort-time is given and exits with status 1 if any
+case failed, so it can be used from batch schedulers.  See main.
+
 NOTE:
 
-Because uses multiprocessing.Pool, you can only call run_many_cases_pool
+Because uses a pool of processes, you can only call run_many_cases_pool
 from a main program, i.e. following
     if __name__ == '__main__':
 in your Python code, not elsewhere in a module and not from an interactive
@@ -38,34 +57,849 @@ shell.  See:
 
 from numpy import *
 import os, time, shutil, sys
+from contextlib import contextmanager
 from multiprocessing import Process, current_process
 
 
 setplot_file = os.path.abspath('setplot.py')
 
 
-def run_many_cases_pool(caselist, nprocs, run_one_case, abort_time=5):
+def order_by_cost(caselist, cost=None):
+    """
+    Return a new list of the cases in *caselist* with the most expensive
+    cases first.
+
+    *cost* gives an estimate of the relative run time of each case, either
+    a function cost(case) returning a number, or a key so that case[cost]
+    is used, e.g. cost='num_cells' if each case has such an entry.
+
+    Cases for which the cost is unknown (the function returns None or the
+    case has no such key) come first, in their original order, followed by
+    the others sorted by decreasing cost.  If *cost* is None, the order
+    of *caselist* is unchanged.
+    """
+
+    return [caselist[k] for k in _cost_order(caselist, cost)]
+
+
+def _cost_order(caselist, cost):
+    """Indices of *caselist* in the order described in order_by_cost."""
+
+    if cost is None:
+        return list(range(len(caselist)))
+
+    if callable(cost):
+        costs = [cost(case) for case in caselist]
+    else:
+        costs = [case.get(cost, None) for case in caselist]
+
+    unknown = [k for k,c in enumerate(costs) if c is None]
+    known = [k for k,c in enumerate(costs) if c is not None]
+    # sorted is stable, so cases of equal cost keep their order:
+    known = sorted(known, key=lambda k: costs[k], reverse=True)
+    return unknown + known
+
+
+def run_case(run_one_case, case, cpus=None):
+    """
+    Run a single *case* with *run_one_case* and capture the outcome.
+
+    If *cpus* is a list of CPU numbers, OMP_NUM_THREADS is set to the
+    number of CPUs and the process (and so the Clawpack executable it
+    starts) is restricted to these CPUs while the case runs.
+
+    Returns a dictionary with entries
+        'status': 'ok' or 'failed'
+        'result': value returned by run_one_case (None if it failed)
+        'traceback': formatted traceback of the exception, or None
+        'start', 'end': time.time() when the case started and ended
+        'pid': process id of the process that ran the case
+        'case_name', 'outdir': case['case_name'] and case['outdir'] if set
+        'cpus': the list *cpus*
+
+    Exceptions raised by run_one_case are caught, so that one failing
+    case does not stop the other cases of a sweep.
+    """
+
+    import traceback
+
+    result = {'status': 'ok',
+              'result': None,
+              'traceback': None,
+              'start': time.time(),
+              'end': None,
+              'pid': os.getpid(),
+              'case_name': case.get('case_name', None),
+              'outdir': case.get('outdir', None),
+              'cpus': cpus}
+
+    if cpus is not None:
+        omp_num_threads = os.environ.get('OMP_NUM_THREADS', None)
+        os.environ['OMP_NUM_THREADS'] = str(len(cpus))
+        if hasattr(os, 'sched_setaffinity'):
+            affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, cpus)
+
+    try:
+        result['result'] = run_one_case(case)
+    except Exception:
+        result['status'] = 'failed'
+        result['traceback'] = traceback.format_exc()
+    finally:
+        if cpus is not None:
+            # the worker process may be reused for other cases:
+            if omp_num_threads is None:
+                del os.environ['OMP_NUM_THREADS']
+            else:
+                os.environ['OMP_NUM_THREADS'] = omp_num_threads
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, affinity)
+
+    result['end'] = time.time()
+    return result
+
+
+def case_threads(case):
+    """
+    Number of threads used by *case*: case['threads'] if set, otherwise
+    the value of the environment variable OMP_NUM_THREADS, or 1.
+    """
+    threads = case.get('threads', None)
+    if not threads:
+        threads = os.environ.get('OMP_NUM_THREADS', None) or 1
+    return int(threads)
+
+
+def _available_cpus():
+    """Sorted list of the CPU numbers this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def _lost_case(case, exception):
+    """Result of a case whose worker process died, see run_case."""
+
+    return {'status': 'failed',
+            'result': None,
+            'traceback': '%s: %s\n' % (type(exception).__name__, exception),
+            'start': None,
+            'end': time.time(),
+            'pid': None,
+            'case_name': case.get('case_name', None),
+            'outdir': case.get('outdir', None),
+            'cpus': None}
+
+
+def _skipped_case(case, entry):
+    """Result of a case not run because of its ledger *entry*."""
+
+    if entry is None:
+        entry = {'start': None, 'end': None, 'pid': None, 'attempts': 0}
+    return {'status': 'skipped',
+            'result': None,
+            'traceback': None,
+            'start': entry['start'],
+            'end': entry['end'],
+            'pid': entry['pid'],
+            'attempts': entry['attempts'],
+            'case_name': case.get('case_name', None),
+            'outdir': case.get('outdir', None),
+            'cpus': None}
+
+
+def write_sweep_summary(results, fname='sweep_summary.txt'):
+    """
+    Write a table summarizing the *results* of run_many_cases_pool to the
+    file *fname*, followed by the tracebacks of any failed cases.
+    """
+
+    def timestr(t):
+        if t is None:
+            return '-'
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+    rows = []
+    for k,result in enumerate(results):
+        if result['start'] is not None and result['end'] is not None:
+            elapsed = '%.1f' % (result['end'] - result['start'])
+        else:
+            elapsed = '-'
+        rows.append((str(result['case_name'] if result['case_name']
+                                               is not None else k),
+                     result['status'], str(result['attempts']),
+                     str(result['pid'] or '-'),
+                     timestr(result['start']), timestr(result['end']),
+                     elapsed, str(result['outdir'] or '-')))
+
+    header = ('case', 'status', 'attempts', 'pid', 'start', 'end',
+              'elapsed (s)', 'outdir')
+    widths = [int(max([len(row[j]) for row in rows + [header]]))
+              for j in range(len(header))]
+
+    num_failed = len([r for r in results if r['status'] == 'failed'])
+    with open(fname, 'w') as f:
+        f.write('Sweep of %i cases, %i failed, written %s\n\n' \
+                % (len(results), num_failed, timestr(time.time())))
+        for row in [header] + rows:
+            f.write('  '.join(v.ljust(w) for v,w in zip(row,widths)).rstrip()
+                    + '\n')
+        for k,result in enumerate(results):
+            if result['traceback']:
+                f.write('\n========= case %s failed, attempt %s:\n%s' \
+                        % (rows[k][0], result['attempts'],
+                           result['traceback']))
+
+
+def _json_value(value):
+    """Convert *value* to something json can write, see append_records."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()   # numpy arrays and scalars
+    return str(value)
+
+
+def case_record(case, result):
+    """
+    Flat dictionary describing one finished *case* and its *result* from
+    run_many_cases_pool, one line of the records file, see append_records.
+
+    The entries are the parameters of the case followed by
+        'status', 'attempts', 'pid', 'start', 'end', 'elapsed', 'cpus'
+    and, if the case was post-processed, 'post_status' and 'post_elapsed'.
+    """
+
+    def elapsed(r):
+        if r.get('start') is None or r.get('end') is None:
+            return None
+        return r['end'] - r['start']
+
+    record = dict(case)
+    record['case_name'] = result['case_name']
+    record['outdir'] = result['outdir']
+    for key in ['status', 'attempts', 'pid', 'start', 'end', 'cpus']:
+        record[key] = result.get(key, None)
+    record['elapsed'] = elapsed(result)
+    post = result.get('post', None)
+    if post is not None:
+        record['post_status'] = post['status']
+        record['post_elapsed'] = elapsed(post)
+    return record
+
+
+def append_records(fname, records):
+    """
+    Append the dictionaries *records* to the file *fname*, one JSON object
+    per line.
+
+    The file is locked with fcntl.flock while writing, so several processes,
+    e.g. the workers of a sweep or several sweeps in the same directory,
+    can append to the same file without interleaving their lines.  Where
+    fcntl is not available, e.g. on Windows, the file is not locked.
+    Values json cannot represent are written as lists (numpy arrays) or
+    strings.
+    """
+
+    import json
+
+    lines = ''.join(json.dumps(record, default=_json_value) + '\n'
+                    for record in records)
+    with open(fname, 'a') as f:
+        with _locked(f, exclusive=True):
+            f.write(lines)
+            f.flush()
+
+
+@contextmanager
+def _locked(f, exclusive):
+    """
+    Hold an fcntl lock on the open file *f*, exclusive or shared, while
+    the context is active.  No lock is taken where fcntl is not available.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_records(fname, latest=True):
+    """
+    Load a file written by append_records as a table, a dictionary mapping
+    each column name to a numpy array with one entry per record, e.g.
+
+        table = load_records('sweep_records.jsonl')
+        ok = table['status'] == 'ok'
+        print(table['case_name'][ok], table['elapsed'][ok])
+
+    Columns whose values are all numbers are float arrays, with nan for
+    missing values, all other columns are object arrays with None for
+    missing values.  If *latest* is True, only the last record of each
+    case_name is kept, so cases run again in a later sweep are not
+    counted twice.
+
+    This does not require pandas, but pandas.DataFrame(table) gives a
+    DataFrame if it is available.
+    """
+
+    import json
+    import numpy
+
+    with open(fname) as f:
+        with _locked(f, exclusive=False):
+            lines = f.readlines()
+
+    records = [json.loads(line) for line in lines if line.strip()]
+    if latest:
+        last = {}
+        for k,record in enumerate(records):
+            last[record.get('case_name', k)] = record
+        records = list(last.values())
+
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+
+    table = {}
+    for key in columns:
+        values = [record.get(key, None) for record in records]
+        given = [v for v in values if v is not None]
+        numeric = [v for v in given if isinstance(v, (int, float))
+                                        and not isinstance(v, bool)]
+        if given and len(numeric) == len(given):
+            table[key] = numpy.array([numpy.nan if v is None else v
+                                      for v in values], dtype=float)
+        else:
+            column = numpy.empty(len(values), dtype=object)
+            column[:] = values
+            table[key] = column
+    return table
+
+
+class CaseLedger(object):
+    """
+    Persistent record of the cases of a parameter sweep, stored in an
+    sqlite database file *fname*, by default sweep_ledger.db in the
+    directory where the sweep is run.
+
+    Each case is identified by case_hash(case) and its row records the
+    case_name, outdir, state, number of attempts, pid, start and end time
+    and the traceback of the last failure.  The state is one of
+        'started'   submitted for running, but not finished.  A case still
+                    in this state when a sweep starts was interrupted.
+        'completed' finished successfully
+        'failed'    failed in its last attempt
+
+    Passing a ledger to run_many_cases_pool lets a sweep be restarted:
+    completed cases are skipped, interrupted and new cases are run, and
+    only_failed=True reruns just the failed cases.
+
+    Only the process calling run_many_cases_pool writes to the ledger.
+    """
+
+    def __init__(self, fname='sweep_ledger.db'):
+        import sqlite3
+        self.fname = fname
+        self.connection = sqlite3.connect(fname, timeout=60)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS cases (
+                                        hash TEXT PRIMARY KEY,
+                                        case_name TEXT,
+                                        outdir TEXT,
+                                        state TEXT,
+                                        attempts INTEGER,
+                                        pid INTEGER,
+                                        start REAL,
+                                        end REAL,
+                                        traceback TEXT,
+                                        parameters TEXT)""")
+
+    def close(self):
+        self.connection.close()
+
+    def entry(self, case):
+        """
+        Return the ledger row of *case* as a dictionary, or None if the
+        case has not been recorded.
+        """
+        cursor = self.connection.execute("SELECT * FROM cases WHERE hash=?",
+                                         (case_hash(case),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([d[0] for d in cursor.description], row))
+
+    def state(self, case):
+        """Return the state of *case*, or None if it is not recorded."""
+        entry = self.entry(case)
+        return None if entry is None else entry['state']
+
+    def started(self, case):
+        """Record that *case* was submitted for running."""
+        import json
+        with self.connection:
+            self.connection.execute("""INSERT INTO cases
+                    (hash, case_name, outdir, state, attempts, parameters)
+                    VALUES (?, ?, ?, 'started', 0, ?)
+                    ON CONFLICT(hash) DO UPDATE SET state='started'""",
+                    (case_hash(case), case.get('case_name', None),
+                     case.get('outdir', None),
+                     json.dumps(case, sort_keys=True, default=repr)))
+
+    def finished(self, case, result):
+        """Record the *result* of *case* returned by run_case."""
+        state = 'completed' if result['status'] == 'ok' else 'failed'
+        with self.connection:
+            self.connection.execute("""UPDATE cases SET state=?,
+                    attempts=attempts+1, pid=?, start=?, end=?, traceback=?
+                    WHERE hash=?""",
+                    (state, result['pid'], result['start'], result['end'],
+                     result['traceback'], case_hash(case)))
+
+
+# Entries set by the build stage, clawmultip_tools.build_executables, that
+# depend on where and when the executable was built, not on the case:
+_build_keys = ('xclawcmd', 'xclawcmd_sha256')
+
+
+def case_hash(case):
+    """
+    Return a hash identifying the parameters in the dictionary *case*.
+    Values that cannot be written as JSON are represented by their repr.
+    The entries 'xclawcmd' and 'xclawcmd_sha256', which
+    clawmultip_tools.build_executables sets to the path and hash of a
+    freshly built executable, are left out, so that a case keeps its hash
+    when a sweep is restarted with new executables.
+    """
+    import hashlib
+    import json
+    params = dict((key, value) for key, value in case.items()
+                  if key not in _build_keys)
+    text = json.dumps(params, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def unique_cases(caselist):
+    """
+    Return *caselist* without the cases whose parameters are identical to
+    those of an earlier case, as identified by case_hash.
+    """
+    seen = set()
+    unique = []
+    for case in caselist:
+        h = case_hash(case)
+        if h not in seen:
+            seen.add(h)
+            unique.append(case)
+    return unique
+
+
+def _name_cases(points, base, name, outdir, plotdir, dedup):
+    """
+    Turn the parameter dictionaries *points* into cases, see
+    factorial_cases for the other arguments.
+    """
+
+    caselist = []
+    for point in points:
+        case = dict(base or {})
+        case.update(point)
+        caselist.append(case)
+    if dedup:
+        caselist = unique_cases(caselist)
+
+    for index,case in enumerate(caselist):
+        values = dict(case, index=index)
+        if callable(name):
+            case['case_name'] = name(case)
+        else:
+            case['case_name'] = name.format(**values)
+        values['case_name'] = case['case_name']
+        if outdir is not None:
+            case['outdir'] = outdir.format(**values)
+        if plotdir is not None:
+            case['plotdir'] = plotdir.format(**values)
+    return caselist
+
+
+def factorial_cases(parameters, base=None, name=None,
+                    outdir='_output_{case_name}', plotdir='_plots_{case_name}',
+                    dedup=True):
+    """
+    Make a caselist for run_many_cases_pool with one case for every
+    combination of the values in the dictionary *parameters*, which maps
+    parameter names to lists of values, e.g.
+
+        caselist = factorial_cases({'order': [1,2], 'mx': [50,100,200]},
+                                   base={'xclawcmd': 'xclaw'},
+                                   name='order{order}_mx{mx:04d}')
+
+    gives 6 cases.  Each case starts from a copy of the dictionary *base*
+    of parameters common to all cases.
+
+    *name* is a format string for case['case_name'] using the parameters of
+    the case and its position 'index' in the caselist, or a function of the
+    case returning the name.  By default the name lists the parameters
+    varied, e.g. 'order1_mx50'.  *outdir* and *plotdir* are format strings
+    that may also use 'case_name'; if None, case['outdir'] or
+    case['plotdir'] is not set.
+
+    If *dedup* is True, cases identical to an earlier case are dropped, see
+    unique_cases, e.g. if a parameter list contains a value twice.
+    """
+
+    import itertools
+
+    keys = list(parameters.keys())
+    points = [dict(zip(keys, values)) for values in
+              itertools.product(*[parameters[key] for key in keys])]
+    if name is None:
+        name = '_'.join('%s{%s}' % (key, key) for key in keys)
+    return _name_cases(points, base, name, outdir, plotdir, dedup)
+
+
+def _scale_points(unit_points, ranges):
+    """Map points in the unit cube to the box given by *ranges*."""
+    keys = list(ranges.keys())
+    points = []
+    for u in unit_points:
+        point = {}
+        for j,key in enumerate(keys):
+            low, high = ranges[key]
+            point[key] = float(low + u[j] * (high - low))
+        points.append(point)
+    return points
+
+
+def latin_hypercube_cases(ranges, num_cases, base=None, seed=None,
+                          name='case_{index:04d}',
+                          outdir='_output_{case_name}',
+                          plotdir='_plots_{case_name}', dedup=True):
+    """
+    Make a caselist of *num_cases* cases with parameters sampled by a Latin
+    hypercube design: the interval (low, high) given for each parameter in
+    the dictionary *ranges* is split into num_cases equal parts and every
+    part is sampled by exactly one case, e.g.
+
+        caselist = latin_hypercube_cases({'friction': (0.01, 0.05),
+                                          'amplitude': (0.5, 2.)}, 100,
+                                         base=base_case, seed=1)
+
+    *seed* makes the design reproducible, so the cases, their hashes and
+    thus their ledger entries and cached results are the same each time
+    the sweep is set up.  See factorial_cases for the other arguments.
+    """
+
+    import numpy
+
+    rng = numpy.random.default_rng(seed)
+    num_params = len(ranges)
+    strata = numpy.array([rng.permutation(num_cases)
+                          for j in range(num_params)]).T
+    unit_points = (strata + rng.random((num_cases, num_params))) / num_cases
+    return _name_cases(_scale_points(unit_points, ranges), base, name,
+                       outdir, plotdir, dedup)
+
+
+def sobol_cases(ranges, num_cases, base=None, seed=None, scramble=True,
+                name='case_{index:04d}', outdir='_output_{case_name}',
+                plotdir='_plots_{case_name}', dedup=True):
+    """
+    Make a caselist of *num_cases* cases with parameters taken from a Sobol
+    sequence over the intervals (low, high) given for each parameter in
+    the dictionary *ranges*.  The cases cover the parameter space more
+    evenly than random samples, and num_cases should be a power of 2.
+
+    Requires scipy.stats.qmc.  See latin_hypercube_cases and
+    factorial_cases for the other arguments.
+    """
+
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise ImportError("sobol_cases requires scipy >= 1.7, use "
+                          "latin_hypercube_cases instead")
+
+    sampler = qmc.Sobol(d=len(ranges), scramble=scramble, seed=seed)
+    unit_points = sampler.random(num_cases)
+    return _name_cases(_scale_points(unit_points, ranges), base, name,
+                       outdir, plotdir, dedup)
+
+
+def run_many_cases_pool(caselist, nprocs, run_one_case, abort_time=5,
+                        cost=None, retries=0,
+                        summary_file=None, records_file=None,
+                        ledger=None, only_failed=False, cores=None,
+                        post_process=None, post_nprocs=1):
     """
     Split up cases in *caselist* between the *nprocs* processors.
     Each case is a dictionary of parameters for that case.
-    Uses multiprocessing.Pool to assign cases to processes.
+    Uses concurrent.futures.ProcessPoolExecutor to assign cases to
+    processes, one case at a time as processes become available.
 
     *run_one_case* should be a function with a single input *case*
     that runs a single case.
 
+    *cost* is an optional estimate of the run time of each case, either
+    a function cost(case) or a key of the case dictionaries, see
+    order_by_cost.  The most expensive cases are started first, so that
+    long cases do not start last and leave the other processors idle.
+    For Clawpack runs, clawmultip_tools.case_cost_clawpack can be used.
+
+    A case that raises an exception, or whose process dies, does not stop
+    the other cases.  It is run again up to *retries* more times.  If a
+    process dies while several cases are running, the pool is replaced
+    and these cases are run again one at a time, without counting the
+    lost run as an attempt, so that only the case killing its process
+    uses up its attempts.
+
+    *ledger* is an optional CaseLedger, or the file name of one, recording
+    the state of every case so that an interrupted sweep can be restarted
+    by calling this function again with the same caselist.  Cases that
+    the ledger lists as completed are skipped.  If *only_failed* is True,
+    only the cases that failed in a previous sweep are run.
+
+    If *cores* is given, the cases are packed onto that many cores instead
+    of simply running *nprocs* cases at once.  Each case uses
+    case_threads(case) OpenMP threads, i.e. case['threads'] or by default
+    OMP_NUM_THREADS, and a case is only started when enough cores are
+    free, so the total number of threads never exceeds *cores*.  Smaller
+    cases further down the list are started if the next case does not fit.
+    Each case runs with OMP_NUM_THREADS set to its number of threads and,
+    where supported, is bound to its own cores.  A case needing more than
+    *cores* threads runs alone on all cores.  *nprocs* still limits the
+    number of cases run at once, so set it to at least *cores* divided by
+    the smallest number of threads per case.  A case is only handed to the
+    pool when one of its *nprocs* processes is free, so cores are never
+    reserved for a case still waiting for a process.
+
+    *post_process* is an optional second stage, a function of a single
+    input *case* such as clawmultip_tools.plot_case_clawpack, run in a
+    separate pool of *post_nprocs* processes after run_one_case completed
+    a case successfully.  Post-processing of finished cases then overlaps
+    with running the next cases, and each stage has its own number of
+    processes.  The outcome of post_process, as described in run_case, is
+    stored in the result of the case as 'post', and a failure of
+    post_process marks the case as failed.  Failed post-processing is
+    not retried.
+
     Prints out what will be done and then waits abort_time seconds
-    before continuing, so user can abort if necessary.
+    before continuing, so user can abort if necessary.  Set abort_time
+    to 0 or None to start immediately, e.g. in batch jobs.
+
+    Returns a list with one dictionary per case, in the order of
+    *caselist*, as described in run_case, with the additional entry
+    'attempts' giving the number of times the case was run.  Cases not
+    run because of the ledger have status 'skipped'.  If *summary_file* is
+    not None, e.g. 'sweep_summary.txt', a table of these results is written
+    to that file at the end, see write_sweep_summary.  If *records_file* is
+    not None, e.g. 'sweep_records.jsonl', a line describing each case, with
+    its parameters, status and timings, is appended to that file as soon as
+    the case is finished, see case_record and load_records.
     """
 
-    from multiprocessing import Pool, TimeoutError
+    from concurrent.futures import (ProcessPoolExecutor, wait,
+                                    FIRST_COMPLETED)
+    from concurrent.futures.process import BrokenProcessPool
+
+    own_ledger = isinstance(ledger, str)
+    if own_ledger:
+        ledger = CaseLedger(ledger)
+
+    results = [None] * len(caselist)
+    attempts = [0] * len(caselist)
+    pending = []
+    for k in _cost_order(caselist, cost):
+        state = ledger.state(caselist[k]) if ledger is not None else None
+        if state == 'completed' or (only_failed and state != 'failed'):
+            results[k] = _skipped_case(caselist[k], ledger.entry(caselist[k]))
+        else:
+            pending.append(k)
+
+    if ledger is not None:
+        print("\n%s of %s cases are skipped based on the ledger %s" \
+              % (len(caselist) - len(pending), len(caselist), ledger.fname))
+    num_run = len(pending)
+    print("\n%s cases will be run on %s processors" % (num_run,nprocs))
+    if abort_time:
+        print("You have %s seconds to abort..." % abort_time)
+        time.sleep(abort_time) # give time to abort
+
+    if cores:
+        cpu_list = _available_cpus()[:cores]
+        if len(cpu_list) < cores:
+            print("*** Warning: only %s of the requested %s cores are "
+                  "available" % (len(cpu_list), cores))
+        print("Cases will use at most %s threads on cores %s" \
+              % (len(cpu_list), cpu_list))
+
+    post_executor = None
+    if post_process is not None:
+        post_executor = ProcessPoolExecutor(max_workers=post_nprocs)
+    post_futures = {}
+
+    def finish(k, result):
+        results[k] = result
+        if ledger is not None:
+            ledger.finished(caselist[k], result)
+        if records_file is not None:
+            append_records(records_file, [case_record(caselist[k], result)])
+
+    def post_submit(k):
+        try:
+            post_future = post_executor.submit(run_case, post_process,
+                                               caselist[k])
+        except RuntimeError as e:
+            # BrokenProcessPool
+            finish_post(k, _lost_case(caselist[k], e))
+            return
+        post_futures[post_future] = k
 
-    print("\n%s cases will be run on %s processors" % (len(caselist),nprocs))
-    print("You have %s seconds to abort..." % abort_time)
+    def finish_post(k, post):
+        result = results[k]
+        result['post'] = post
+        if post['status'] != 'ok':
+            result['status'] = 'failed'
+            result['traceback'] = post['traceback']
+        finish(k, result)
 
-    time.sleep(abort_time) # give time to abort
+    # cases running when a worker process died, to be run one at a time:
+    suspects = []
+    while pending or suspects:
+        # cases to run in a new pool after a worker process died:
+        restart = []
+        # cases running in this pool when a worker process died:
+        lost = []
+        isolated = len(suspects) > 0
+        if isolated:
+            # each case runs alone, so a case killing its process is known
+            queue, workers, suspects = suspects, 1, []
+        else:
+            queue, workers, pending = pending, nprocs, []
+        free_cpus = list(cpu_list) if cores else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
 
-    with Pool(processes=nprocs) as pool:
-        pool.map(run_one_case, caselist)
+            def submit(k, cpus):
+                try:
+                    future = executor.submit(run_case, run_one_case,
+                                             caselist[k], cpus)
+                except RuntimeError:
+                    # BrokenProcessPool, the pool cannot be used any more
+                    restart.append(k)
+                    if cpus is not None:
+                        free_cpus.extend(cpus)
+                    return
+                attempts[k] += 1
+                futures[future] = (k, cpus)
+                if ledger is not None:
+                    ledger.started(caselist[k])
+
+            def dispatch():
+                # hand a case to the pool only when a worker is free, so
+                # that cores are reserved only for cases actually running
+                while queue and len(futures) < workers:
+                    if free_cpus is None:
+                        submit(queue.pop(0), None)
+                        continue
+                    # first case in queue that fits on the free cores:
+                    fits = [j for j,k in enumerate(queue)
+                            if case_threads(caselist[k]) <= len(free_cpus)]
+                    if fits:
+                        j = fits[0]
+                    elif not futures:
+                        j = 0  # needs more than all cores, run it alone
+                    else:
+                        break
+                    k = queue.pop(j)
+                    # a case needing more than all cores gets all cores:
+                    cpus = sorted(free_cpus)[:case_threads(caselist[k])]
+                    for cpu in cpus:
+                        free_cpus.remove(cpu)
+                    submit(k, cpus)
+
+            dispatch()
+
+            while futures or post_futures:
+                done, _ = wait(list(futures) + list(post_futures),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in post_futures:
+                        k = post_futures.pop(future)
+                        try:
+                            post = future.result()
+                        except Exception as e:
+                            post = _lost_case(caselist[k], e)
+                        finish_post(k, post)
+                        continue
+
+                    k, cpus = futures.pop(future)
+                    if cpus is not None:
+                        free_cpus.extend(cpus)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        lost.append((k, e))
+                        continue
+                    except Exception as e:
+                        result = _lost_case(caselist[k], e)
+                    result['attempts'] = attempts[k]
+                    if result['status'] == 'ok' and post_executor is not None:
+                        results[k] = result
+                        post_submit(k)
+                        continue
+                    finish(k, result)
+                    if result['status'] != 'ok' and attempts[k] <= retries:
+                        print('Case %s failed, retrying (attempt %i of %i)' \
+                              % (result['case_name'] or k, attempts[k] + 1,
+                                 retries + 1))
+                        queue.insert(0, k)
+                dispatch()
+
+        if isolated:
+            suspects, restart = restart, []
+        if len(lost) == 1:
+            # the only case running must have killed its process
+            k, e = lost[0]
+            result = _lost_case(caselist[k], e)
+            result['attempts'] = attempts[k]
+            finish(k, result)
+            if attempts[k] <= retries:
+                print('Case %s failed, retrying (attempt %i of %i)' \
+                      % (result['case_name'] or k, attempts[k] + 1,
+                         retries + 1))
+                restart.insert(0, k)
+        else:
+            # not known which case killed its process, charge none of them
+            for k, e in lost:
+                attempts[k] -= 1
+                suspects.append(k)
+            if lost:
+                print('A worker process died, rerunning %i cases one at a '
+                      'time' % len(lost))
+        pending = restart + pending
+
+    if post_executor is not None:
+        post_executor.shutdown()
+
+    if own_ledger:
+        ledger.close()
+
+    num_failed = len([r for r in results if r['status'] == 'failed'])
+    print('%i of %i cases completed successfully' \
+          % (num_run - num_failed, num_run))
+
+    if summary_file is not None:
+        write_sweep_summary(results, summary_file)
+        print('Summary of all cases in %s' % summary_file)
+
+    return results
 
 
 
@@ -147,15 +981,86 @@ def run_one_case_sample(case):
     sys.stderr = sys_stderr
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command line interface to run_many_cases_pool, see the module docstring.
+
+    Without --cases, the sample cases of make_all_cases_sample are run.
+    Returns the exit status: 0 if all cases completed (or were skipped),
+    1 if any case failed.
+    """
 
-    # Sample code...
+    import argparse
+    import importlib.util
 
-    if len(sys.argv) > 1:
-        nprocs = int(sys.argv[1])
+    parser = argparse.ArgumentParser(
+                description="Run a list of cases on several processors.")
+    parser.add_argument('nprocs', nargs='?', type=int, default=1,
+                        help="number of cases to run at once (default: 1)")
+    parser.add_argument('--cases', default=None,
+                        help="Python file defining make_cases() and "
+                             "optionally run_one_case(case)")
+    parser.add_argument('--retries', type=int, default=0,
+                        help="number of times to rerun a failed case")
+    parser.add_argument('--ledger', default=None,
+                        help="sqlite ledger file used to skip completed "
+                             "cases, e.g. sweep_ledger.db")
+    parser.add_argument('--only-failed', action='store_true',
+                        help="only rerun cases the ledger lists as failed")
+    parser.add_argument('--cost', default=None,
+                        help="case key estimating the cost of each case")
+    parser.add_argument('--cores', type=int, default=None,
+                        help="pack cases using case['threads'] OpenMP "
+                             "threads each onto this many cores")
+    parser.add_argument('--abort-time', type=float, default=0,
+                        help="seconds to wait before starting (default: 0)")
+    parser.add_argument('--summary-file', default='sweep_summary.txt',
+                        help="table of the results of all cases "
+                             "(default: sweep_summary.txt)")
+    parser.add_argument('--records-file', default='sweep_records.jsonl',
+                        help="JSON lines file the record of each case is "
+                             "appended to (default: sweep_records.jsonl)")
+    args = parser.parse_args(argv)
+
+    if args.only_failed and args.ledger is None:
+        parser.error("--only-failed requires --ledger")
+
+    if args.cases is None:
+        caselist = make_all_cases_sample()
+        run_one_case = run_one_case_sample
     else:
-        nprocs = 1
+        module_name = os.path.splitext(os.path.basename(args.cases))[0]
+        spec = importlib.util.spec_from_file_location(module_name,
+                                                      args.cases)
+        cases_module = importlib.util.module_from_spec(spec)
+        # register the module so worker processes can find run_one_case:
+        sys.modules[module_name] = cases_module
+        spec.loader.exec_module(cases_module)
+        caselist = cases_module.make_cases()
+        if hasattr(cases_module, 'run_one_case'):
+            run_one_case = cases_module.run_one_case
+        else:
+            from clawpack.clawutil import clawmultip_tools
+            run_one_case = clawmultip_tools.run_one_case_clawpack
+
+    results = run_many_cases_pool(caselist, args.nprocs, run_one_case,
+                                  abort_time=args.abort_time,
+                                  cost=args.cost, retries=args.retries,
+                                  ledger=args.ledger,
+                                  only_failed=args.only_failed,
+                                  cores=args.cores,
+                                  summary_file=args.summary_file,
+                                  records_file=args.records_file)
+
+    if args.cases is None:
+        print("Done... See files caseN_out.txt for python output from each "
+              "case")
+
+    num_failed = len([r for r in results if r['status'] == 'failed'])
+    return 1 if num_failed > 0 else 0
+
+
+if __name__ == "__main__":
 
-    caselist = make_all_cases_sample()
-    run_many_cases_pool(caselist, nprocs, run_one_case=run_one_case_sample)
-    print("Done... See files caseN_out.txt for python output from each case")
+    # Sample code, or cases given with --cases:
+    sys.exit(main())
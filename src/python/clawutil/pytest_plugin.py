@@ -0,0 +1,49 @@
+r"""
+pytest plugin for Clawpack regression tests.
+
+Enable the plugin in a ``conftest.py`` file::
+
+    pytest_plugins = ["clawpack.clawutil.pytest_plugin"]
+
+It provides
+
+- the ``--claw-shared-build`` command line option, which makes
+  ``ClawpackTestRunner.build_executable`` build every example only once per
+  session and link the executable into each test's temporary directory,
+- the session scoped ``claw_executables`` fixture returning the
+  :class:`~clawpack.clawutil.builds.ExecutableRegistry` of the session, for
+  tests that want to request executables explicitly::
+
+      def test_adjoint(tmp_path, claw_executables):
+          xclaw = claw_executables.executable_for(adjoint_path)
+          ...
+
+The cached executables are placed in a temporary directory removed at the
+end of the session, or in ``$CLAW_TEST_EXE_CACHE`` if that is set.
+"""
+
+import pytest
+
+import clawpack.clawutil.test as claw_test
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("clawpack")
+    group.addoption("--claw-shared-build", action="store_true", default=False,
+                    help="Build each example executable once per session and "
+                         "share it between tests.")
+
+
+def pytest_configure(config):
+    if config.getoption("claw_shared_build"):
+        claw_test.ClawpackTestRunner.shared_build = True
+
+
+def pytest_sessionfinish(session, exitstatus):
+    claw_test.executable_registry().close()
+
+
+@pytest.fixture(scope="session")
+def claw_executables():
+    r"""Session registry of shared example executables."""
+    return claw_test.executable_registry()
@@ -0,0 +1,368 @@
+r"""
+Versioned, compressed storage for regression baselines.
+
+A :class:`RegressionStore` keeps all baseline arrays of one test in a single
+zip file of ``.npy`` entries, so a test directory holds one compact file
+instead of many ``frameNNNN.txt`` and ``gaugeNNNNN.txt`` files.  Arrays are
+grouped into named *versions*, e.g. one per compiler or per set of
+``FFLAGS``, and only the arrays actually requested are read from disk.
+
+Layout of the container::
+
+    __store__.json                  format marker and per-version metadata
+    <version>/<name>.npy            one entry per array
+
+Names may themselves contain ``/`` to group related arrays, e.g.
+``default/gauge00001/t.npy`` and ``default/gauge00001/q.npy`` are returned
+together by ``store.load("gauge00001")``.  A plain ``.npz`` file written by
+``numpy.savez`` is read as a store whose only version is ``"default"``.
+
+Example::
+
+    with RegressionStore("regression_data/test_swirl.npz",
+                         version="gfortran-O3") as store:
+        store.save({"frame0001": sums})
+        reference = store.load("frame0001")
+
+The version used when none is given is taken from the environment variable
+``CLAW_REGRESSION_VERSION`` and defaults to ``"default"``.  Loading falls back
+to the ``"default"`` version if the requested version has no entry of that
+name.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+__all__ = ["RegressionStore", "DEFAULT_VERSION", "migrate_regression_data"]
+
+
+DEFAULT_VERSION = "default"
+_MANIFEST = "__store__.json"
+_FORMAT = 1
+
+
+class RegressionStore:
+    r"""
+    Container of versioned regression baselines backed by one zip file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Location of the container file.  It does not need to exist until
+        :meth:`save` is called.
+    version : str, optional
+        Default baseline version used by :meth:`load` and :meth:`save`.  If
+        omitted, ``$CLAW_REGRESSION_VERSION`` or ``"default"`` is used.
+
+    Notes
+    -----
+    The zip file is opened on first access and kept open until
+    :meth:`close` is called, which the context manager does automatically.
+    """
+
+    def __init__(self, path, version: Optional[str] = None):
+        self.path = Path(path)
+        if version is None:
+            version = os.environ.get("CLAW_REGRESSION_VERSION",
+                                     DEFAULT_VERSION)
+        self.version = version
+        self._zip = None
+        self._manifest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        r"""Close the underlying zip file if it is open."""
+        if self._zip is not None:
+            self._zip.close()
+        self._zip = None
+        self._manifest = None
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def _open(self):
+        if self._zip is None:
+            if not self.path.exists():
+                raise FileNotFoundError(
+                                f"Regression store not found: {self.path}")
+            self._zip = zipfile.ZipFile(self.path, "r")
+            if _MANIFEST in self._zip.namelist():
+                self._manifest = json.loads(self._zip.read(_MANIFEST))
+            else:
+                self._manifest = None
+        return self._zip
+
+    def _entries(self) -> dict:
+        r"""Map ``(version, name)`` to zip member names."""
+        zf = self._open()
+        entries = {}
+        for member in zf.namelist():
+            if not member.endswith(".npy"):
+                continue
+            key = member[:-len(".npy")]
+            if self._manifest is None:
+                # plain npz file written by numpy.savez
+                entries[(DEFAULT_VERSION, key)] = member
+            else:
+                version, _, name = key.partition("/")
+                entries[(version, name)] = member
+        return entries
+
+    def versions(self) -> list:
+        r"""Return the sorted list of versions in the store."""
+        if not self.path.exists():
+            return []
+        return sorted({version for version, _ in self._entries()})
+
+    def names(self, version: Optional[str] = None) -> list:
+        r"""Return the sorted entry names stored for *version*."""
+        version = self.version if version is None else version
+        if not self.path.exists():
+            return []
+        names = set()
+        for v, name in self._entries():
+            if v == version:
+                names.add(name)
+                # nested arrays are also available under their group name
+                while "/" in name:
+                    name = name.rsplit("/", 1)[0]
+                    names.add(name)
+        return sorted(names)
+
+    def metadata(self, version: Optional[str] = None) -> dict:
+        r"""Return the metadata recorded when *version* was last saved."""
+        version = self.version if version is None else version
+        if not self.path.exists():
+            return {}
+        self._open()
+        if self._manifest is None:
+            return {}
+        return dict(self._manifest.get("versions", {}).get(version, {}))
+
+    def _read(self, member: str) -> np.ndarray:
+        with self._open().open(member) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+    def load(self, name: str, version: Optional[str] = None,
+             fallback: bool = True):
+        r"""
+        Load entry *name* from the store.
+
+        Parameters
+        ----------
+        name : str
+            Entry name, e.g. ``"frame0001"``.
+        version : str, optional
+            Version to load from.  Defaults to the store's version.
+        fallback : bool, default True
+            If True and *version* has no entry *name*, load it from the
+            ``"default"`` version instead.
+
+        Returns
+        -------
+        numpy.ndarray or dict
+            The stored array, or a dict of arrays if *name* is a group of
+            nested entries such as ``"gauge00001"``.
+
+        Raises
+        ------
+        KeyError
+            If no entry named *name* exists.
+        """
+
+        version = self.version if version is None else version
+        candidates = [version]
+        if fallback and version != DEFAULT_VERSION:
+            candidates.append(DEFAULT_VERSION)
+
+        entries = self._entries() if self.path.exists() else {}
+        for v in candidates:
+            if (v, name) in entries:
+                return self._read(entries[(v, name)])
+            prefix = name + "/"
+            group = {n[len(prefix):]: member
+                     for (ver, n), member in entries.items()
+                     if ver == v and n.startswith(prefix)}
+            if group:
+                return {key: self._read(member)
+                        for key, member in group.items()}
+
+        raise KeyError(f"No regression data named {name} for version "
+                       f"{version} in {self.path}")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def save(self, arrays: dict, version: Optional[str] = None,
+             metadata: Optional[dict] = None):
+        r"""
+        Add or replace entries of one version of the store.
+
+        Parameters
+        ----------
+        arrays : dict
+            Mapping of entry names to arrays.  A value that is itself a dict
+            is stored as a group of nested entries ``name/key``, replacing
+            every existing entry of that group.
+        version : str, optional
+            Version to write.  Defaults to the store's version.
+        metadata : dict, optional
+            JSON serializable information recorded for this version, e.g. the
+            git status of the Clawpack repositories.  The time of the update
+            is always recorded.
+
+        Notes
+        -----
+        Entries of other versions and other names are copied unchanged.  The
+        new container is written to a temporary file in the same directory
+        and then moved into place, so readers never see a partial file.  The
+        update holds a lock on the file ``<path>.lock``, so concurrent saves
+        to the same store, e.g. from several test processes, do not lose
+        each other's entries.
+        """
+
+        with _update_lock(self.path):
+            # another process may have updated the store since it was opened
+            self.close()
+            self._save(arrays, version, metadata)
+
+    def _save(self, arrays: dict, version: Optional[str],
+              metadata: Optional[dict]):
+        version = self.version if version is None else version
+
+        flat = {}
+        for name, value in arrays.items():
+            if isinstance(value, dict):
+                for key, array in value.items():
+                    flat[f"{name}/{key}"] = array
+            else:
+                flat[name] = value
+        replaced = set(arrays)
+
+        def is_replaced(v, name):
+            return v == version and any(name == r or name.startswith(r + "/")
+                                        for r in replaced)
+
+        manifest = {"format": _FORMAT, "versions": {}}
+        kept = []
+        if self.path.exists():
+            for (v, name), member in self._entries().items():
+                if not is_replaced(v, name):
+                    kept.append((f"{v}/{name}.npy", member))
+            if self._manifest is not None:
+                manifest["versions"] = self._manifest.get("versions", {})
+
+        info = dict(manifest["versions"].get(version, {}))
+        info.update(metadata or {})
+        info["updated"] = time.strftime("%a, %d %b %Y %H:%M:%S %Z")
+        manifest["versions"][version] = info
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.path.parent,
+                                         prefix=self.path.name,
+                                         suffix=".tmp")
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(temp_name, "w",
+                                 compression=zipfile.ZIP_DEFLATED) as out:
+                out.writestr(_MANIFEST, json.dumps(manifest, indent=1))
+                for new_member, old_member in kept:
+                    out.writestr(new_member, self._open().read(old_member))
+                for name, array in flat.items():
+                    with out.open(f"{version}/{name}.npy", "w",
+                                  force_zip64=True) as f:
+                        np.lib.format.write_array(f, np.asanyarray(array),
+                                                  allow_pickle=False)
+            self.close()
+            os.replace(temp_name, self.path)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+
+@contextmanager
+def _update_lock(path: Path):
+    r"""
+    Hold an exclusive lock on the sidecar file ``<path>.lock``.
+
+    Concurrent updates of the same store, e.g. from pytest-xdist workers,
+    are serialized so that no entries are lost.  Without ``fcntl``, i.e. on
+    Windows, no lock is taken.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate_regression_data(regression_path, store_path,
+                            version: Optional[str] = None) -> RegressionStore:
+    r"""
+    Copy legacy ``frameNNNN.txt`` and ``gaugeNNNNN.txt`` baselines into a store.
+
+    Parameters
+    ----------
+    regression_path : str or pathlib.Path
+        Directory containing the legacy regression files.
+    store_path : str or pathlib.Path
+        Container file to create or update.
+    version : str, optional
+        Version to write, see :class:`RegressionStore`.
+
+    Returns
+    -------
+    RegressionStore
+        The updated store, closed.
+
+    Notes
+    -----
+    Frame sums are stored as ``frameNNNN`` and gauges as ``gaugeNNNNN`` with
+    entries ``t`` and ``q``, the layout used by
+    ``ClawpackTestRunner.check_frames`` and ``check_gauges``.  The legacy
+    files are left in place.
+    """
+
+    import clawpack.pyclaw.gauges as gauges
+
+    regression_path = Path(regression_path)
+    arrays = {}
+    for path in sorted(regression_path.glob("frame[0-9][0-9][0-9][0-9].txt")):
+        arrays[path.stem] = np.atleast_1d(np.loadtxt(path))
+    for path in sorted(regression_path.glob("gauge[0-9]*.txt")):
+        gauge = gauges.GaugeSolution(int(path.stem[len("gauge"):]),
+                                     path=regression_path)
+        arrays[path.stem] = {"t": np.asarray(gauge.t),
+                             "q": np.asarray(gauge.q)}
+
+    metadata = {}
+    status_file = regression_path / "claw_git_status.txt"
+    if status_file.exists():
+        metadata["git_status"] = status_file.read_text()
+
+    with RegressionStore(store_path, version=version) as store:
+        store.save(arrays, metadata=metadata)
+    return store
@@ -20,6 +20,7 @@ import runpy
 
 from clawpack.clawutil.data import ClawData
 from clawpack.clawutil.claw_git_status import make_git_status_file
+from clawpack.clawutil.util import wait_max_rss
 
 # define an execution error class that returns a
 # message as well as the rest of the subprocess exceptions
@@ -34,7 +35,7 @@ class ClawExeError(subprocess.CalledProcessError):
 def runclaw(xclawcmd=None, outdir=None, overwrite=True, restart=None, 
             rundir=None, print_git_status=False, nohup=False, nice=None,
             runexe=None,
-            xclawout=None, xclawerr=None, verbose=True):
+            xclawout=None, xclawerr=None, verbose=True, rusage=None):
     """
     Run the Fortran version of Clawpack using executable xclawcmd, which is
     typically set to 'xclaw', 'xamr', etc.
@@ -69,6 +70,9 @@ def runclaw(xclawcmd=None, outdir=None, overwrite=True, restart=None,
     to the same file, specify ``xclawout`` as the filepath and 
     ``xclawerr=subprocess.STDOUT``.
 
+    If rusage is a dictionary, its entry 'max_rss_kb' is set to the peak
+    memory use in kB of the executable, see util.wait_max_rss.
+
     """
     
     if nice is not None:
@@ -239,10 +243,20 @@ def runclaw(xclawcmd=None, outdir=None, overwrite=True, restart=None,
         xclawerr = open(xclawerr,'w', encoding='utf-8',
                         buffering=1)
     try:
-        proc = subprocess.check_call(cmd_split,
-                                     cwd=outdir,
-                                     stdout=xclawout,
-                                     stderr=xclawerr)
+        if rusage is None:
+            proc = subprocess.check_call(cmd_split,
+                                         cwd=outdir,
+                                         stdout=xclawout,
+                                         stderr=xclawerr)
+        else:
+            job = subprocess.Popen(cmd_split,
+                                   cwd=outdir,
+                                   stdout=xclawout,
+                                   stderr=xclawerr)
+            rusage['max_rss_kb'] = wait_max_rss(job)
+            if job.returncode != 0:
+                raise subprocess.CalledProcessError(job.returncode, cmd_split)
+            proc = 0
 
     except subprocess.CalledProcessError as cpe:
         exe_error_str = "\n\n*** FORTRAN EXE FAILED ***\n"
@@ -26,6 +26,11 @@ The intended workflow for new tests is:
 By default, regression data is stored in a ``regression_data/`` directory
 next to the test file or example directory.
 
+Setting the environment variable ``CLAW_TEST_DOWNSCALE`` to an integer greater
+than 1 makes ``ClawpackTestRunner.downscale`` shrink runs by that factor, so
+the same tests can serve as a fast local tier and a full nightly tier.
+Downscaled runs compare against ``regression_data/downscale<factor>/``.
+
 Notes
 -----
 - ``ClawpackTestRunner`` is designed for example-based regression tests,
@@ -39,28 +44,426 @@ Notes
 
 from pathlib import Path
 import os
-import sys
 import subprocess
 import shutil
 import inspect
-from collections.abc import Iterable
+import json
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Optional
 
 import numpy as np
 
 import clawpack.clawutil.runclaw as runclaw
 import clawpack.clawutil.claw_git_status as claw_git_status
+import clawpack.clawutil.frame_stream as frame_stream
+import clawpack.clawutil.regression_store as regression_store
 import clawpack.clawutil.util as util
+import clawpack.clawutil.builds as builds
+from clawpack.clawutil.builds import executable_registry
 import clawpack.pyclaw.solution as solution
 import clawpack.pyclaw.gauges as gauges
 
 
 # Support for ClawpackRegressionTest
 import tempfile
+import tarfile
 import unittest
 import time
 
-import glob
+import hashlib
+
+
+# Statistics stored per patch and component by a frame digest
+_DIGEST_STATS = ("min", "max", "l1", "l2")
+
+
+def _iter_solution_patches(sol):
+    r"""
+    Yield ``(patch_index, level, q)`` for every patch of a loaded solution.
+    """
+    for state in sol.states:
+        yield state.patch.patch_index, state.patch.level, state.q
+
+
+def _frame_digest(patches, indices: Iterable=(0,), quantum: float=1e-8,
+                  downsample: Optional[int]=None) -> dict:
+    r"""
+    Compute a compact per-patch digest of selected solution components.
+
+    Parameters
+    ----------
+    patches : iterable
+        Iterable of ``(patch_index, level, q)`` tuples where ``q`` has the
+        component index first, as in ``State.q``.
+    indices : iterable of int, default (0,)
+        Components of ``q`` to include in the digest.
+    quantum : float, default 1e-8
+        Spacing used to quantize values before hashing.
+    downsample : int, optional
+        If given, also store every ``downsample``-th cell in each direction of
+        each patch so that differences can be located to a coarse cell.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        Arrays ``patch_index``, ``level`` and ``shape`` describing the patch
+        layout, ``min``, ``max``, ``l1``, ``l2`` and ``hash`` of shape
+        ``(num_patches, len(indices))`` and, if requested, the downsampled
+        field stored as ``field`` with ``field_offsets`` and ``field_shape``.
+    """
+
+    indices = list(indices)
+    patch_index, level, shape = [], [], []
+    stats = {name: [] for name in _DIGEST_STATS}
+    hashes = []
+    field, field_shape, field_offsets = [], [], [0]
+
+    for index, lev, q in patches:
+        q = np.asarray(q)[indices, ...]
+        flat = q.reshape(len(indices), -1)
+        patch_index.append(index)
+        level.append(lev)
+        shape.append(q.shape[1:])
+        stats["min"].append(flat.min(axis=1))
+        stats["max"].append(flat.max(axis=1))
+        stats["l1"].append(np.abs(flat).sum(axis=1))
+        stats["l2"].append(np.sqrt((flat * flat).sum(axis=1)))
+
+        # Adding 0.0 maps -0.0 to 0.0 so the bytes only depend on the value
+        quantized = np.rint(q / quantum) + 0.0
+        hashes.append([int.from_bytes(
+                            hashlib.blake2b(np.ascontiguousarray(quantized[m]),
+                                            digest_size=8).digest(), "little")
+                       for m in range(len(indices))])
+
+        if downsample:
+            coarse = q[(slice(None),) + (slice(None, None, downsample),)
+                                        * (q.ndim - 1)]
+            field.append(coarse.reshape(len(indices), -1))
+            field_shape.append(coarse.shape[1:])
+            field_offsets.append(field_offsets[-1] + field[-1].shape[1])
+
+    num_patches = len(patch_index)
+    digest = {"indices": np.array(indices, dtype=np.int64),
+              "patch_index": np.array(patch_index, dtype=np.int64),
+              "level": np.array(level, dtype=np.int64),
+              "shape": np.array(shape, dtype=np.int64).reshape(num_patches, -1),
+              "hash": np.array(hashes, dtype=np.uint64).reshape(num_patches,
+                                                                len(indices)),
+              "quantum": np.array(quantum)}
+    for name in _DIGEST_STATS:
+        digest[name] = np.array(stats[name], dtype=np.float64).reshape(
+                                                    num_patches, len(indices))
+    if downsample:
+        digest["downsample"] = np.array(downsample, dtype=np.int64)
+        digest["field"] = np.concatenate(field, axis=1) if field else \
+                                                np.empty((len(indices), 0))
+        digest["field_shape"] = np.array(field_shape, dtype=np.int64).reshape(
+                                                            num_patches, -1)
+        digest["field_offsets"] = np.array(field_offsets, dtype=np.int64)
+    return digest
+
+
+def _compare_frame_digests(digest: dict, reference: dict,
+                           rtol: float=1e-14, atol: float=1e-8,
+                           compare_hash: bool=False) -> Optional[str]:
+    r"""
+    Compare two frame digests produced by :func:`_frame_digest`.
+
+    Returns ``None`` if the digests agree and otherwise a message describing
+    the first differing patch, level and (if a downsampled field is stored)
+    cell.
+    """
+
+    if not np.array_equal(digest["indices"], reference["indices"]):
+        return (f"Digest components differ: generated {digest['indices']}, "
+                f"regression {reference['indices']}")
+
+    # Patch layout must match before values can be compared patch-by-patch
+    num_patches = len(digest["patch_index"])
+    num_reference = len(reference["patch_index"])
+    n = min(num_patches, num_reference)
+    differs = ~((digest["patch_index"][:n] == reference["patch_index"][:n])
+                & (digest["level"][:n] == reference["level"][:n])
+                & np.all(digest["shape"][:n] == reference["shape"][:n], axis=1))
+    if differs.any() or num_patches != num_reference:
+        p = int(np.argmax(differs)) if differs.any() else n
+        msg = [f"Patch layout differs at patch {p}: generated has "
+               f"{num_patches} patches, regression has {num_reference}."]
+        for name, d in (("generated", digest), ("regression", reference)):
+            if p < len(d["patch_index"]):
+                msg.append(f"  {name}: patch_index={d['patch_index'][p]}, "
+                           f"level={d['level'][p]}, "
+                           f"shape={tuple(d['shape'][p].tolist())}")
+        return "\n".join(msg)
+
+    # Vectorized comparison of all statistics over all patches at once
+    mismatch = np.zeros(digest["min"].shape, dtype=bool)
+    for name in _DIGEST_STATS:
+        mismatch |= ~np.isclose(digest[name], reference[name],
+                                rtol=rtol, atol=atol)
+    if compare_hash:
+        mismatch |= digest["hash"] != reference["hash"]
+
+    # Locate first differing coarse cell if both digests store a field
+    field_patch, field_cell = num_patches, None
+    if "field" in digest and "field" in reference:
+        if int(digest["downsample"]) != int(reference["downsample"]):
+            return (f"Digest downsample factors differ: generated "
+                    f"{int(digest['downsample'])}, regression "
+                    f"{int(reference['downsample'])}")
+        bad = ~np.isclose(digest["field"], reference["field"],
+                          rtol=rtol, atol=atol)
+        bad_cells = np.flatnonzero(bad.any(axis=0))
+        if bad_cells.size > 0:
+            offsets = digest["field_offsets"]
+            position = bad_cells[0]
+            field_patch = int(np.searchsorted(offsets, position,
+                                              side="right") - 1)
+            local = np.unravel_index(position - offsets[field_patch],
+                                     tuple(digest["field_shape"][field_patch]))
+            field_cell = tuple(int(i) * int(digest["downsample"])
+                               for i in local)
+            components = np.flatnonzero(bad[:, position])
+            mismatch[field_patch, components] = True
+
+    bad_patches = np.flatnonzero(mismatch.any(axis=1))
+    if bad_patches.size == 0:
+        return None
+
+    p = int(bad_patches[0])
+    msg = [f"Digest mismatch in {bad_patches.size} of {num_patches} patches.",
+           f"First differing patch {p}: patch_index={digest['patch_index'][p]}, "
+           f"level={digest['level'][p]}"]
+    for m in np.flatnonzero(mismatch[p]):
+        component = digest["indices"][m]
+        for name in _DIGEST_STATS:
+            if not np.isclose(digest[name][p, m], reference[name][p, m],
+                              rtol=rtol, atol=atol):
+                msg.append(f"  q[{component}] {name}: generated "
+                           f"{float(digest[name][p, m])!r}, regression "
+                           f"{float(reference[name][p, m])!r}")
+        if compare_hash and digest["hash"][p, m] != reference["hash"][p, m]:
+            msg.append(f"  q[{component}] quantized hash differs")
+    if field_patch == p:
+        msg.append(f"  first differing cell (downsampled) at index "
+                   f"{field_cell}")
+    return "\n".join(msg)
+
+
+def _compare_gauge_data(t, q, regression_t, regression_q,
+                        indices: Iterable=(0,), rtol: float=1e-14,
+                        atol: float=1e-8, equal_nan: bool=True,
+                        interpolate: bool=False) -> Optional[str]:
+    r"""
+    Compare selected components of two gauge records in a single pass.
+
+    Parameters
+    ----------
+    t, q : numpy.ndarray
+        Output times and solution of the generated gauge, with ``q`` of shape
+        ``(num_fields, num_times)`` as in ``GaugeSolution.q``.
+    regression_t, regression_q : numpy.ndarray
+        Output times and solution of the regression gauge.
+    indices : iterable of int, default (0,)
+        Components of ``q`` to compare.
+    rtol, atol : float
+        Tolerances as used by ``numpy.isclose``.
+    equal_nan : bool, default True
+        Treat NaN values in matching positions as equal, as
+        ``numpy.testing.assert_allclose`` does.
+    interpolate : bool, default False
+        If True, the regression gauge is linearly interpolated to the output
+        times of the generated gauge.  This allows comparing records whose
+        output times differ slightly, but both records must start and end at
+        the same times, so truncated or overlong runs still fail.
+
+    Returns
+    -------
+    str or None
+        ``None`` if the gauges agree, otherwise a message listing the failing
+        components, the maximum absolute and relative errors, and the time at
+        which the gauges first diverge.
+    """
+
+    indices = list(indices)
+    t = np.asarray(t)
+    values = np.asarray(q)[indices, :]
+
+    if interpolate:
+        regression_t = np.asarray(regression_t)
+        span = abs(regression_t[-1] - regression_t[0])
+        if not np.allclose([t[0], t[-1]], [regression_t[0], regression_t[-1]],
+                           rtol=0, atol=1e-10 * max(span, 1.)):
+            return (f"Gauge times [{float(t[0])!r}, {float(t[-1])!r}] do "
+                    f"not match regression gauge times "
+                    f"[{float(regression_t[0])!r}, "
+                    f"{float(regression_t[-1])!r}]")
+        reference = np.array([np.interp(t, regression_t, regression_q[n, :])
+                              for n in indices]).reshape(values.shape)
+    else:
+        if q.shape[1] != regression_q.shape[1]:
+            return (f"Gauges have different sizes, generated gauge has shape "
+                    f"{q.shape}, regression gauge has shape "
+                    f"{regression_q.shape}")
+        reference = np.asarray(regression_q)[indices, :]
+
+    bad = ~np.isclose(values, reference, rtol=rtol, atol=atol,
+                      equal_nan=equal_nan)
+    if not bad.any():
+        return None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        abs_err = np.abs(values - reference)
+        rel_err = abs_err / np.abs(reference)
+    bad_fields = bad.any(axis=1)
+    first = np.argmax(bad, axis=1)
+    msg = ["failures in fields: "
+                + ", ".join(str(n) for n, b in zip(indices, bad_fields) if b),
+           f"  max abs error {np.nanmax(abs_err):.6e}, "
+           f"max rel error {np.nanmax(rel_err):.6e}",
+           f"  first divergence at t = {float(t[first[bad_fields].min()])!r}"]
+    for m in np.flatnonzero(bad_fields):
+        msg.append(f"  field {indices[m]}: max abs error "
+                   f"{np.nanmax(abs_err[m]):.6e}, max rel error "
+                   f"{np.nanmax(rel_err[m]):.6e}, first divergence at "
+                   f"t = {float(t[first[m]])!r} (generated "
+                   f"{float(values[m, first[m]])!r}, regression "
+                   f"{float(reference[m, first[m]])!r})")
+    return "\n".join(msg)
+
+
+# keyword arguments of numpy.testing.assert_allclose supported by the gauge
+# checks of ClawpackTestRunner:
+_GAUGE_KWARGS = ("rtol", "atol", "equal_nan", "err_msg", "verbose")
+
+
+def _gauge_failure(err_msg: str, kwargs: dict) -> str:
+    r"""
+    Apply the ``err_msg`` and ``verbose`` arguments of
+    ``numpy.testing.assert_allclose`` to a message of
+    :func:`_compare_gauge_data`.
+
+    Raises
+    ------
+    TypeError
+        If *kwargs* contains an argument not in ``_GAUGE_KWARGS``.
+    """
+    if not kwargs.get("verbose", True):
+        err_msg = err_msg.splitlines()[0]
+    if kwargs.get("err_msg"):
+        err_msg = "\n".join((kwargs["err_msg"], err_msg))
+    return err_msg
+
+
+def _check_gauge_kwargs(kwargs: dict):
+    r"""
+    Raise ``TypeError`` for keyword arguments the gauge checks do not use.
+    """
+    unknown = sorted(set(kwargs) - set(_GAUGE_KWARGS))
+    if unknown:
+        raise TypeError("Unexpected keyword arguments for gauge comparison: "
+                        + ", ".join(unknown))
+
+
+def _current_test_name() -> Optional[str]:
+    r"""
+    Return a file-name friendly name of the running pytest test, if any.
+    """
+    current = os.environ.get("PYTEST_CURRENT_TEST")
+    if not current:
+        return None
+    name = current.split("::")[-1].split(" ")[0]
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+
+# Timings of ClawpackTestRunner steps recorded in this session, keyed by test
+_session_timings = {}
+
+
+def _children_cpu_time() -> float:
+    r"""
+    Return the CPU time used by waited-for child processes, or 0 where the
+    ``resource`` module is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def write_session_timings(path: Optional[Path]=None,
+                          timings: Optional[Mapping]=None):
+    r"""
+    Write the step timings recorded in this session to a JSON file.
+
+    Parameters
+    ----------
+    path : pathlib.Path, optional
+        Output file.  Defaults to ``$CLAW_TEST_TIMINGS``.  Nothing is written
+        if neither is set.
+    timings : mapping, optional
+        Timings to write, keyed by test id.  Defaults to the timings of every
+        test run in this session.
+
+    Notes
+    -----
+    The file maps each test id to the timings of its steps, see
+    :meth:`ClawpackTestRunner.check_performance`.  Entries for other tests
+    are kept, so one file can collect the timings of a whole test suite.
+    The update holds a lock on ``<path>.lock``, so ``pytest-xdist`` workers
+    can share the file without losing each other's entries.
+    """
+
+    if path is None:
+        path = os.environ.get("CLAW_TEST_TIMINGS")
+        if not path:
+            return
+    path = Path(path)
+    if timings is None:
+        timings = _session_timings
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _file_lock(path.with_name(f"{path.name}.lock")):
+        merged = {}
+        if path.exists():
+            merged = json.loads(path.read_text())
+        merged.update(timings)
+
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(merged, indent=1, sort_keys=True))
+        os.replace(temp_path, path)
+
+
+@contextmanager
+def _file_lock(lock_path: Path):
+    r"""
+    Hold an exclusive ``fcntl`` lock on *lock_path* while the context is
+    active.  No lock is taken where ``fcntl`` is not available.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _git_status_metadata() -> dict:
+    r"""
+    Return the session git status snapshot as regression store metadata.
+    """
+    snapshot = claw_git_status.git_status_snapshot()
+    return {"git_status": snapshot["time"] + snapshot["status"]}
 
 
 def run_example_for_test(runner_cls,
@@ -72,6 +475,7 @@ def run_example_for_test(runner_cls,
                          run: bool=True,
                          set_data: bool=True,
                          write_data: bool=True,
+                         downscale: bool=False,
                          build_kwargs: Optional[dict]=None,
                          run_kwargs: Optional[dict]=None):
     r"""
@@ -102,6 +506,10 @@ def run_example_for_test(runner_cls,
     write_data : bool, default True
         If True, call ``runner.write_data()`` after applying
         ``configure_runner``.
+    downscale : bool, default False
+        If True, call ``runner.downscale()`` after applying
+        ``configure_runner``, so that ``CLAW_TEST_DOWNSCALE`` applies to
+        every stage of a multi-stage test.
     build_kwargs : dict, optional
         Extra keyword arguments passed to ``runner.build_executable()``.
     run_kwargs : dict, optional
@@ -118,6 +526,9 @@ def run_example_for_test(runner_cls,
     This helper is intended for concise multi-stage regression tests, such as
     adjoint workflows, where one example run produces output used by a second
     example run.
+    Passing ``build_kwargs={"shared": True}``, or running pytest with
+    ``--claw-shared-build``, builds each example only once per session no
+    matter how many tests run it.
     """
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -128,6 +539,8 @@ def run_example_for_test(runner_cls,
         runner.set_data()
     if configure_runner is not None:
         configure_runner(runner)
+    if downscale:
+        runner.downscale()
     if write_data:
         runner.write_data()
 
@@ -175,6 +588,17 @@ class ClawpackTestRunner:
     rundata : object
         Run-time data object returned by ``setrun.setrun()`` after
         :meth:`set_data` is called.
+    timings : dict
+        Wall time, CPU time and peak memory use recorded by
+        :meth:`build_executable`, :meth:`write_data` and :meth:`run_code`,
+        keyed by method name.  See :meth:`check_performance`.
+    downscale_factor : int
+        Factor applied by :meth:`downscale`, 1 for a full resolution run.
+    shared_build : bool
+        Class attribute giving the default of ``shared`` in
+        :meth:`build_executable`.  Defaults to False and is set to True by
+        the ``--claw-shared-build`` option of
+        :mod:`clawpack.clawutil.pytest_plugin`.
 
     Notes
     -----
@@ -192,6 +616,8 @@ class ClawpackTestRunner:
     remains easy to read and modify.
     """
 
+    shared_build = False
+
     def __init__(self, path: Path, test_path: Optional[Path]=None):
         r"""
         Initialize a regression test runner for a single example run.
@@ -218,6 +644,70 @@ class ClawpackTestRunner:
         # Do we want to set this?
         self.verbose = False
 
+        # Wall time, CPU time and peak memory of each step, see _timed
+        self.timings = {}
+
+        # Resolution reduction applied to rundata, see downscale
+        self.downscale_factor = 1
+
+
+    @property
+    def test_id(self) -> str:
+        r"""
+        Identifier of the running test used to key recorded timings.
+
+        This is the pytest node id if running under pytest and otherwise the
+        example directory.
+        """
+        current = os.environ.get("PYTEST_CURRENT_TEST")
+        if current:
+            return current.rsplit(" ", 1)[0]
+        return str(self.test_path)
+
+
+    @property
+    def regression_path(self) -> Path:
+        r"""
+        Default directory of the regression data of this test.
+
+        This is ``self.test_path / "regression_data"`` for full resolution
+        runs and ``self.test_path / "regression_data" / "downscale<factor>"``
+        after :meth:`downscale` reduced the run, so that baselines of the
+        two tiers never mix.
+        """
+        path = Path(self.test_path) / "regression_data"
+        if self.downscale_factor > 1:
+            path = path / f"downscale{self.downscale_factor}"
+        return path
+
+
+    @contextmanager
+    def _timed(self, step: str):
+        r"""
+        Record wall time, CPU time and peak memory use of *step*.
+
+        CPU time includes child processes such as ``make`` and the solver.
+        The context yields a dict in which the step stores the peak memory
+        use ``max_rss_kb`` of the child process it ran, as measured by
+        :func:`clawpack.clawutil.util.wait_max_rss`; it is 0 for steps
+        without child processes.  Repeated steps accumulate their times and
+        keep the largest peak.  The timings are added to the session timings
+        and, if ``$CLAW_TEST_TIMINGS`` is set, written to that file.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time() + _children_cpu_time()
+        usage = {}
+        try:
+            yield usage
+        finally:
+            record = self.timings.setdefault(step, {"wall": 0.0, "cpu": 0.0})
+            record["wall"] += time.perf_counter() - wall
+            record["cpu"] += time.process_time() + _children_cpu_time() - cpu
+            record["max_rss_kb"] = max(record.get("max_rss_kb", 0.0),
+                                       usage.get("max_rss_kb") or 0.0)
+            _session_timings[self.test_id] = self.timings
+            write_session_timings()
+
 
     def set_data(self, setrun_path: Optional[Path]=None):
         r"""
@@ -247,6 +737,93 @@ class ClawpackTestRunner:
         self.rundata = setrun_module.setrun()
 
 
+    def downscale(self, factor: Optional[int]=None):
+        r"""
+        Reduce the size of the run described by ``rundata``.
+
+        Parameters
+        ----------
+        factor : int, optional
+            Reduction factor.  If omitted, the value of the environment
+            variable ``CLAW_TEST_DOWNSCALE`` is used, defaulting to 1 which
+            leaves ``rundata`` unchanged.
+
+        Raises
+        ------
+        ValueError
+            If ``factor`` is not a positive integer.
+
+        Notes
+        -----
+        This method expects :meth:`set_data` to have been called already and
+        modifies ``self.rundata`` in place:
+
+        - ``clawdata.num_cells`` is divided by ``factor`` in every direction,
+        - the number of output times is divided by ``factor`` while keeping
+          the output interval, so the remaining frames are at the same times
+          as in the full run.  For ``output_style`` 1 ``tfinal`` is reduced
+          accordingly, for ``output_style`` 2 the list of ``output_times`` is
+          truncated and for ``output_style`` 3 ``total_steps`` is divided,
+        - ``amrdata.amr_levels_max`` is reduced by ``log2(factor)`` levels,
+          keeping at least one level,
+        - nonzero ``gaugedata.min_time_increment`` values are multiplied by
+          ``factor``.
+
+        Attributes missing from ``rundata``, e.g. ``amrdata`` for classic
+        examples, are skipped.  Downscaled runs are compared against the
+        baselines in :attr:`regression_path`, which depends on ``factor``.
+        Calling this in every test, after any test specific modifications of
+        ``rundata``, lets ``CLAW_TEST_DOWNSCALE`` select a fast tier::
+
+            runner.set_data()
+            runner.rundata.clawdata.num_output_times = 4
+            runner.downscale()
+            runner.write_data()
+        """
+
+        if factor is None:
+            factor = os.environ.get("CLAW_TEST_DOWNSCALE", "1")
+        if not str(factor).strip().isdigit() or int(factor) < 1:
+            raise ValueError(f"Downscale factor must be a positive integer, "
+                             f"got {factor!r}")
+        factor = int(factor)
+        if factor == 1:
+            return
+
+        clawdata = self.rundata.clawdata
+        clawdata.num_cells = [max(1, n // factor) for n in clawdata.num_cells]
+
+        if clawdata.output_style == 1:
+            num_output_times = clawdata.num_output_times
+            if num_output_times > 0:
+                dt_out = (clawdata.tfinal - clawdata.t0) / num_output_times
+                clawdata.num_output_times = max(1, num_output_times // factor)
+                clawdata.tfinal = (clawdata.t0
+                                   + dt_out * clawdata.num_output_times)
+        elif clawdata.output_style == 2:
+            output_times = list(clawdata.output_times)
+            clawdata.output_times = output_times[:max(1, len(output_times)
+                                                         // factor)]
+        elif clawdata.output_style == 3:
+            clawdata.total_steps = max(1, clawdata.total_steps // factor)
+
+        amrdata = getattr(self.rundata, "amrdata", None)
+        if amrdata is not None:
+            levels = factor.bit_length() - 1
+            amrdata.amr_levels_max = max(1, amrdata.amr_levels_max - levels)
+
+        gaugedata = getattr(self.rundata, "gaugedata", None)
+        increment = getattr(gaugedata, "min_time_increment", None)
+        if isinstance(increment, dict):
+            gaugedata.min_time_increment = {gauge_id: value * factor
+                                            for gauge_id, value
+                                            in increment.items()}
+        elif increment:
+            gaugedata.min_time_increment = increment * factor
+
+        self.downscale_factor *= factor
+
+
     def write_data(self, path: Optional[Path]=None):
         r"""
         Write the current ``rundata`` object to disk.
@@ -272,14 +849,16 @@ class ClawpackTestRunner:
             path = self.temp_path
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
-        self.rundata.write(out_dir=path)
+        with self._timed("write_data"):
+            self.rundata.write(out_dir=path)
 
 
     def build_executable(self, make_level: str='new', 
                                FFLAGS: Optional[str]=None, 
                                LFLAGS: Optional[str]=None,
                                verbose: bool=False,
-                               make_vars: Optional[dict[str, str]]=None):
+                               make_vars: Optional[dict[str, str]]=None,
+                               shared: Optional[bool]=None):
         r"""
         Build the example executable using the local ``Makefile``.
 
@@ -310,6 +889,10 @@ class ClawpackTestRunner:
             If True, print the shell command before executing it.
         make_vars : dict of str to str, optional
             Additional variables to pass to the ``make`` command.
+        shared : bool, optional
+            If True, build the executable only once per session for each set
+            of build options using :meth:`executable_for`, and link it into
+            ``self.temp_path``.  Defaults to :attr:`shared_build`.
 
         Notes
         -----
@@ -325,7 +908,11 @@ class ClawpackTestRunner:
 
         After a successful build, the produced executable is moved from
         ``self.test_path`` into ``self.temp_path`` so that subsequent simulation
-        output remains isolated from the source tree.
+        output remains isolated from the source tree.  Shared executables are
+        symlinked instead.
+
+        Builds are serialized across threads and processes because examples
+        share the library object files compiled in ``$CLAW``.
 
         Raises
         ------
@@ -335,59 +922,77 @@ class ClawpackTestRunner:
             If the ``make`` command fails.
         """
 
-        def _normalize_make_flag(value: str, name: str) -> str:
-            prefix = f"{name}="
-            return value[len(prefix):] if value.startswith(prefix) else value
-
-        if make_level.lower() == "new":
-            make_target = "new"
-        elif make_level.lower() == "default":
-            # clean up *.o and *.mod files in test path only
-            for path in self.test_path.glob("*.o"):
-                path.unlink()
-            for path in self.test_path.glob("*.mod"):
-                path.unlink()
-            make_target = ".exe"
-        elif make_level.lower() == "exe":
-            make_target = ".exe"
-        else:
-            raise ValueError(f"Invalid make_level={make_level} given.")
-
-        cmd = ["make", make_target]
-        if make_vars:
-            for key, value in make_vars.items():
-                cmd.append(f"{key}={value}")
-
-        build_env = os.environ.copy()
-
-        for name in ("FFLAGS", "LFLAGS"):
-            if name in build_env and build_env[name].strip() == "":
-                del build_env[name]
-
-        if FFLAGS is not None:
-            build_env["FFLAGS"] = _normalize_make_flag(FFLAGS, "FFLAGS")
-        if LFLAGS is not None:
-            build_env["LFLAGS"] = _normalize_make_flag(LFLAGS, "LFLAGS")
-
-        # Preserve Makefile.common behavior:
-        if "FFLAGS" in build_env and "LFLAGS" not in build_env:
-            build_env["LFLAGS"] = build_env["FFLAGS"]
+        if shared is None:
+            shared = self.shared_build
 
         try:
-            if verbose:
-                print("Build command:", " ".join(str(part) for part in cmd))
-                print("Build cwd:", self.test_path)
-                if "FFLAGS" in build_env:
-                    print("Build env FFLAGS:", build_env["FFLAGS"])
-                if "LFLAGS" in build_env:
-                    print("Build env LFLAGS:", build_env["LFLAGS"])
-            subprocess.run(cmd, cwd=self.test_path, check=True, env=build_env)
+            with self._timed("build_executable") as usage:
+                if shared:
+                    executable = executable_registry().executable_for(
+                                        self.test_path, make_level=make_level,
+                                        FFLAGS=FFLAGS, LFLAGS=LFLAGS,
+                                        make_vars=make_vars,
+                                        executable_name=self.executable_name,
+                                        verbose=verbose, rusage=usage)
+                else:
+                    builds.run_make(self.test_path, make_level,
+                                    FFLAGS=FFLAGS, LFLAGS=LFLAGS,
+                                    verbose=verbose, make_vars=make_vars,
+                                    rusage=usage)
         except subprocess.CalledProcessError as e:
             self.clean()
             raise e
 
+        if shared:
+            target = Path(self.temp_path) / self.executable_name
+            if target.exists() or target.is_symlink():
+                target.unlink()
+            target.symlink_to(executable)
+        else:
+            shutil.move(self.test_path / self.executable_name, self.temp_path)
+
+
+    @classmethod
+    def executable_for(cls, example_path: Path, make_level: str='new',
+                            FFLAGS: Optional[str]=None,
+                            LFLAGS: Optional[str]=None,
+                            make_vars: Optional[dict[str, str]]=None,
+                            executable_name: str='xclaw',
+                            verbose: bool=False) -> Path:
+        r"""
+        Return an executable of an example built once per session.
+
+        Parameters
+        ----------
+        example_path : pathlib.Path
+            Directory containing the example ``Makefile``.
+        make_level, FFLAGS, LFLAGS, make_vars, verbose
+            Build options, see :meth:`build_executable`.  Each distinct
+            combination is built once.
+        executable_name : str, default "xclaw"
+            Name of the executable produced by the example ``Makefile``.
+
+        Returns
+        -------
+        pathlib.Path
+            Path of the cached executable.  It is shared by every test using
+            the same build options and must not be modified.
 
-        shutil.move(self.test_path / self.executable_name, self.temp_path)
+        Notes
+        -----
+        The executables are kept by the session registry returned by
+        :func:`~clawpack.clawutil.builds.executable_registry`, see
+        :class:`~clawpack.clawutil.builds.ExecutableRegistry`.  The
+        ``claw_executables`` fixture of
+        :mod:`clawpack.clawutil.pytest_plugin` gives tests direct access to
+        it.
+        """
+        registry = executable_registry()
+        return registry.executable_for(example_path, make_level=make_level,
+                                       FFLAGS=FFLAGS, LFLAGS=LFLAGS,
+                                       make_vars=make_vars,
+                                       executable_name=executable_name,
+                                       verbose=verbose)
 
 
     def run_code(self):
@@ -408,12 +1013,17 @@ class ClawpackTestRunner:
 
         This method expects :meth:`write_data` and :meth:`build_executable` to
         have been called already.
+
+        The wall time, CPU time and peak memory use of the run are recorded in
+        ``self.timings["run_code"]``, see :meth:`check_performance`.
         """
-        runclaw.runclaw(xclawcmd=self.temp_path / self.executable_name,
-                        rundir=self.temp_path,
-                        outdir=self.temp_path,
-                        overwrite=True,
-                        restart=False)
+        with self._timed("run_code") as usage:
+            runclaw.runclaw(xclawcmd=self.temp_path / self.executable_name,
+                            rundir=self.temp_path,
+                            outdir=self.temp_path,
+                            overwrite=True,
+                            restart=False,
+                            rusage=usage)
 
     def clean(self):
         r"""
@@ -428,6 +1038,88 @@ class ClawpackTestRunner:
         pass
 
 
+    def check_performance(self, baseline: Optional[Path]=None,
+                                tolerance: float=0.5,
+                                steps: Optional[Iterable[str]]=None,
+                                metric: str="wall",
+                                min_time: float=1.0,
+                                save: bool=False):
+        r"""
+        Compare recorded step timings against a stored performance baseline.
+
+        Parameters
+        ----------
+        baseline : pathlib.Path or dict, optional
+            JSON file mapping test ids to step timings, as written by
+            :func:`write_session_timings`, or such a mapping.  If omitted, the
+            default location is
+            ``self.regression_path / "performance.json"``.
+        tolerance : float, default 0.5
+            Allowed relative slowdown.  A step fails if its time exceeds the
+            baseline time by more than ``tolerance`` times the baseline.
+        steps : iterable of str, optional
+            Steps to check, any of ``"build_executable"``, ``"write_data"``
+            and ``"run_code"``.  Defaults to every step recorded by this runner
+            that also has a baseline.
+        metric : {"wall", "cpu", "max_rss_kb"}, default "wall"
+            Quantity to compare.
+        min_time : float, default 1.0
+            Slowdowns smaller than this absolute amount (seconds, or kB for
+            ``"max_rss_kb"``) are ignored so that timing noise of short steps
+            does not cause failures.
+        save : bool, default False
+            If True, store the current timings of this test in ``baseline``
+            before comparing.  Requires ``baseline`` to be a path.
+
+        Raises
+        ------
+        KeyError
+            If the baseline has no entry for this test.
+        AssertionError
+            If any checked step is slower than allowed.
+
+        Notes
+        -----
+        Timings are keyed by :attr:`test_id`, so a baseline file can hold the
+        timings of every test in a suite.  Absolute times depend on the
+        machine, so baselines should be generated on the machine that checks
+        them, e.g. a dedicated CI runner.
+        """
+
+        if baseline is None:
+            baseline = self.regression_path / "performance.json"
+
+        if isinstance(baseline, Mapping):
+            baseline_timings = baseline
+        else:
+            baseline = Path(baseline)
+            if save:
+                write_session_timings(baseline, {self.test_id: self.timings})
+            baseline_timings = json.loads(baseline.read_text())
+
+        if self.test_id not in baseline_timings:
+            raise KeyError(f"No performance baseline for test {self.test_id}")
+        reference = baseline_timings[self.test_id]
+
+        if steps is None:
+            steps = [step for step in self.timings if step in reference]
+
+        failures = []
+        for step in steps:
+            current = self.timings[step][metric]
+            expected = reference[step][metric]
+            if current - expected > max(tolerance * expected, min_time):
+                msg = (f"  {step}: {metric} = {current:.3f}, "
+                       f"baseline {expected:.3f}")
+                if expected > 0:
+                    msg += f" (+{100 * (current / expected - 1):.0f}%)"
+                failures.append(msg)
+        if failures:
+            raise AssertionError(
+                f"Performance regression in {self.test_id} beyond "
+                f"tolerance={tolerance}:\n" + "\n".join(failures))
+
+
     def check_files_equal(self,
                           file_path: Path,
                           regression_file: Optional[Path]=None,
@@ -447,7 +1139,7 @@ class ClawpackTestRunner:
             is inferred from ``regression_path / file_path.name``.
         regression_path : pathlib.Path, optional
             Directory containing saved regression files.  If omitted, the
-            default location is ``self.test_path / "regression_data"``.
+            default location is :attr:`regression_path`.
         save : bool, default False
             If True, copy ``file_path`` to the inferred or explicit regression
             file location before comparing.  This is intended for intentional
@@ -473,7 +1165,8 @@ class ClawpackTestRunner:
 
         If ``save`` is True, the regression directory is created if necessary and
         a git-status metadata file is also written via
-        ``claw_git_status.make_git_status_file``.
+        ``claw_git_status.make_git_status_file``.  The git status is computed
+        once per session and reused for every saved regression file.
 
         Raises
         ------
@@ -491,7 +1184,7 @@ class ClawpackTestRunner:
 
         if regression_file is None:
             if regression_path is None:
-                regression_path = self.test_path / "regression_data"
+                regression_path = self.regression_path
             regression_file = Path(regression_path) / file_path.name
         else:
             regression_file = Path(regression_file)
@@ -503,7 +1196,8 @@ class ClawpackTestRunner:
         if save:
             regression_file.parent.mkdir(parents=True, exist_ok=True)
             shutil.copy(file_path, regression_file)
-            claw_git_status.make_git_status_file(outdir=regression_file.parent)
+            claw_git_status.make_git_status_file(outdir=regression_file.parent,
+                                                 cached=True)
 
         if not regression_file.exists():
             raise FileNotFoundError(f"Regression file not found: {regression_file}")
@@ -537,9 +1231,15 @@ class ClawpackTestRunner:
             )
 
 
-    def check_frame(self, frame: int, indices: Iterable=(0,), 
-                                      regression_path: Optional[Path]=None, 
-                                      save: bool=False, **kwargs):        
+    def check_frame(self, frame: int, indices: Iterable=(0,),
+                                      regression_path: Optional[Path]=None,
+                                      save: bool=False,
+                                      mode: str="sum",
+                                      downsample: Optional[int]=None,
+                                      compare_hash: bool=False,
+                                      quantum: Optional[float]=None,
+                                      stream: bool=False,
+                                      **kwargs):
         r"""
         Compare a computed solution frame against saved regression data.
 
@@ -553,11 +1253,38 @@ class ClawpackTestRunner:
             loaded frame.
         regression_path : pathlib.Path, optional
             Directory containing saved regression files.  If omitted, the default
-            location is ``self.test_path / "regression_data"``.
+            location is :attr:`regression_path`.
         save : bool, default False
             If True, write the current frame summary to the regression file before
             comparing.  This is intended for intentional baseline creation or
             updates.
+        mode : {"sum", "digest"}, default "sum"
+            Comparison mode.
+
+            - ``"sum"``: compare the sum of each selected component.
+            - ``"digest"``: compare a per-patch digest of each selected
+              component containing its minimum, maximum, L1 and L2 norms and a
+              hash of the quantized values.  Patches are compared one by one
+              and a failure reports the first differing patch and level.
+        downsample : int, optional
+            Only used if ``mode="digest"``.  If given, the digest also stores
+            every ``downsample``-th cell of each patch in each direction so a
+            failure can report the first differing (coarse) cell.
+        compare_hash : bool, default False
+            Only used if ``mode="digest"``.  If True, the quantized hashes must
+            match exactly in addition to the statistics agreeing to the given
+            tolerances.  Values that differ only by round-off can still round
+            to different quanta, so this is best suited to bitwise
+            reproducible builds.
+        quantum : float, optional
+            Only used if ``mode="digest"``.  Spacing used to quantize values
+            before hashing.  Defaults to ``atol``.
+        stream : bool, default False
+            If True, read the frame one patch at a time with
+            :mod:`clawpack.clawutil.frame_stream` instead of loading a full
+            ``Solution`` with the ``clawpack.pyclaw`` readers.  Binary output
+            is memory-mapped, so memory use does not grow with the size of
+            the frame.
         **kwargs
             Additional keyword arguments passed to
             ``numpy.testing.assert_allclose``.  By default, ``rtol=1e-14`` and
@@ -566,24 +1293,70 @@ class ClawpackTestRunner:
         Notes
         -----
         Regression data is stored in files named ``frameNNNN.txt`` where ``NNNN``
-        is the zero-padded frame number.
+        is the zero-padded frame number.  In ``"digest"`` mode the data is
+        stored in a compressed ``frameNNNN_digest.npz`` file instead.
 
-        The current comparison metric is deliberately lightweight: it compares
+        The default comparison metric is deliberately lightweight: it compares
         sums of selected solution components rather than the full solution array.
         This keeps regression files small and reviewable, while still detecting
-        many unintended numerical changes.
+        many unintended numerical changes.  Note that the sum is taken over
+        ``Solution.q``, which refers to the first patch of the frame.  The
+        ``"digest"`` mode covers every patch, detects errors that cancel in
+        a sum, and still keeps the regression files small.
 
         If ``save`` is True, the regression directory is created if necessary and
         a git-status metadata file is also written via
-        ``claw_git_status.make_git_status_file``.
+        ``claw_git_status.make_git_status_file``.  The git status is computed
+        once per session and reused for every saved regression file.
         """
 
         if not regression_path:
-            regression_path = self.test_path / "regression_data"
+            regression_path = self.regression_path
+
+        # Default tolerances
+        kwargs.setdefault('rtol', 1e-14)
+        kwargs.setdefault('atol', 1e-8)
+
+        if mode == "digest":
+            if stream:
+                patches = frame_stream.iter_frame_patches(frame,
+                                                          path=self.temp_path)
+            else:
+                sol = solution.Solution(frame, path=self.temp_path)
+                patches = _iter_solution_patches(sol)
+            if quantum is None:
+                quantum = kwargs['atol']
+            digest = _frame_digest(patches, indices, quantum=quantum,
+                                   downsample=downsample)
+
+            regression_data = regression_path / \
+                                    f"frame{str(frame).zfill(4)}_digest.npz"
+            if save:
+                regression_data.parent.mkdir(parents=True, exist_ok=True)
+                np.savez_compressed(regression_data, **digest)
+                claw_git_status.make_git_status_file(outdir=regression_path,
+                                                     cached=True)
+            with np.load(regression_data) as data:
+                reference = dict(data)
+
+            err_msg = _compare_frame_digests(digest, reference,
+                                             rtol=kwargs['rtol'],
+                                             atol=kwargs['atol'],
+                                             compare_hash=compare_hash)
+            if err_msg is not None:
+                raise AssertionError(f"Frame {frame} does not match "
+                                     f"{regression_data}\n{err_msg}")
+            return
+        elif mode != "sum":
+            raise ValueError(f"Unrecognized frame comparison mode={mode}")
 
         # Load test output data
-        sol = solution.Solution(frame, path=self.temp_path)
-        sol_sums = [sol.q[i, ...].sum() for i in indices]
+        if stream:
+            sol_sums = frame_stream.frame_sums(frame, indices,
+                                               path=self.temp_path)
+        else:
+            sol = solution.Solution(frame, path=self.temp_path)
+            sol_sums = [sol.q[i, ...].sum() for i in indices]
 
         # Load regression data
         regression_data = regression_path / f"frame{str(frame).zfill(4)}.txt"
@@ -591,20 +1364,176 @@ class ClawpackTestRunner:
             if not regression_data.parent.exists():
                 regression_data.parent.mkdir(parents=True)
             np.savetxt(regression_data, sol_sums)
-            claw_git_status.make_git_status_file(outdir=regression_path)
+            claw_git_status.make_git_status_file(outdir=regression_path,
+                                                 cached=True)
         regression_sum = np.loadtxt(regression_data)
 
         # Compare data
+        np.testing.assert_allclose(sol_sums, regression_sum, **kwargs)
+
+
+    def _regression_file(self, regression_path: Optional[Path]=None,
+                               regression_file: Optional[Path]=None) -> Path:
+        r"""
+        Return the consolidated regression file used by batch checks.
+
+        If *regression_file* is not given, the file is
+        ``regression_path / "<test name>.npz"`` where the test name is taken
+        from the running pytest test, falling back to the name of
+        ``self.test_path``.
+        """
+        if regression_file is not None:
+            return Path(regression_file)
+        if not regression_path:
+            regression_path = self.regression_path
+        name = _current_test_name() or Path(self.test_path).name
+        return Path(regression_path) / f"{name}.npz"
+
+
+    def check_frames(self, frames: Iterable[int], indices: Iterable=(0,),
+                           regression_path: Optional[Path]=None,
+                           regression_file: Optional[Path]=None,
+                           save: bool=False,
+                           mode: str="sum",
+                           downsample: Optional[int]=None,
+                           compare_hash: bool=False,
+                           quantum: Optional[float]=None,
+                           version: Optional[str]=None,
+                           max_workers: Optional[int]=None,
+                           **kwargs):
+        r"""
+        Compare several solution frames against a consolidated regression file.
+
+        Parameters
+        ----------
+        frames : iterable of int
+            Frame numbers to load from the simulation output in
+            ``self.temp_path``.
+        indices : iterable of int, default (0,)
+            Indices of the ``q`` components to compare.
+        regression_path : pathlib.Path, optional
+            Directory containing the regression file.  If omitted, the default
+            location is :attr:`regression_path`.
+        regression_file : pathlib.Path, optional
+            Consolidated regression file.  If omitted, the file is
+            ``regression_path / "<test name>.npz"`` where the test name is the
+            name of the running pytest test.
+        save : bool, default False
+            If True, store the current frame summaries in the regression file
+            before comparing.  Other entries of the file are kept.
+        mode : {"sum", "digest"}, default "sum"
+            Comparison mode, see :meth:`check_frame`.
+        downsample, compare_hash, quantum
+            Digest options, see :meth:`check_frame`.
+        version : str, optional
+            Baseline version to save and compare against, e.g. one per
+            compiler.  See
+            :class:`~clawpack.clawutil.regression_store.RegressionStore` for
+            the default and the fallback to the ``"default"`` version.
+        max_workers : int, optional
+            Number of threads used to load frames.  Defaults to the
+            ``concurrent.futures.ThreadPoolExecutor`` default.
+        **kwargs
+            ``rtol`` and ``atol`` used in the comparison.  By default,
+            ``rtol=1e-14`` and ``atol=1e-8``.
+
+        Notes
+        -----
+        All frames are read concurrently using
+        :mod:`clawpack.clawutil.frame_stream`, the regression file is opened
+        once, and every frame is compared before any failure is reported.  A
+        single ``AssertionError`` then lists every mismatching frame.
+
+        The regression file is a
+        :class:`~clawpack.clawutil.regression_store.RegressionStore`.  Only
+        the entries being compared are read from it.  When saving, the git
+        status of the Clawpack repositories is recorded in the store rather
+        than in a separate ``claw_git_status.txt`` file.
+
+        Raises
+        ------
+        ValueError
+            If ``mode`` is not recognized.
+        AssertionError
+            If any frame cannot be loaded or does not match the regression
+            data.
+        """
+
+        if mode not in ("sum", "digest"):
+            raise ValueError(f"Unrecognized frame comparison mode={mode}")
+
+        frames = list(frames)
+        indices = list(indices)
+        regression_file = self._regression_file(regression_path,
+                                                regression_file)
         kwargs.setdefault('rtol', 1e-14)
         kwargs.setdefault('atol', 1e-8)
-        np.testing.assert_allclose(sol_sums, regression_sum, **kwargs)
+        if quantum is None:
+            quantum = kwargs['atol']
+
+        def summarize(frame):
+            if mode == "digest":
+                patches = frame_stream.iter_frame_patches(frame,
+                                                          path=self.temp_path)
+                return _frame_digest(patches, indices, quantum=quantum,
+                                     downsample=downsample)
+            return np.array(frame_stream.frame_sums(frame, indices,
+                                                    path=self.temp_path))
+
+        def entry_name(frame):
+            suffix = "_digest" if mode == "digest" else ""
+            return f"frame{str(frame).zfill(4)}{suffix}"
+
+        summaries, failures = {}, []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {frame: executor.submit(summarize, frame)
+                       for frame in frames}
+            for frame, future in futures.items():
+                try:
+                    summaries[frame] = future.result()
+                except Exception as e:
+                    failures.append(f"frame {frame}: could not be loaded "
+                                    f"({type(e).__name__}: {e})")
+
+        with regression_store.RegressionStore(regression_file,
+                                              version=version) as store:
+            if save:
+                store.save({entry_name(frame): summary
+                            for frame, summary in summaries.items()},
+                           metadata=_git_status_metadata())
+
+            for frame, summary in summaries.items():
+                try:
+                    reference = store.load(entry_name(frame))
+                except KeyError as e:
+                    failures.append(f"frame {frame}: {e.args[0]}")
+                    continue
+                if mode == "digest":
+                    err_msg = _compare_frame_digests(summary, reference,
+                                                     rtol=kwargs['rtol'],
+                                                     atol=kwargs['atol'],
+                                                     compare_hash=compare_hash)
+                elif not np.allclose(summary, reference, rtol=kwargs['rtol'],
+                                     atol=kwargs['atol']):
+                    err_msg = (f"sums {summary.tolist()}, expected "
+                               f"{np.atleast_1d(reference).tolist()}")
+                else:
+                    err_msg = None
+                if err_msg is not None:
+                    failures.append(f"frame {frame}: {err_msg}")
+
+        if failures:
+            raise AssertionError(
+                f"{len(failures)} of {len(frames)} frames do not match "
+                f"{regression_file}\n" + "\n".join(failures))
 
 
     def check_gauge(self, gauge_id: int,
                           indices: Iterable=(0,),
                           regression_path: Optional[Path]=None,
                           regression_gauge_id: Optional[int]=None,
-                          save: bool=False, **kwargs):
+                          save: bool=False,
+                          interpolate: bool=False, **kwargs):
         r"""
         Compare a computed gauge record against saved regression data.
 
@@ -616,7 +1545,7 @@ class ClawpackTestRunner:
             Indices of the gauge solution components to compare.
         regression_path : pathlib.Path, optional
             Directory containing saved regression gauge files.  If omitted, the
-            default location is ``self.test_path / "regression_data"``.
+            default location is :attr:`regression_path`.
         regression_gauge_id : int, optional
             Gauge number to load from ``regression_path`` for comparison.  If
             omitted, the regression gauge defaults to ``gauge_id``.  This is
@@ -627,15 +1556,22 @@ class ClawpackTestRunner:
             the filename for ``regression_gauge_id`` (or ``gauge_id`` if no
             override is provided) before comparing.  This is intended for
             intentional baseline creation or updates.
+        interpolate : bool, default False
+            If True, interpolate the regression gauge to the output times of
+            the generated gauge before comparing.  Use this when output times
+            differ slightly, e.g. between compilers.  The first and last
+            output times must still agree.
         **kwargs
-            Additional keyword arguments passed to
-            ``numpy.testing.assert_allclose``.  By default, ``rtol=1e-14`` and
-            ``atol=1e-8``.
+            ``rtol``, ``atol``, ``equal_nan``, ``err_msg`` and ``verbose``,
+            with the same meaning as for ``numpy.testing.assert_allclose``.
+            By default, ``rtol=1e-14`` and ``atol=1e-8``.
 
         Notes
         -----
         This method compares the full time series for each selected gauge field,
-        not just an aggregate summary.
+        not just an aggregate summary.  All selected fields are compared at
+        once and a failure reports the failing fields, the maximum absolute
+        and relative errors, and the time at which the gauges first diverge.
 
         Generated and archived gauge files are expected to use the standard
         Clawpack name ``gaugeNNNNN.txt`` where ``NNNNN`` is the zero-padded
@@ -647,15 +1583,20 @@ class ClawpackTestRunner:
         ------
         AssertionError
             If the computed gauge is empty, if the computed and regression gauges
-            have different shapes, or if any selected component differs beyond the
-            requested tolerances.
+            have different shapes (unless ``interpolate`` is True) or time
+            ranges, or if any selected component differs beyond the requested
+            tolerances.
+        TypeError
+            If *kwargs* contains other arguments than those listed above.
         """
 
+        _check_gauge_kwargs(kwargs)
+
         if not(isinstance(indices, tuple) or isinstance(indices, list)):
             indices = tuple(indices)
 
         if not regression_path:
-            regression_path = self.test_path / "regression_data"
+            regression_path = self.regression_path
 
         if regression_gauge_id is None:
             regression_gauge_id = gauge_id
@@ -673,38 +1614,146 @@ class ClawpackTestRunner:
                 self.temp_path / f"gauge{str(gauge_id).zfill(5)}.txt",
                 regression_path / f"gauge{str(regression_gauge_id).zfill(5)}.txt",
             )
-            claw_git_status.make_git_status_file(outdir=regression_path)
+            claw_git_status.make_git_status_file(outdir=regression_path,
+                                                 cached=True)
         regression_gauge = gauges.GaugeSolution(regression_gauge_id,
                                                 path=regression_path)
 
-        if gauge.q.shape[1] != regression_gauge.q.shape[1]:
-            raise AssertionError(
-                "Gauges have different sizes, "
-                f"generated gauge {gauge_id} has shape {gauge.q.shape}, "
-                f"regression gauge {regression_gauge_id} has shape {regression_gauge.q.shape}"
-            )
-
         # Compare data
         kwargs.setdefault('rtol', 1e-14)
         kwargs.setdefault('atol', 1e-8)
-        try:
-            for n in indices:
-                np.testing.assert_allclose(gauge.q[n, :],
-                                              regression_gauge.q[n, :],
-                                              **kwargs)
-        except AssertionError as e:
-            err_msg = "\n".join((
-                e.args[0],
-                f"Gauge match failed for generated gauge={gauge_id} against regression gauge={regression_gauge_id}",
-            ))
-            err_msg = "\n".join((err_msg, "  failures in fields:"))
-            failure_indices = []
-            for n in indices:
-                if not np.allclose(gauge.q[n, :], regression_gauge.q[n, :],
-                                **kwargs):
-                    failure_indices.append(str(n))
-            index_str = ", ".join(failure_indices)
-            raise AssertionError(" ".join((err_msg, index_str)))
+        err_msg = _compare_gauge_data(gauge.t, gauge.q,
+                                      regression_gauge.t, regression_gauge.q,
+                                      indices, rtol=kwargs['rtol'],
+                                      atol=kwargs['atol'],
+                                      equal_nan=kwargs.get('equal_nan', True),
+                                      interpolate=interpolate)
+        if err_msg is not None:
+            raise AssertionError("\n".join((
+                f"Gauge match failed for generated gauge={gauge_id} against "
+                f"regression gauge={regression_gauge_id}",
+                _gauge_failure(err_msg, kwargs))))
+
+
+    def check_gauges(self, gauge_ids: Iterable[int],
+                           indices: Iterable=(0,),
+                           regression_path: Optional[Path]=None,
+                           regression_file: Optional[Path]=None,
+                           save: bool=False,
+                           interpolate: bool=False,
+                           version: Optional[str]=None,
+                           max_workers: Optional[int]=None,
+                           **kwargs):
+        r"""
+        Compare several gauge records against a consolidated regression file.
+
+        Parameters
+        ----------
+        gauge_ids : iterable of int or mapping
+            Gauge numbers to load from the simulation output in
+            ``self.temp_path``.  If a mapping is given, it maps each generated
+            gauge number to the regression gauge number it is compared
+            against, as ``regression_gauge_id`` does in :meth:`check_gauge`.
+        indices : iterable of int, default (0,)
+            Indices of the gauge solution components to compare.
+        regression_path : pathlib.Path, optional
+            Directory containing the regression file.  If omitted, the default
+            location is :attr:`regression_path`.
+        regression_file : pathlib.Path, optional
+            Consolidated regression file.  If omitted, the file is
+            ``regression_path / "<test name>.npz"``, the same file used by
+            :meth:`check_frames`.
+        save : bool, default False
+            If True, store the generated gauge records in the regression file
+            before comparing.  Other entries of the file are kept.
+        interpolate : bool, default False
+            If True, interpolate regression gauges to the generated output
+            times before comparing, see :meth:`check_gauge`.
+        version : str, optional
+            Baseline version to save and compare against, see
+            :meth:`check_frames`.
+        max_workers : int, optional
+            Number of threads used to load gauges.
+        **kwargs
+            ``rtol``, ``atol``, ``equal_nan``, ``err_msg`` and ``verbose``, see
+            :meth:`check_gauge`.  By default, ``rtol=1e-14`` and
+            ``atol=1e-8``.
+
+        Notes
+        -----
+        Gauge files are read concurrently and every gauge is compared before
+        a single ``AssertionError`` listing all mismatching gauges is raised.
+        The full time series and all components of each gauge are stored so
+        that baselines do not depend on ``indices``.
+
+        Raises
+        ------
+        AssertionError
+            If any gauge is empty, cannot be loaded, or does not match the
+            regression data.
+        TypeError
+            If *kwargs* contains other arguments than those listed above.
+        """
+
+        _check_gauge_kwargs(kwargs)
+        if isinstance(gauge_ids, Mapping):
+            gauge_map = dict(gauge_ids)
+        else:
+            gauge_map = {gauge_id: gauge_id for gauge_id in gauge_ids}
+        indices = list(indices)
+        regression_file = self._regression_file(regression_path,
+                                                regression_file)
+        kwargs.setdefault('rtol', 1e-14)
+        kwargs.setdefault('atol', 1e-8)
+
+        def load(gauge_id):
+            gauge = gauges.GaugeSolution(gauge_id, path=self.temp_path)
+            if gauge.q.shape[1] == 0:
+                raise AssertionError(f"Empty gauge {gauge_id}.")
+            return {"t": np.asarray(gauge.t), "q": np.asarray(gauge.q)}
+
+        records, failures = {}, []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {gauge_id: executor.submit(load, gauge_id)
+                       for gauge_id in gauge_map}
+            for gauge_id, future in futures.items():
+                try:
+                    records[gauge_id] = future.result()
+                except Exception as e:
+                    failures.append(f"gauge {gauge_id}: could not be loaded "
+                                    f"({type(e).__name__}: {e})")
+
+        with regression_store.RegressionStore(regression_file,
+                                              version=version) as store:
+            if save:
+                store.save({f"gauge{str(gauge_map[gauge_id]).zfill(5)}": record
+                            for gauge_id, record in records.items()},
+                           metadata=_git_status_metadata())
+
+            for gauge_id, record in records.items():
+                regression_gauge_id = gauge_map[gauge_id]
+                try:
+                    reference = store.load(
+                                    f"gauge{str(regression_gauge_id).zfill(5)}")
+                except KeyError as e:
+                    failures.append(f"gauge {gauge_id}: {e.args[0]}")
+                    continue
+                err_msg = _compare_gauge_data(record["t"], record["q"],
+                                              reference["t"], reference["q"],
+                                              indices, rtol=kwargs['rtol'],
+                                              atol=kwargs['atol'],
+                                              equal_nan=kwargs.get('equal_nan',
+                                                                   True),
+                                              interpolate=interpolate)
+                if err_msg is not None:
+                    failures.append(f"gauge {gauge_id} (regression gauge "
+                                    f"{regression_gauge_id}): "
+                                    + _gauge_failure(err_msg, kwargs))
+
+        if failures:
+            raise AssertionError(
+                f"{len(failures)} of {len(gauge_map)} gauges do not match "
+                f"{regression_file}\n" + "\n".join(failures))
 
 
 # NOTE: The following class is the old unittest-based regression test framework.
@@ -720,8 +1769,9 @@ class ClawpackRegressionTest(unittest.TestCase):
 
      - *setUp*: Creates the temprorary directory that will house test output and
        data.   Also instantiates catching of output to both *stdout* and
-       *stderr*.  Finally, this method also calls *build_executable* which will
-       call the local Makefile's build process via *make .exe*.
+       *stderr*.  Finally, this method also calls *build_executable* which
+       links the executable built once per session by the local Makefile's
+       build process via *make .exe* into the temporary directory.
      - *runTest*: Actually runs the test calling the following functions by
        default:
         - *load_rundata(): Creates the *rundata* objects via the local
@@ -738,8 +1788,13 @@ class ClawpackRegressionTest(unittest.TestCase):
           sum to the default test data.
      - *tearDown*:  Closes output redirection and tests for success via the
        class attribute of a similar name.  If the tests were not successful the
-       temporary directory contents is copied to the local directory.  The
-       temporary directory is removed at this point.
+       temporary directory contents are archived in the compressed tarball
+       *<class name>_output.tar.gz* in the local directory.  The temporary
+       directory is removed at this point.
+
+    Every test instance works in its own temporary directory and leaves the
+    test directory untouched apart from the shared build, so tests of
+    different examples may run in parallel, e.g. with *pytest-xdist*.
 
 
     """
@@ -814,19 +1869,16 @@ class ClawpackRegressionTest(unittest.TestCase):
         self.stdout.write("  %s" % self.temp_path)
         self.stdout.write("  %s" % self.test_path)
         self.stdout.flush()
-        # clean up *.o and *.mod files in test path
-        for path in glob.glob(os.path.join(self.test_path,"*.o")):
-            os.remove(path)
-        for path in glob.glob(os.path.join(self.test_path,"*.mod")):
-            os.remove(path)
         self.build_executable()
 
 
     def build_executable(self, executable_name="xclaw"):
         r"""Build executable by running `make .exe` in test directory.
 
-        Moves the resulting executable to the temporary directory.
-
+        The executable is built once per session, after removing *\*.o* and
+        *\*.mod* files from the test directory, see
+        *ExecutableRegistry.executable_for*.  It is then symlinked into the
+        temporary directory.
 
         """
 
@@ -836,17 +1888,20 @@ class ClawpackRegressionTest(unittest.TestCase):
             self.stdout.write("  class file: %s\n" % str(inspect.getfile(self.__class__)))
             self.stdout.write("  test path: %s\n" % str(self.test_path))
             self.stdout.write("  temp path: %s\n" % str(self.temp_path))
-            subprocess.check_call("cd %s ; make .exe" % self.test_path,
-                                                        stdout=self.stdout,
-                                                        stderr=self.stderr,
-                                                        shell=True)
+            self.stdout.flush()
+            executable = executable_registry().executable_for(
+                                            self.test_path,
+                                            make_level="default",
+                                            executable_name=executable_name,
+                                            stdout=self.stdout,
+                                            stderr=self.stderr)
         except subprocess.CalledProcessError as e:
             self.tearDown()
             raise e
 
         self.executable_name = executable_name
-        shutil.move(os.path.join(self.test_path, self.executable_name),
-                    self.temp_path)
+        os.symlink(executable, os.path.join(self.temp_path,
+                                            self.executable_name))
 
 
     def load_rundata(self):
@@ -855,12 +1910,8 @@ class ClawpackRegressionTest(unittest.TestCase):
 
         """
 
-        if 'setrun' in sys.modules:
-            del(sys.modules['setrun'])
-        sys.path.insert(0, self.test_path)
-        import setrun
+        setrun = util.fullpath_import(os.path.join(self.test_path, "setrun.py"))
         self.rundata = setrun.setrun()
-        sys.path.pop(0)
 
 
     def write_rundata_objects(self, path=None):
@@ -921,7 +1972,8 @@ class ClawpackRegressionTest(unittest.TestCase):
 
     def check_frame(self, save=False, indices=[0], frame_num=1,
                           file_name="regression_data.txt",
-                          rtol=1e-14, atol=1e-08, tolerance=None):
+                          rtol=1e-14, atol=1e-08, tolerance=None,
+                          stream=False):
         r"""Compare choosen frame to the comparison data
 
         :Input:
@@ -938,16 +1990,23 @@ class ClawpackRegressionTest(unittest.TestCase):
            with this parameter.
          - *atol* (float) - Absolute tolerance used in the comparison, default
            is *1e-08*.
+         - *stream* (bool) - If *True* read the frame one patch at a time via
+           *frame_stream.frame_sums* rather than loading a full *Solution*.
+           Default is *False*.
         """
 
         if isinstance(tolerance, float):
             rtol = tolerance
 
         # Load test data
-        data = solution.Solution(frame_num, path=self.temp_path)
-        data_sum = []
-        for index in indices:
-            data_sum.append(data.q[index, ...].sum())
+        if stream:
+            data_sum = frame_stream.frame_sums(frame_num, indices,
+                                               path=self.temp_path)
+        else:
+            data = solution.Solution(frame_num, path=self.temp_path)
+            data_sum = []
+            for index in indices:
+                data_sum.append(data.q[index, ...].sum())
 
         # Get (and save) regression comparison data
         regression_data_file = os.path.join(self.test_path, "regression_data",
@@ -955,7 +2014,8 @@ class ClawpackRegressionTest(unittest.TestCase):
         if save:
             np.savetxt(regression_data_file, data_sum)
             claw_git_status.make_git_status_file(
-                         outdir=os.path.join(self.test_path, "regression_data"))
+                         outdir=os.path.join(self.test_path, "regression_data"),
+                         cached=True)
 
         regression_sum = np.loadtxt(regression_data_file)
 
@@ -994,7 +2054,8 @@ class ClawpackRegressionTest(unittest.TestCase):
             gauge_file_name = "gauge%s.txt" % str(gauge_id).zfill(5)
             shutil.copy(os.path.join(self.temp_path, gauge_file_name),
                                                            regression_data_path)
-            claw_git_status.make_git_status_file(outdir=regression_data_path)
+            claw_git_status.make_git_status_file(outdir=regression_data_path,
+                                                 cached=True)
 
         regression_gauge = gauges.GaugeSolution(gauge_id,
                                                 path=regression_data_path)
@@ -1023,23 +2084,29 @@ class ClawpackRegressionTest(unittest.TestCase):
         r"""Tear down test infrastructure.
 
         Closes *stdout* and *stderr*, removes the temporary directoy and if
-        *success* is *False*, copies the contents of the tempory directory to
-        the current working directory.
+        *success* is *False*, archives the contents of the tempory directory
+        in *<class name>_output.tar.gz* in the current working directory.
+
+        The tarball is written to a temporary file that is moved into place,
+        so parallel tests never leave a partial archive behind.
 
         """
         self.stdout.close()
         self.stderr.close()
 
         if not self.success:
-            output_dir = os.path.join(os.getcwd(),
-                                         "%s_output" % self.__class__.__name__)
-
-            # Remove directory if it exists already
-            if os.path.exists(output_dir):
-                shutil.rmtree(output_dir)
-
-            # Copy out output files to local directory
-            shutil.copytree(self.temp_path, output_dir)
+            archive_name = "%s_output" % self.__class__.__name__
+            archive = os.path.join(os.getcwd(), "%s.tar.gz" % archive_name)
+
+            # Stream output files into a compressed archive, the executable
+            # is only a link to the shared build
+            fd, temp_archive = tempfile.mkstemp(dir=os.getcwd(),
+                                                prefix=archive_name,
+                                                suffix=".tmp")
+            with os.fdopen(fd, "wb") as archive_file:
+                with tarfile.open(fileobj=archive_file, mode="w:gz") as tar:
+                    tar.add(self.temp_path, arcname=archive_name)
+            os.replace(temp_archive, archive)
 
         shutil.rmtree(self.temp_path)
         self.temp_path = None
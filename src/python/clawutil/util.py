@@ -5,6 +5,8 @@ Functions
 ---------
 fullpath_import
     Import a Python module from an explicit filesystem path.
+wait_max_rss
+    Wait for a subprocess and return its peak memory use.
 """
 
 from __future__ import annotations
@@ -18,7 +20,7 @@ from pathlib import Path
 from typing import Optional
 
 
-__all__ = ["fullpath_import"]
+__all__ = ["fullpath_import", "wait_max_rss"]
 
 
 def _unique_module_name(path: Path) -> str:
@@ -118,3 +120,30 @@ def fullpath_import(fullpath,
         print(f"loaded module '{module_name}' from file: {module.__file__}")
 
     return module
+
+
+def wait_max_rss(proc) -> Optional[float]:
+    """
+    Wait for the ``subprocess.Popen`` object ``proc`` to finish and return
+    its peak resident set size in kB.
+
+    The process is reaped with ``os.wait4``, so the peak is that of ``proc``
+    and the processes it waited for, e.g. the compiler runs of ``make``, not
+    of the calling process or of other children.  ``proc.returncode`` is set
+    as by ``proc.wait()``.
+
+    Returns
+    -------
+    float or None
+        Peak resident set size in kB, or ``None`` where ``os.wait4`` is not
+        available.
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is reported in bytes on macOS and in kB elsewhere
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss / 1024
+    return float(rusage.ru_maxrss)
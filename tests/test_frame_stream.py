@@ -0,0 +1,144 @@
+"""Tests for clawpack.clawutil.frame_stream on small synthetic frames."""
+
+import numpy as np
+import pytest
+
+from clawpack.clawutil import frame_stream
+
+
+def write_frame(path, patches, file_format="ascii", num_ghost=2, frame=1,
+                t=0.5, legacy_header=False):
+    r"""
+    Write *patches* as the Fortran codes write an output frame.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Output directory.
+    patches : list of tuple
+        ``(level, q)`` for each patch, where ``q`` has shape
+        ``(num_eqn, mx[, my])`` without ghost cells.
+    file_format : {"ascii", "binary32", "binary64"}
+        Output format.  Binary frames get ghost cells filled with a large
+        value, so that including them in a reduction is noticed.
+    legacy_header : bool
+        If True, omit ``num_ghost`` and the format from ``fort.t`` as older
+        versions did.
+    """
+
+    num_eqn = patches[0][1].shape[0]
+    num_dim = patches[0][1].ndim - 1
+    suffix = str(frame).zfill(4)
+
+    with open(path / f"fort.t{suffix}", "w") as f:
+        f.write(f"{t:18.8e}    time\n")
+        for value, name in [(num_eqn, "num_eqn"), (len(patches), "nstates"),
+                            (0, "num_aux"), (num_dim, "num_dim")]:
+            f.write(f"{value:6d}                 {name}\n")
+        if not legacy_header:
+            f.write(f"{num_ghost:6d}                 num_ghost\n")
+            f.write(f"{file_format:>10}                 format\n")
+
+    with open(path / f"fort.q{suffix}", "w") as fq:
+        for patch_index, (level, q) in enumerate(patches, start=1):
+            num_cells = q.shape[1:]
+            fq.write(f"{patch_index:6d}                 grid_number\n")
+            fq.write(f"{level:6d}                 AMR_level\n")
+            for n, name in zip(num_cells, ["mx", "my"]):
+                fq.write(f"{n:6d}                 {name}\n")
+            for name in ["xlow", "ylow"][:num_dim]:
+                fq.write(f"{0.:26.16e}    {name}\n")
+            for n, name in zip(num_cells, ["dx", "dy"]):
+                fq.write(f"{1. / n:26.16e}    {name}\n")
+            fq.write("\n")
+            if file_format == "ascii":
+                # one line per cell, with x varying fastest
+                cells = q.reshape(num_eqn, -1, order="F")
+                for k in range(cells.shape[1]):
+                    fq.write(" ".join(f"{v:26.16e}" for v in cells[:, k])
+                             + "\n")
+                    if num_dim > 1 and (k + 1) % num_cells[0] == 0:
+                        fq.write("\n")
+                fq.write("\n")
+
+    if file_format != "ascii":
+        dtype = np.float32 if file_format == "binary32" else np.float64
+        with open(path / f"fort.b{suffix}", "wb") as fb:
+            for level, q in patches:
+                padded = np.pad(q, [(0, 0)] + [(num_ghost, num_ghost)]
+                                * num_dim, constant_values=1e10)
+                fb.write(padded.astype(dtype).tobytes(order="F"))
+
+
+def make_patches(num_dim, num_eqn=2, seed=0):
+    """Return two patches with distinct shapes and random values."""
+    rng = np.random.default_rng(seed)
+    shapes = [(4, 3), (5, 2)] if num_dim == 2 else [(6,), (3,)]
+    return [(level, rng.random((num_eqn,) + shape))
+            for level, shape in zip([1, 2], shapes)]
+
+
+@pytest.mark.parametrize("num_dim", [1, 2])
+@pytest.mark.parametrize("file_format", ["ascii", "binary32", "binary64"])
+def test_iter_frame_patches(tmp_path, num_dim, file_format):
+    patches = make_patches(num_dim)
+    write_frame(tmp_path, patches, file_format=file_format)
+
+    streamed = list(frame_stream.iter_frame_patches(1, path=tmp_path))
+
+    assert [(i, level) for i, level, _ in streamed] == [(1, 1), (2, 2)]
+    rtol = 1e-6 if file_format == "binary32" else 1e-14
+    for (_, _, q), (_, expected) in zip(streamed, patches):
+        assert q.shape == expected.shape
+        np.testing.assert_allclose(q, expected, rtol=rtol)
+
+
+def test_iter_frame_patches_binary_is_read_only(tmp_path):
+    write_frame(tmp_path, make_patches(2), file_format="binary64")
+    _, _, q = next(frame_stream.iter_frame_patches(1, path=tmp_path))
+    assert not q.flags.writeable
+
+
+@pytest.mark.parametrize("file_format", ["ascii", "binary64"])
+def test_frame_sums(tmp_path, file_format):
+    patches = make_patches(2)
+    write_frame(tmp_path, patches, file_format=file_format)
+
+    first = frame_stream.frame_sums(1, [0, 1], path=tmp_path)
+    total = frame_stream.frame_sums(1, [1], path=tmp_path, all_patches=True)
+
+    np.testing.assert_allclose(first, [patches[0][1][i].sum() for i in [0, 1]],
+                               rtol=1e-14)
+    np.testing.assert_allclose(total, [sum(q[1].sum() for _, q in patches)],
+                               rtol=1e-14)
+
+
+def test_read_frame_time(tmp_path):
+    write_frame(tmp_path, make_patches(2), file_format="binary32",
+                num_ghost=3, t=1.25)
+    info = frame_stream.read_frame_time(1, path=tmp_path)
+    assert info == {"t": 1.25, "num_eqn": 2, "num_patches": 2, "num_aux": 0,
+                    "num_dim": 2, "num_ghost": 3, "file_format": "binary32"}
+
+
+@pytest.mark.parametrize("file_format", ["ascii", "binary64"])
+def test_read_frame_time_legacy(tmp_path, file_format):
+    write_frame(tmp_path, make_patches(1), file_format=file_format,
+                legacy_header=True)
+    info = frame_stream.read_frame_time(1, path=tmp_path)
+    assert info["num_ghost"] == 2
+    assert info["file_format"] == file_format
+
+
+@pytest.mark.parametrize("file_format", ["ascii", "binary64"])
+def test_frame_sums_match_solution(tmp_path, file_format):
+    """frame_sums agrees with the sums of Solution.q used by check_frame."""
+    solution = pytest.importorskip("clawpack.pyclaw.solution")
+    patches = make_patches(2)
+    write_frame(tmp_path, patches, file_format=file_format)
+
+    sol = solution.Solution(1, path=str(tmp_path))
+    sums = frame_stream.frame_sums(1, [0, 1], path=tmp_path)
+
+    np.testing.assert_allclose(sums, [sol.q[i, ...].sum() for i in [0, 1]],
+                               rtol=1e-14)
@@ -0,0 +1,123 @@
+"""Tests for the scheduling and bookkeeping of make_all."""
+
+import json
+import os
+import shutil
+
+import pytest
+
+# make_all requires CLAW to be set when it is imported:
+os.environ.setdefault('CLAW', os.path.dirname(os.path.abspath(__file__)))
+
+from clawpack.clawutil import make_all
+
+
+needs_make = pytest.mark.skipif(shutil.which('make') is None,
+                                reason="make is not available")
+
+
+def test_example_dependencies():
+    dir_list = ['/ex/a/sub', '/ex/a', '/ex/ab', '/ex/b/c/d', '/ex/b']
+    deps = make_all.example_dependencies(dir_list)
+    assert deps == {'/ex/a/sub': set(),
+                    '/ex/a': {'/ex/a/sub'},
+                    '/ex/ab': set(),
+                    '/ex/b/c/d': set(),
+                    '/ex/b': {'/ex/b/c/d'}}
+
+
+def test_example_dependencies_of_listed_examples(tmp_path):
+    for d in ['radial/1drad', 'radial', 'radial_2', 'other']:
+        (tmp_path / d).mkdir(parents=True, exist_ok=True)
+        (tmp_path / d / 'setrun.py').touch()
+    dir_list = make_all.list_examples(str(tmp_path))
+    deps = make_all.example_dependencies(dir_list)
+    radial = str(tmp_path / 'radial')
+    assert deps[radial] == {str(tmp_path / 'radial' / '1drad')}
+    assert [d for d in dir_list if deps[d]] == [radial]
+    # examples are listed after the examples they depend on:
+    for d in dir_list:
+        assert all(dir_list.index(dep) < dir_list.index(d) for dep in deps[d])
+
+
+@needs_make
+def test_make_all_writes_only_summary_by_default(tmp_path, monkeypatch):
+    example = tmp_path / 'examples' / 'a'
+    example.mkdir(parents=True)
+    (example / 'setrun.py').touch()
+    (example / 'Makefile').write_text('.exe:\n\t@echo made exe\n'
+                                      'all:\n\t@echo made all\n'
+                                      'clean:\n\t@echo cleaned\n')
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    monkeypatch.chdir(run_dir)
+
+    goodlist, badlist = make_all.make_all(str(tmp_path / 'examples'),
+                                          yes=True, make_clean_first=True)
+    assert (goodlist, badlist) == ([str(example)], [])
+    assert sorted(os.listdir(run_dir)) == ['make_all_errors.txt',
+                                           'make_all_output.txt']
+    output = (run_dir / 'make_all_output.txt').read_text()
+    assert 'cleaned' in output and 'made all' in output
+
+    make_all.make_all(str(tmp_path / 'examples'), yes=True,
+                      make_clean_first=True, log_dir='logs', report='report')
+    with open(run_dir / 'report.json') as f:
+        records = json.load(f)
+    assert sorted(records[0]['targets']) == ['.exe', 'all', 'clean']
+    assert sorted(os.listdir(run_dir / 'logs')) == ['a_errors.txt',
+                                                    'a_output.txt']
+
+    with pytest.raises(ValueError):
+        make_all.make_all(str(tmp_path / 'examples'), yes=True,
+                          incremental=True)
+
+
+def make_example(directory, library):
+    """Example whose Makefile lists a library source, as Makefile.common."""
+    directory.mkdir(parents=True)
+    (directory / 'setrun.py').write_text('num_cells = 50\n')
+    (directory / 'Makefile').write_text('list_sources:\n'
+                                        '\t@echo %s\n' % library)
+    return str(directory)
+
+
+@needs_make
+def test_example_hash(tmp_path):
+    library = tmp_path / 'lib' / 'step1.f90'
+    library.parent.mkdir()
+    library.write_text('! step1\n')
+    example = make_example(tmp_path / 'example', library)
+    env = {'PATH': os.environ.get('PATH', os.defpath)}
+
+    h = make_all.example_hash(example, env=env)
+    assert h is not None
+    assert make_all.example_hash(example, env=env) == h
+
+    # outputs of the example and of make_all are not inputs:
+    os.mkdir(os.path.join(example, '_output'))
+    with open(os.path.join(example, '_output', 'fort.q0000'), 'w') as f:
+        f.write('output\n')
+    for fname in make_all._own_files:
+        with open(os.path.join(example, fname), 'w') as f:
+            f.write('log\n')
+    with open(os.path.join(example, 'claw.data'), 'w') as f:
+        f.write('data\n')
+    assert make_all.example_hash(example, env=env) == h
+
+    # sources, library sources and compiler settings are:
+    assert make_all.example_hash(example, env=dict(env, FFLAGS='-O3')) != h
+    library.write_text('! step1, modified\n')
+    h_library = make_all.example_hash(example, env=env)
+    assert h_library != h
+    with open(os.path.join(example, 'setrun.py'), 'a') as f:
+        f.write('order = 2\n')
+    assert make_all.example_hash(example, env=env) not in (h, h_library)
+
+
+@needs_make
+def test_example_hash_without_list_sources(tmp_path):
+    example = tmp_path / 'example'
+    example.mkdir()
+    (example / 'Makefile').write_text('all:\n\t@echo all\n')
+    assert make_all.example_hash(str(example)) is None
@@ -0,0 +1,175 @@
+"""Tests for run_many_cases_pool and its helpers in multip_tools."""
+
+import os
+import time
+
+import pytest
+
+from clawpack.clawutil import multip_tools
+
+
+# Functions run in the worker processes must be importable, so they are
+# defined at module level.
+
+def run_ok(case):
+    time.sleep(case.get('sleep', 0))
+    return case['num']
+
+
+def fail_once(case):
+    """Fail the first time a case is run, succeed afterwards."""
+    if not os.path.exists(case['marker']):
+        open(case['marker'], 'w').close()
+        raise RuntimeError('first attempt of %s' % case['case_name'])
+    return case['num']
+
+
+def run_or_fail(case):
+    if case.get('fail'):
+        raise ValueError('case %s failed' % case['case_name'])
+    return case['num']
+
+
+def run_or_exit(case):
+    """Kill the worker process for the case with case['exit'] set."""
+    time.sleep(case.get('sleep', 0))
+    if case.get('exit'):
+        os._exit(1)
+    return case['num']
+
+
+def make_cases(num, tmp_path=None, **entries):
+    cases = []
+    for num in range(num):
+        case = {'num': num, 'case_name': 'case%i' % num}
+        if tmp_path is not None:
+            case['marker'] = str(tmp_path / ('case%i.marker' % num))
+        case.update(entries)
+        cases.append(case)
+    return cases
+
+
+def test_order_by_cost():
+    cases = [{'n': 1}, {'n': 3}, {}, {'n': 2}, {'n': 3}]
+    ordered = multip_tools.order_by_cost(cases, 'n')
+    # unknown cost first, then by decreasing cost keeping ties in order:
+    assert ordered == [{}, {'n': 3}, {'n': 3}, {'n': 2}, {'n': 1}]
+    assert ordered[1] is cases[1]
+    assert multip_tools.order_by_cost(cases, lambda case: -case.get('n', 0)) \
+        == [{}, {'n': 1}, {'n': 2}, {'n': 3}, {'n': 3}]
+    assert multip_tools.order_by_cost(cases) == cases
+
+
+def test_run_many_cases_pool():
+    cases = make_cases(5)
+    for case in cases:
+        case['sleep'] = 0.01 * case['num']
+    results = multip_tools.run_many_cases_pool(cases, 2, run_ok,
+                                               abort_time=0, cost='sleep')
+    # results are in the order of caselist, not the order run:
+    assert [r['result'] for r in results] == [0, 1, 2, 3, 4]
+    assert [r['status'] for r in results] == ['ok'] * 5
+    assert [r['attempts'] for r in results] == [1] * 5
+    assert [r['case_name'] for r in results] == [c['case_name'] for c in cases]
+
+
+def test_failed_case_does_not_stop_others():
+    cases = make_cases(4)
+    cases[1]['fail'] = True
+    results = multip_tools.run_many_cases_pool(cases, 2, run_or_fail,
+                                               abort_time=0)
+    assert [r['status'] for r in results] == ['ok', 'failed', 'ok', 'ok']
+    assert 'case case1 failed' in results[1]['traceback']
+    assert results[1]['result'] is None
+
+
+@pytest.mark.parametrize('retries', [0, 1])
+def test_retries(tmp_path, retries):
+    cases = make_cases(3, tmp_path)
+    results = multip_tools.run_many_cases_pool(cases, 2, fail_once,
+                                               abort_time=0, retries=retries)
+    expected = 'ok' if retries else 'failed'
+    assert [r['status'] for r in results] == [expected] * 3
+    assert [r['attempts'] for r in results] == [1 + retries] * 3
+
+
+@pytest.mark.parametrize('retries', [0, 2])
+def test_broken_pool(retries):
+    """Only the case killing its worker process uses up its attempts."""
+    cases = make_cases(4, sleep=0.2)
+    cases[1].update(exit=True, sleep=0.05)
+    results = multip_tools.run_many_cases_pool(cases, 3, run_or_exit,
+                                               abort_time=0, retries=retries)
+    assert [r['status'] for r in results] == ['ok', 'failed', 'ok', 'ok']
+    assert [r['result'] for r in results] == [0, None, 2, 3]
+    assert results[1]['attempts'] == 1 + retries
+    assert [results[k]['attempts'] for k in [0, 2, 3]] == [1, 1, 1]
+    assert 'BrokenProcessPool' in results[1]['traceback']
+
+
+def test_case_ledger(tmp_path):
+    fname = str(tmp_path / 'sweep_ledger.db')
+    case = {'case_name': 'a', 'outdir': '_output_a', 'mx': 10}
+    ledger = multip_tools.CaseLedger(fname)
+    assert ledger.state(case) is None
+    ledger.started(case)
+    assert ledger.state(case) == 'started'
+    result = {'status': 'failed', 'pid': 1, 'start': 1., 'end': 2.,
+              'traceback': 'ValueError'}
+    ledger.finished(case, result)
+    ledger.close()
+
+    ledger = multip_tools.CaseLedger(fname)
+    entry = ledger.entry(case)
+    assert entry['state'] == 'failed'
+    assert entry['attempts'] == 1
+    assert entry['traceback'] == 'ValueError'
+    assert entry['case_name'] == 'a'
+    ledger.started(case)
+    ledger.finished(case, dict(result, status='ok', traceback=None))
+    assert ledger.state(case) == 'completed'
+    assert ledger.entry(case)['attempts'] == 2
+    # the executable built for the case does not change its identity:
+    assert ledger.state(dict(case, xclawcmd='/tmp/xclaw')) == 'completed'
+    assert ledger.state(dict(case, mx=20)) is None
+    ledger.close()
+
+
+def test_ledger_skips_completed_cases(tmp_path):
+    fname = str(tmp_path / 'sweep_ledger.db')
+    cases = make_cases(3, tmp_path)
+    results = multip_tools.run_many_cases_pool(cases, 2, fail_once,
+                                               abort_time=0, ledger=fname)
+    assert [r['status'] for r in results] == ['failed'] * 3
+
+    # the failed cases are run again, and succeed this time:
+    results = multip_tools.run_many_cases_pool(cases, 2, fail_once,
+                                               abort_time=0, ledger=fname)
+    assert [r['status'] for r in results] == ['ok'] * 3
+
+    results = multip_tools.run_many_cases_pool(cases, 2, fail_once,
+                                               abort_time=0, ledger=fname)
+    assert [r['status'] for r in results] == ['skipped'] * 3
+    assert [r['attempts'] for r in results] == [2] * 3
+
+
+def test_only_failed(tmp_path):
+    ledger = multip_tools.CaseLedger(str(tmp_path / 'sweep_ledger.db'))
+    cases = make_cases(3, tmp_path)
+    cases[1]['fail'] = True
+    results = multip_tools.run_many_cases_pool(cases, 2, run_or_fail,
+                                               abort_time=0, ledger=ledger)
+    assert [r['status'] for r in results] == ['ok', 'failed', 'ok']
+
+    # a new case has not failed before, so it is not run either:
+    new_case = make_cases(4)[3]
+    results = multip_tools.run_many_cases_pool(cases + [new_case], 2,
+                                               run_or_fail, abort_time=0,
+                                               ledger=ledger,
+                                               only_failed=True)
+    assert [r['status'] for r in results] \
+        == ['skipped', 'failed', 'skipped', 'skipped']
+    assert results[1]['attempts'] == 1
+    assert ledger.entry(cases[1])['attempts'] == 2
+    assert ledger.state(new_case) is None
+    ledger.close()
@@ -0,0 +1,115 @@
+"""Tests for clawpack.clawutil.regression_store."""
+
+import numpy as np
+import pytest
+
+from clawpack.clawutil.regression_store import (RegressionStore,
+                                                DEFAULT_VERSION)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return tmp_path / "regression_data" / "test.npz"
+
+
+def test_save_and_load(store_path):
+    sums = np.array([1.5, -2.25])
+    with RegressionStore(store_path, version=DEFAULT_VERSION) as store:
+        store.save({"frame0001": sums})
+
+    with RegressionStore(store_path, version=DEFAULT_VERSION) as store:
+        np.testing.assert_array_equal(store.load("frame0001"), sums)
+        assert store.names() == ["frame0001"]
+        assert store.versions() == [DEFAULT_VERSION]
+        with pytest.raises(KeyError):
+            store.load("frame0002")
+
+
+def test_missing_store(store_path):
+    store = RegressionStore(store_path)
+    assert store.versions() == []
+    assert store.names() == []
+    assert store.metadata() == {}
+    with pytest.raises(KeyError):
+        store.load("frame0001")
+
+
+def test_version_from_environment(store_path, monkeypatch):
+    monkeypatch.setenv("CLAW_REGRESSION_VERSION", "ifort")
+    assert RegressionStore(store_path).version == "ifort"
+    monkeypatch.delenv("CLAW_REGRESSION_VERSION")
+    assert RegressionStore(store_path).version == DEFAULT_VERSION
+
+
+def test_versions_and_fallback(store_path):
+    with RegressionStore(store_path) as store:
+        store.save({"frame0001": [1.], "frame0002": [2.]},
+                   version=DEFAULT_VERSION)
+        store.save({"frame0001": [10.]}, version="gfortran-O3",
+                   metadata={"FFLAGS": "-O3"})
+
+    with RegressionStore(store_path, version="gfortran-O3") as store:
+        assert store.versions() == [DEFAULT_VERSION, "gfortran-O3"]
+        assert store.names() == ["frame0001"]
+        np.testing.assert_array_equal(store.load("frame0001"), [10.])
+        np.testing.assert_array_equal(store.load("frame0001",
+                                                 version=DEFAULT_VERSION),
+                                      [1.])
+        # entries missing from a version are taken from "default"
+        np.testing.assert_array_equal(store.load("frame0002"), [2.])
+        with pytest.raises(KeyError):
+            store.load("frame0002", fallback=False)
+        assert store.metadata()["FFLAGS"] == "-O3"
+        assert "updated" in store.metadata()
+        assert "FFLAGS" not in store.metadata(DEFAULT_VERSION)
+
+
+def test_save_keeps_other_entries(store_path):
+    with RegressionStore(store_path) as store:
+        store.save({"frame0001": [1.], "frame0002": [2.]})
+        store.save({"frame0002": [3.]}, metadata={"note": "update"})
+        np.testing.assert_array_equal(store.load("frame0001"), [1.])
+        np.testing.assert_array_equal(store.load("frame0002"), [3.])
+        store.save({"frame0003": [4.]})
+        assert store.names() == ["frame0001", "frame0002", "frame0003"]
+        # metadata of earlier saves of the version is kept
+        assert store.metadata()["note"] == "update"
+    assert list(store_path.parent.glob("*.tmp")) == []
+
+
+def test_groups(store_path):
+    t = np.linspace(0., 1., 5)
+    q = np.arange(10.).reshape(2, 5)
+    with RegressionStore(store_path) as store:
+        store.save({"gauge00001": {"t": t, "q": q}})
+        assert store.names() == ["gauge00001", "gauge00001/q",
+                                 "gauge00001/t"]
+        gauge = store.load("gauge00001")
+        assert sorted(gauge) == ["q", "t"]
+        np.testing.assert_array_equal(gauge["t"], t)
+        np.testing.assert_array_equal(gauge["q"], q)
+        np.testing.assert_array_equal(store.load("gauge00001/q"), q)
+
+        # saving a group replaces all of its entries
+        store.save({"gauge00001": {"t": t}})
+        assert sorted(store.load("gauge00001")) == ["t"]
+
+
+def test_plain_npz_fallback(tmp_path):
+    path = tmp_path / "legacy.npz"
+    np.savez(path, frame0001=np.array([1., 2.]), frame0002=np.array([3.]))
+
+    with RegressionStore(path, version="gfortran-O3") as store:
+        assert store.versions() == [DEFAULT_VERSION]
+        assert store.names(DEFAULT_VERSION) == ["frame0001", "frame0002"]
+        assert store.metadata() == {}
+        np.testing.assert_array_equal(store.load("frame0001"), [1., 2.])
+
+        # saving converts the file to a store, keeping the old entries
+        store.save({"frame0001": [5., 6.]})
+        assert store.versions() == [DEFAULT_VERSION, "gfortran-O3"]
+        np.testing.assert_array_equal(store.load("frame0001"), [5., 6.])
+        np.testing.assert_array_equal(store.load("frame0002"), [3.])
+        np.testing.assert_array_equal(store.load("frame0001",
+                                                 version=DEFAULT_VERSION),
+                                      [1., 2.])